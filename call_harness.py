@@ -0,0 +1,441 @@
+"""Headless end-to-end call test harness with synthetic media.
+
+Starts the real Streamlit app against a local signaling stand-in, opens an
+agent and a customer in headless Chromium with fake camera/microphone devices
+fed from generated Y4M/WAV fixtures, and measures each call: time to connect,
+sustained receive bitrate, frame drops, packet loss and recording size. Each
+network profile is applied to the loopback interface with tc/netem (root
+only; otherwise only the 'baseline' profile runs). Results are written as JSON
+baselines and compared against the previous run. Fixtures and baselines live
+under .harness/ (or $KYC_HARNESS_DIR), outside version control.
+
+Requires: pip install playwright websockets && playwright install chromium
+
+Usage:
+    python call_harness.py --profiles baseline lossy_3g --duration 20
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import re
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import wave
+
+import websockets
+from playwright.async_api import async_playwright
+
+import metrics
+from signaling_admission import WHEEL_TICK, AdmissionController
+from signaling_protocol import ProtocolError, decode_message, encode_message, negotiate_encoding
+
+# Generated media (hundreds of MB) and local baselines; gitignored
+HARNESS_DIR = os.environ.get('KYC_HARNESS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.harness'))
+FIXTURE_DIR = os.path.join(HARNESS_DIR, 'fixtures')
+BASELINE_DIR = os.path.join(HARNESS_DIR, 'baselines')
+REGRESSION_TOLERANCE = 0.15  # Flag metrics that get more than 15% worse
+
+# netem settings applied to loopback; both browsers talk over lo
+NETWORK_PROFILES = {
+    'baseline': None,
+    'broadband': {'delay': '20ms', 'jitter': '5ms', 'loss': '0%', 'rate': '20mbit'},
+    'lte': {'delay': '50ms', 'jitter': '15ms', 'loss': '0.5%', 'rate': '5mbit'},
+    'lossy_3g': {'delay': '150ms', 'jitter': '40ms', 'loss': '3%', 'rate': '1mbit'},
+    'congested': {'delay': '80ms', 'jitter': '30ms', 'loss': '1%', 'rate': '600kbit'},
+}
+
+# Lower is better for these; everything else is higher-is-better
+LOWER_IS_BETTER = {'time_to_connect_ms', 'frames_dropped', 'packets_lost', 'freeze_count'}
+
+RELAY_SECONDS = metrics.histogram('kyc_signaling_relay_seconds', 'Time from frame receipt to fan-out complete')
+CONNECTION_FAILURES = metrics.counter('kyc_signaling_connection_failures_total',
+                                      'Signaling frames refused or connections dropped, by cause', ('cause',))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def write_y4m_fixture(path, width=1280, height=720, fps=30, seconds=10):
+    """Moving gradient with a bouncing block, so the encoder has real motion and detail"""
+    with open(path, 'wb') as f:
+        f.write(f'YUV4MPEG2 W{width} H{height} F{fps}:1 Ip A1:1 C420jpeg\n'.encode())
+        chroma = bytes([128]) * (width // 2 * height // 2)
+        for n in range(fps * seconds):
+            row = bytes((x + n * 4) % 256 for x in range(width))
+            luma = bytearray(row * height)
+            bx = int((math.sin(n / 15) + 1) / 2 * (width - 200))
+            by = int((math.cos(n / 20) + 1) / 2 * (height - 200))
+            for y in range(by, by + 200):
+                luma[y * width + bx:y * width + bx + 200] = bytes([235]) * 200
+            f.write(b'FRAME\n')
+            f.write(luma)
+            f.write(chroma)
+            f.write(chroma)
+
+
+def write_wav_fixture(path, seconds=10, rate=48000):
+    """Speech-band tone bursts with pauses, so DTX and gain normalization are exercised"""
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        frames = bytearray()
+        for i in range(rate * seconds):
+            t = i / rate
+            envelope = 1.0 if int(t * 2) % 3 else 0.0
+            sample = envelope * 0.3 * (math.sin(2 * math.pi * 220 * t) + 0.5 * math.sin(2 * math.pi * 880 * t))
+            frames += struct.pack('<h', int(sample * 32767 / 1.5))
+        wav.writeframes(bytes(frames))
+
+
+def ensure_fixtures():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    video = os.path.join(FIXTURE_DIR, 'synthetic_720p.y4m')
+    audio = os.path.join(FIXTURE_DIR, 'synthetic_speech.wav')
+    if not os.path.exists(video):
+        write_y4m_fixture(video)
+    if not os.path.exists(audio):
+        write_wav_fixture(audio)
+    return os.path.abspath(video), os.path.abspath(audio)
+
+
+class SignalingStandIn:
+    """Local relay: validates and admits every frame, then forwards it to the other peers in the room"""
+
+    def __init__(self):
+        self.admission = AdmissionController()
+        self.peers = {}  # room code -> connections
+        self.encodings = {}  # connection -> wire encoding negotiated at join
+        self.rejected = 0
+        self.relayed = 0
+        self.expired = 0
+        metrics.REGISTRY.add_collector('kyc_signaling_admission', self.admission.metrics)
+
+    def _part(self, room, connection):
+        peers = self.peers.get(room)
+        if peers is not None:
+            peers.discard(connection)
+            if not peers:
+                del self.peers[room]
+
+    async def sweep(self, interval=WHEEL_TICK):
+        """Expire idle rooms until cancelled; run as a task alongside the server"""
+        while True:
+            await asyncio.sleep(interval)
+            for room in self.admission.expire_idle():
+                self.peers.pop(room, None)
+                self.expired += 1
+
+    def _frame_for(self, peer, message, frame, encoding):
+        """The frame in the encoding the peer negotiated; forwarded untouched when it matches"""
+        peer_encoding = self.encodings.get(peer, 'json')
+        return frame if peer_encoding == encoding else encode_message(message, peer_encoding)
+
+    @staticmethod
+    def _held_frame_for(frame, encoding):
+        # Held frames keep their sender's encoding: text frames are JSON, binary ones compact
+        held_encoding = 'json' if isinstance(frame, str) else 'cbor-zdict'
+        if held_encoding == encoding:
+            return frame
+        return encode_message(decode_message(frame, held_encoding), encoding)
+
+    async def _send(self, peer, frame):
+        try:
+            await peer.send(frame)
+            return True
+        except websockets.ConnectionClosed:
+            # The peer's own handler cleans up; this sender carries on
+            return False
+
+    async def handle(self, connection):
+        connection_id = id(connection)
+        self.admission.connect(connection_id)
+        joined = None
+        encoding = 'json'  # Every client joins in JSON; its join picks the encoding for the rest
+        try:
+            async for frame in connection:
+                received = time.perf_counter()
+                try:
+                    message = decode_message(frame, encoding)
+                except (ProtocolError, TypeError, RecursionError):
+                    # decode_message() should only raise ProtocolError, but no single frame may end the handler
+                    self.rejected += 1
+                    CONNECTION_FAILURES.labels('malformed').inc()
+                    continue
+
+                verdict = self.admission.admit(connection_id, message)
+                if not verdict.allowed:
+                    self.rejected += 1
+                    CONNECTION_FAILURES.labels(verdict.reason).inc()
+                    if verdict.disconnect:
+                        await connection.close()
+                        return
+                    continue
+
+                room = message['room']
+                if message['type'] == 'join':
+                    if joined is not None and joined != room:
+                        self._part(joined, connection)
+                    joined = room
+                    self.peers.setdefault(room, set()).add(connection)
+                    encoding = self.encodings[connection] = negotiate_encoding(message)
+                    for held in self.admission.release_held(room):
+                        await connection.send(self._held_frame_for(held, encoding))
+                    continue
+                if message['type'] == 'leave':
+                    self._part(room, connection)
+                    joined = None
+                    continue
+
+                others = [peer for peer in self.peers.get(room, ()) if peer is not connection]
+                if not others:
+                    self.admission.hold(room, message['type'], frame)
+                for peer in others:
+                    if await self._send(peer, self._frame_for(peer, message, frame, encoding)):
+                        self.relayed += 1
+                RELAY_SECONDS.observe(time.perf_counter() - received)
+        except websockets.ConnectionClosedError:
+            CONNECTION_FAILURES.labels('closed-abnormally').inc()
+        finally:
+            self.admission.disconnect(connection_id)
+            self.encodings.pop(connection, None)
+            if joined is not None:
+                self._part(joined, connection)
+
+
+@contextlib.contextmanager
+def network_profile(name):
+    """Apply a netem profile to loopback for the duration of the block"""
+    settings = NETWORK_PROFILES[name]
+    if settings is None:
+        yield
+        return
+    command = ['tc', 'qdisc', 'add', 'dev', 'lo', 'root', 'netem',
+               'delay', settings['delay'], settings['jitter'], 'loss', settings['loss'], 'rate', settings['rate']]
+    subprocess.run(command, check=True)
+    try:
+        yield
+    finally:
+        subprocess.run(['tc', 'qdisc', 'del', 'dev', 'lo', 'root'], check=False)
+
+
+def can_shape_network():
+    return shutil.which('tc') is not None and hasattr(os, 'geteuid') and os.geteuid() == 0
+
+
+@contextlib.contextmanager
+def streamlit_app(signaling_url):
+    """Run the app on a free port with signaling pointed at the stand-in"""
+    port = free_port()
+    env = {**os.environ, 'KYC_SIGNALING_SERVER': signaling_url}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', 'video_call_app.py',
+         '--server.headless', 'true', '--server.port', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urllib.request.urlopen(f'{url}/_stcore/health', timeout=1)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('Streamlit app did not start')
+                time.sleep(0.3)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+async def call_frame(page):
+    """Find the components iframe that hosts the call page"""
+    for _ in range(100):
+        for frame in page.frames:
+            if await frame.query_selector('#startBtn'):
+                return frame
+        await asyncio.sleep(0.2)
+    raise RuntimeError('Call page did not render')
+
+
+INBOUND_STATS = """async () => {
+    const stats = await peerConnection.getStats();
+    let video = null, audio = null;
+    stats.forEach(r => {
+        if (r.type === 'inbound-rtp' && r.kind === 'video') video = r;
+        if (r.type === 'inbound-rtp' && r.kind === 'audio') audio = r;
+    });
+    return {
+        timestamp: performance.now(),
+        videoBytes: video ? video.bytesReceived : 0,
+        audioBytes: audio ? audio.bytesReceived : 0,
+        framesReceived: video ? video.framesReceived || 0 : 0,
+        framesDecoded: video ? video.framesDecoded || 0 : 0,
+        framesDropped: video ? video.framesDropped || 0 : 0,
+        packetsLost: video ? video.packetsLost || 0 : 0,
+        freezeCount: video ? video.freezeCount || 0 : 0,
+        width: video ? video.frameWidth || 0 : 0,
+        height: video ? video.frameHeight || 0 : 0
+    };
+}"""
+
+
+async def run_call(browser, app_url, duration, record_seconds):
+    """Connect an agent and a customer, then measure the agent's view of the customer"""
+    agent_context = await browser.new_context(permissions=['camera', 'microphone'], accept_downloads=True)
+    customer_context = await browser.new_context(permissions=['camera', 'microphone'])
+    try:
+        agent = await agent_context.new_page()
+        await agent.goto(app_url)
+        await agent.get_by_role('button', name=re.compile('Start KYC Session')).click()
+        await agent.get_by_text(re.compile('Share this room code')).wait_for()
+        room_code = re.search(r'Share this room code with customer: (\w{4})',
+                              await agent.inner_text('body')).group(1)
+
+        customer = await customer_context.new_page()
+        await customer.goto(app_url)
+        await customer.get_by_placeholder('e.g., A1B2').fill(room_code)
+        await customer.get_by_role('button', name=re.compile('Join Session')).click()
+
+        agent_frame = await call_frame(agent)
+        customer_frame = await call_frame(customer)
+        await agent_frame.click('#startBtn')
+        await agent_frame.wait_for_function('peerConnection !== null')
+
+        started = time.perf_counter()
+        await customer_frame.click('#startBtn')
+        await agent_frame.wait_for_function(
+            "peerConnection && peerConnection.connectionState === 'connected'", timeout=60000
+        )
+        time_to_connect = (time.perf_counter() - started) * 1000
+
+        # Let bandwidth estimation settle before the sustained window
+        await asyncio.sleep(3)
+        first = await agent_frame.evaluate(INBOUND_STATS)
+        await asyncio.sleep(duration)
+        last = await agent_frame.evaluate(INBOUND_STATS)
+        seconds = (last['timestamp'] - first['timestamp']) / 1000
+
+        recording_bytes = 0
+        if record_seconds:
+            await agent_frame.click('#recordBtn')
+            await asyncio.sleep(record_seconds)
+            async with agent.expect_download(timeout=30000) as download_info:
+                await agent_frame.click('#recordBtn')
+            download = await download_info.value
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, download.suggested_filename)
+                await download.save_as(path)
+                recording_bytes = os.path.getsize(path)
+
+        return {
+            'time_to_connect_ms': round(time_to_connect, 1),
+            'video_kbps': round((last['videoBytes'] - first['videoBytes']) * 8 / seconds / 1000, 1),
+            'audio_kbps': round((last['audioBytes'] - first['audioBytes']) * 8 / seconds / 1000, 1),
+            'fps': round((last['framesDecoded'] - first['framesDecoded']) / seconds, 1),
+            'frames_dropped': last['framesDropped'] - first['framesDropped'],
+            'packets_lost': last['packetsLost'] - first['packetsLost'],
+            'freeze_count': last['freezeCount'] - first['freezeCount'],
+            'resolution': f"{last['width']}x{last['height']}",
+            'recording_bytes_per_second': round(recording_bytes / record_seconds) if record_seconds else None,
+        }
+    finally:
+        await agent_context.close()
+        await customer_context.close()
+
+
+def compare_to_baseline(profile, result):
+    """Return the metrics that regressed against the stored baseline"""
+    path = os.path.join(BASELINE_DIR, f'{profile}.json')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        baseline = json.load(f)['metrics']
+
+    regressions = []
+    for metric, value in result.items():
+        previous = baseline.get(metric)
+        if not isinstance(value, (int, float)) or not isinstance(previous, (int, float)) or previous == 0:
+            continue
+        change = (value - previous) / abs(previous)
+        worse = change > REGRESSION_TOLERANCE if metric in LOWER_IS_BETTER else change < -REGRESSION_TOLERANCE
+        if worse:
+            regressions.append({'metric': metric, 'baseline': previous, 'current': value})
+    return regressions
+
+
+async def run_matrix(profiles, duration, record_seconds, update_baselines):
+    video_fixture, audio_fixture = ensure_fixtures()
+    relay = SignalingStandIn()
+    signaling_port = free_port()
+    report = {'profiles': {}}
+
+    sweeper = asyncio.create_task(relay.sweep())
+    try:
+        async with websockets.serve(relay.handle, '127.0.0.1', signaling_port):
+            with streamlit_app(f'ws://127.0.0.1:{signaling_port}') as app_url:
+                async with async_playwright() as playwright:
+                    browser = await playwright.chromium.launch(args=[
+                        '--use-fake-ui-for-media-stream',
+                        '--use-fake-device-for-media-stream',
+                        f'--use-file-for-fake-video-capture={video_fixture}',
+                        f'--use-file-for-fake-audio-capture={audio_fixture}',
+                        '--autoplay-policy=no-user-gesture-required',
+                    ])
+                    try:
+                        for profile in profiles:
+                            if NETWORK_PROFILES[profile] is not None and not can_shape_network():
+                                report['profiles'][profile] = {'skipped': 'network shaping needs root and tc'}
+                                continue
+                            with network_profile(profile):
+                                call_metrics = await run_call(browser, app_url, duration, record_seconds)
+                            report['profiles'][profile] = {'metrics': call_metrics,
+                                                           'regressions': compare_to_baseline(profile, call_metrics)}
+                            if update_baselines:
+                                os.makedirs(BASELINE_DIR, exist_ok=True)
+                                with open(os.path.join(BASELINE_DIR, f'{profile}.json'), 'w') as f:
+                                    json.dump({'profile': profile, 'settings': NETWORK_PROFILES[profile],
+                                               'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                               'metrics': call_metrics}, f, indent=2)
+                    finally:
+                        await browser.close()
+    finally:
+        sweeper.cancel()
+
+    report['relay'] = {'relayed_frames': relay.relayed, 'rejected_frames': relay.rejected,
+                       'expired_rooms': relay.expired, 'admission': relay.admission.metrics()}
+    # Prometheus text from the relay, alongside (not inside) the per-profile results
+    report['exposition'] = metrics.REGISTRY.exposition()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless KYC calls across network profiles")
+    parser.add_argument('--profiles', nargs='+', choices=sorted(NETWORK_PROFILES), default=sorted(NETWORK_PROFILES))
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds of sustained measurement per call")
+    parser.add_argument('--record-seconds', type=float, default=10.0, help="Recording length; 0 to skip")
+    parser.add_argument('--update-baselines', action='store_true', help="Store these results as the new baselines")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_matrix(args.profiles, args.duration, args.record_seconds, args.update_baselines))
+    print(json.dumps(report, indent=2))
+    if any(entry.get('regressions') for entry in report['profiles'].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
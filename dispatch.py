@@ -0,0 +1,255 @@
+"""Virtual waiting queue and agent dispatch for KYC sessions.
+
+Customers wait in heaps grouped by the skills they need (e.g. a language or
+business accounts). A customer's heap key is their arrival time minus a credit
+per priority level, so urgent customers jump ahead but anyone who has waited
+long enough is served eventually. Idle agents wait in heaps grouped by skill
+set, keyed by how long they have been idle, so work is spread fairly. Matching
+only looks at the head of each group, so enqueue, dispatch and completion are
+O(g log n) with g the small number of distinct skill groups.
+
+Each assignment gets a fresh room code from generate_room_code, ready for the
+agent and customer to join.
+
+Usage:
+    python dispatch.py --arrival-rate 5 --agents 40 --service-time 420
+"""
+import argparse
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from rooms import generate_room_code
+
+PRIORITY_CREDIT_SECONDS = 120  # Each priority level counts as waiting this much longer
+WAIT_SAMPLE_SIZE = 10000       # Recent waits kept for percentile metrics
+
+
+@dataclass
+class Assignment:
+    customer_id: str
+    agent_id: str
+    room_code: str
+    waited: float
+
+
+class Dispatcher:
+    """Matches waiting customers to available agents"""
+
+    def __init__(self, clock=time.monotonic, room_code_factory=generate_room_code):
+        self._clock = clock
+        self._room_code_factory = room_code_factory
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+        self._waiting = {}        # skill group -> heap of (key, seq, customer_id)
+        self._customers = {}      # customer_id -> (skills, arrived_at, seq of its live heap entry)
+        self._idle = {}           # agent skill set -> heap of (idle_since, seq, agent_id)
+        self._agents = {}         # agent_id -> skill set
+        self._idle_agents = {}    # agent_id -> seq of its live idle-heap entry
+        self._rooms = {}          # room_code -> (agent_id, customer_id)
+        self._busy = {}           # agent_id -> room_code of the session it is in
+
+        self._waits = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self.assigned_total = 0
+        self.abandoned_total = 0
+
+    def _new_room_code(self):
+        # 4-character codes collide quickly at this scale, so retry against live rooms
+        while True:
+            room_code = self._room_code_factory()
+            if room_code not in self._rooms:
+                return room_code
+
+    def _assign(self, customer_id, agent_id, now):
+        skills, arrived_at, _ = self._customers.pop(customer_id)
+        self._idle_agents.pop(agent_id, None)
+        room_code = self._new_room_code()
+        self._rooms[room_code] = (agent_id, customer_id)
+        self._busy[agent_id] = room_code
+        waited = now - arrived_at
+        self._waits.append(waited)
+        self.assigned_total += 1
+        return Assignment(customer_id, agent_id, room_code, waited)
+
+    def _head(self, heap, generation):
+        # Lazy deletion: drop entries for customers/agents that have left, or
+        # re-registered since (possibly with other skills, so into another heap)
+        while heap and generation(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _customer_generation(self, customer_id):
+        waiting = self._customers.get(customer_id)
+        return waiting[2] if waiting else None
+
+    def _idle_agent_for(self, skills):
+        best_group, best = None, None
+        for agent_skills, heap in self._idle.items():
+            if skills <= agent_skills:
+                head = self._head(heap, self._idle_agents.get)
+                if head and (best is None or head < best):
+                    best_group, best = agent_skills, head
+        if best is None:
+            return None
+        heapq.heappop(self._idle[best_group])
+        return best[2]
+
+    def _customer_for(self, agent_skills):
+        best_group, best = None, None
+        for skills, heap in self._waiting.items():
+            if skills <= agent_skills:
+                head = self._head(heap, self._customer_generation)
+                if head and (best is None or head < best):
+                    best_group, best = skills, head
+        if best is None:
+            return None
+        heapq.heappop(self._waiting[best_group])
+        return best[2]
+
+    def enqueue(self, customer_id, skills=(), priority=0):
+        """Add a customer; returns an Assignment if an agent was free"""
+        skills = frozenset(skills)
+        with self._lock:
+            now = self._clock()
+            seq = next(self._seq)
+            self._customers[customer_id] = (skills, now, seq)
+            agent_id = self._idle_agent_for(skills)
+            if agent_id is not None:
+                return self._assign(customer_id, agent_id, now)
+
+            key = now - priority * PRIORITY_CREDIT_SECONDS
+            heapq.heappush(self._waiting.setdefault(skills, []), (key, seq, customer_id))
+            return None
+
+    def abandon(self, customer_id):
+        """Remove a customer who left the queue"""
+        with self._lock:
+            if self._customers.pop(customer_id, None) is not None:
+                self.abandoned_total += 1
+
+    def agent_available(self, agent_id, skills=()):
+        """Mark an agent free; returns an Assignment if a customer was waiting"""
+        skills = frozenset(skills)
+        with self._lock:
+            if agent_id in self._busy:
+                raise ValueError(f"Agent {agent_id} is still in room {self._busy[agent_id]}; complete it first")
+            now = self._clock()
+            self._agents[agent_id] = skills
+            customer_id = self._customer_for(skills)
+            if customer_id is not None:
+                return self._assign(customer_id, agent_id, now)
+
+            seq = self._idle_agents[agent_id] = next(self._seq)
+            heapq.heappush(self._idle.setdefault(skills, []), (now, seq, agent_id))
+            return None
+
+    def agent_offline(self, agent_id):
+        """Stop dispatching to an agent"""
+        with self._lock:
+            self._idle_agents.pop(agent_id, None)
+            self._agents.pop(agent_id, None)
+
+    def complete(self, room_code):
+        """Close a session and hand the agent the next customer, if any.
+
+        Unknown or already completed rooms are ignored, so a repeated completion is harmless.
+        """
+        with self._lock:
+            session = self._rooms.pop(room_code, None)
+            if session is None:
+                return None
+            agent_id, _ = session
+            del self._busy[agent_id]
+            skills = self._agents.get(agent_id)
+        if skills is None:
+            return None
+        return self.agent_available(agent_id, skills)
+
+    @property
+    def queue_depth(self):
+        return len(self._customers)
+
+    def metrics(self):
+        """Queue depth, agent utilisation and wait-time statistics"""
+        with self._lock:
+            waits = sorted(self._waits)
+
+            def percentile(p):
+                return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else 0.0
+
+            return {
+                'queue_depth': len(self._customers),
+                'idle_agents': len(self._idle_agents),
+                'active_rooms': len(self._rooms),
+                'assigned_total': self.assigned_total,
+                'abandoned_total': self.abandoned_total,
+                'wait_mean': round(sum(waits) / len(waits), 3) if waits else 0.0,
+                'wait_p50': percentile(0.50),
+                'wait_p95': percentile(0.95),
+                'wait_max': round(waits[-1], 3) if waits else 0.0,
+            }
+
+
+def simulate(arrival_rate, agents, service_time, duration, skills=('en', 'hi'), priority_share=0.1, seed=0):
+    """Run a discrete-event simulation with Poisson arrivals; returns metrics and dispatch cost"""
+    rng = random.Random(seed)
+    now = [0.0]
+    dispatcher = Dispatcher(clock=lambda: now[0])
+    events = []  # (time, seq, kind, payload)
+    seq = itertools.count()
+
+    def started(assignment):
+        if assignment:
+            finish = now[0] + rng.expovariate(1 / service_time)
+            heapq.heappush(events, (finish, next(seq), 'complete', assignment.room_code))
+
+    for i in range(agents):
+        agent_skills = {'en'} | ({skills[i % len(skills)]} if i % 3 == 0 else set())
+        started(dispatcher.agent_available(f'agent-{i}', agent_skills))
+    heapq.heappush(events, (rng.expovariate(arrival_rate), next(seq), 'arrive', 0))
+
+    peak_depth = 0
+    operations = 0
+    cpu_started = time.perf_counter()
+    while events:
+        at, _, kind, payload = heapq.heappop(events)
+        if at > duration:
+            break
+        now[0] = at
+        operations += 1
+        if kind == 'arrive':
+            needs = {rng.choice(skills)} if rng.random() < 0.2 else set()
+            priority = 1 if rng.random() < priority_share else 0
+            started(dispatcher.enqueue(f'customer-{payload}', needs, priority))
+            heapq.heappush(events, (at + rng.expovariate(arrival_rate), next(seq), 'arrive', payload + 1))
+        else:
+            started(dispatcher.complete(payload))
+        peak_depth = max(peak_depth, dispatcher.queue_depth)
+    cpu_seconds = time.perf_counter() - cpu_started
+
+    result = dispatcher.metrics()
+    result['peak_queue_depth'] = peak_depth
+    result['operations'] = operations
+    result['us_per_operation'] = round(cpu_seconds / operations * 1e6, 2) if operations else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate customer arrivals against the KYC dispatcher")
+    parser.add_argument('--arrival-rate', type=float, default=5.0, help="Customers per second")
+    parser.add_argument('--agents', type=int, default=40)
+    parser.add_argument('--service-time', type=float, default=420.0, help="Mean session length in seconds")
+    parser.add_argument('--duration', type=float, default=3600.0, help="Simulated seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(simulate(args.arrival_rate, args.agents, args.service_time, args.duration, seed=args.seed)))
+
+
+if __name__ == "__main__":
+    main()
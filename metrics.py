@@ -0,0 +1,345 @@
+"""Low-overhead Prometheus-style metrics for the app and signaling tiers.
+
+Counters and histograms are sharded per thread: each thread updates its own
+cells without taking a lock, and a scrape sums the shards. The only lock is
+taken once per thread per metric, when its shard is created, and once more
+when the thread exits and its counts are folded into a retired total, so
+short-lived threads do not leave shards behind. Metrics are served in the
+Prometheus text format by start_http_server(), on localhost unless
+KYC_METRICS_HOST says otherwise.
+
+Usage:
+    python metrics.py   # per-call overhead of each metric type
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+METRICS_PORT = int(os.environ.get('KYC_METRICS_PORT', '9464'))
+METRICS_HOST = os.environ.get('KYC_METRICS_HOST', '127.0.0.1')
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+DURATION_BUCKETS = (30, 60, 120, 300, 600, 900, 1200, 1800, 3600)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _ShardOwner:
+    """Lives in a thread's local storage next to its cells; collected when the thread exits"""
+
+    __slots__ = ('__weakref__',)
+
+
+class _Sharded:
+    """Per-thread cells, registered on first use and retired when their thread exits"""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._retired = [0] * size
+        # Reentrant: a thread's shard can be retired by garbage collection while this lock is held
+        self._lock = threading.RLock()
+
+    def _new_shard(self):
+        cells = self._local.cells = [0] * self._size
+        owner = self._local.owner = _ShardOwner()
+        with self._lock:
+            self._shards.append(cells)
+        weakref.finalize(owner, self._retire, cells)
+        return cells
+
+    def _retire(self, cells):
+        with self._lock:
+            self._shards.remove(cells)
+            for i, value in enumerate(cells):
+                self._retired[i] += value
+
+    def _sum(self):
+        with self._lock:
+            shards = list(self._shards)
+            totals = list(self._retired)
+        return [totals[i] + sum(cells[i] for cells in shards) for i in range(self._size)]
+
+
+class _CounterChild(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        try:
+            self._local.cells[0] += amount
+        except AttributeError:
+            self._new_shard()[0] += amount
+
+    def value(self):
+        return self._sum()[0]
+
+
+class _GaugeChild:
+    # Gauges are set or moved rarely (room starts and ends), so a plain lock is fine
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def value(self):
+        return self._value
+
+
+class _HistogramChild(_Sharded):
+    def __init__(self, buckets):
+        # One cell per bucket, one for +Inf, then the running sum
+        super().__init__(len(buckets) + 2)
+        self._buckets = buckets
+
+    def observe(self, value):
+        try:
+            cells = self._local.cells
+        except AttributeError:
+            cells = self._new_shard()
+        cells[bisect_left(self._buckets, value)] += 1
+        cells[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def value(self):
+        totals = self._sum()
+        return totals[:-1], totals[-1]
+
+
+class _Timer:
+    __slots__ = ('_child', '_started')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+            self._bind(self._default)
+
+    def _bind(self, child):
+        # Unlabelled metrics call straight into their child, skipping one Python call on hot paths
+        pass
+
+    def labels(self, *values):
+        """Return the child for these label values; cache it at the call site on hot paths"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self._children.items()):
+            lines.extend(self._samples(_format_labels(self.labelnames, values), values, child))
+        return lines
+
+    def _samples(self, labels, values, child):
+        return [f'{self.name}{labels} {child.value()}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _bind(self, child):
+        self.inc = child.inc
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _bind(self, child):
+        self.observe = child.observe
+        self.time = child.time
+
+    def _samples(self, labels, values, child):
+        counts, total = child.value()
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            le = _format_labels(self.labelnames, values, [f'le="{bound}"'])
+            lines.append(f'{self.name}_bucket{le} {cumulative}')
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Holds metrics and collector callbacks and renders the exposition text"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Register a metric; re-registering a name returns the existing one (Streamlit reruns)"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def add_collector(self, prefix, collect):
+        """Export a callable returning {name: number} as gauges named <prefix>_<name>"""
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def exposition(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        for prefix, collect in collectors:
+            for name, value in collect().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'# TYPE {prefix}_{name} gauge')
+                    lines.append(f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def _handler_class():
+    # http.server pulls in email, html and mimetypes; only pay for that when serving
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = REGISTRY.exposition().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics from a daemon thread; safe to call on every rerun"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+            try:
+                _server = ThreadingHTTPServer((host, port), _handler_class())
+            except OSError:
+                # Another worker process already owns the port
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+
+
+def benchmark(iterations=1_000_000):
+    """Nanoseconds per call for each hot-path operation"""
+    registry_counter = Counter('bench_total', 'benchmark')
+    labelled = Counter('bench_labelled_total', 'benchmark', ('cause',)).labels('timeout')
+    latency = Histogram('bench_seconds', 'benchmark')
+
+    def noop(*args):
+        pass
+
+    def per_call(fn, *args):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn(*args)
+        return round((time.perf_counter() - started) / iterations * 1e9, 1)
+
+    return {
+        'empty_call_ns': per_call(noop),
+        'counter_inc_ns': per_call(registry_counter.inc),
+        'labelled_counter_inc_ns': per_call(labelled.inc),
+        'histogram_observe_ns': per_call(latency.observe, 0.003),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
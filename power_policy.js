@@ -0,0 +1,64 @@
+// Low-power mode policy for the customer's outgoing video.
+//
+// Inlined into the call page by video_call_app.py and loaded directly by
+// tests/test_power_policy.py, which drives nextPowerState() with synthetic
+// stat traces. Keep it free of browser APIs.
+
+const POWER_LEVELS = [
+    { name: 'full', scaleResolutionDownBy: 1.0, maxFramerate: 30, active: true },
+    { name: 'reduced', scaleResolutionDownBy: 1.5, maxFramerate: 20, active: true },
+    { name: 'minimal', scaleResolutionDownBy: 2.0, maxFramerate: 15, active: true },
+    { name: 'paused', scaleResolutionDownBy: 2.0, maxFramerate: 15, active: false }
+];
+const POWER_SAMPLE_INTERVAL_MS = 3000;
+const CPU_STEP_DOWN_SAMPLES = 2;    // Consecutive CPU-limited samples before stepping down
+const CPU_STEP_UP_SAMPLES = 10;     // Unconstrained samples before stepping back up
+
+// level is what the encoder runs at. cpuLevel is the part of it earned by CPU
+// limits; battery and visibility only cap it, so it returns to cpuLevel as
+// soon as the cap condition clears.
+function initialPowerState() {
+    return { level: 0, cpuLevel: 0, cpuStreak: 0, clearStreak: 0 };
+}
+
+// Highest level battery and visibility force right now
+function powerCap(signals) {
+    let cap = 0;
+    if (signals.batteryLevel !== null && signals.batteryLevel !== undefined && !signals.charging) {
+        if (signals.batteryLevel < 0.1) cap = 2;
+        else if (signals.batteryLevel < 0.2) cap = 1;
+    }
+    if (signals.hidden) cap = 2;
+    return cap;
+}
+
+// Pure transition, one call per sample.
+// signals: { qualityLimitationReason, batteryLevel, charging, hidden, agentReviewing, detailRequested }
+function nextPowerState(state, signals) {
+    // The agent needs sharp video right now: go straight to full quality
+    if (signals.detailRequested) {
+        return initialPowerState();
+    }
+    // Paused while the agent reviews; leaving the pause resumes at full quality
+    if (signals.agentReviewing) {
+        return { level: 3, cpuLevel: 0, cpuStreak: 0, clearStreak: 0 };
+    }
+
+    const cpuLimited = signals.qualityLimitationReason === 'cpu';
+    let cpuStreak = cpuLimited ? state.cpuStreak + 1 : 0;
+    let clearStreak = cpuLimited ? 0 : state.clearStreak + 1;
+    let cpuLevel = state.cpuLevel;
+    if (cpuStreak >= CPU_STEP_DOWN_SAMPLES && cpuLevel < 2) {
+        cpuLevel += 1;
+        cpuStreak = 0;
+        clearStreak = 0;
+    } else if (clearStreak >= CPU_STEP_UP_SAMPLES && cpuLevel > 0) {
+        cpuLevel -= 1;
+        clearStreak = 0;
+    }
+    return { level: Math.max(cpuLevel, powerCap(signals)), cpuLevel, cpuStreak, clearStreak };
+}
+
+if (typeof module !== 'undefined') {
+    module.exports = { POWER_LEVELS, CPU_STEP_DOWN_SAMPLES, CPU_STEP_UP_SAMPLES, initialPowerState, nextPowerState };
+}
@@ -0,0 +1,166 @@
+"""Authenticated encryption for the recording store.
+
+Every KYC session gets its own random data key, stored only wrapped
+(encrypted) under a master key, so deleting a session's key makes all of its
+media unreadable. Sessions are identified by a per-session id, not the
+reusable room code. HKDF derives two subkeys from the data key: one for the
+HMAC that names chunks, one for the AEAD. Each store chunk is sealed on its
+own with AES-256-GCM or ChaCha20-Poly1305 as nonce || ciphertext || tag, with
+the chunk id as associated data so chunks cannot be swapped. Because chunks
+are independent, a byte range of a recording can be read by decrypting only
+the chunks it covers.
+
+Requires: pip install cryptography
+
+Usage:
+    python recording_crypto.py --megabytes 256   # ingest CPU with and without encryption
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+MASTER_KEY_ENV = 'KYC_STORE_MASTER_KEY'
+ALGORITHMS = ('aes-256-gcm', 'chacha20-poly1305')
+DEFAULT_ALGORITHM = 'aes-256-gcm'  # AES-NI makes this the fastest on server CPUs
+NONCE_SIZE = 12
+KEY_SIZE = 32
+TAG_SIZE = 16
+NEEDS_CRYPTOGRAPHY = "Encrypted recording storage needs the 'cryptography' package"
+
+
+def _aead(algorithm, key):
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    except ImportError as err:
+        raise RuntimeError(NEEDS_CRYPTOGRAPHY) from err
+    if algorithm == 'aes-256-gcm':
+        return AESGCM(key)
+    if algorithm == 'chacha20-poly1305':
+        return ChaCha20Poly1305(key)
+    raise ValueError(f"Unsupported algorithm: {algorithm}")
+
+
+def load_master_key():
+    """Return the master key from KYC_STORE_MASTER_KEY (base64), or None if unset"""
+    value = os.environ.get(MASTER_KEY_ENV)
+    if not value:
+        return None
+    key = base64.b64decode(value)
+    if len(key) != KEY_SIZE:
+        raise ValueError(f"{MASTER_KEY_ENV} must be {KEY_SIZE} bytes, base64-encoded")
+    return key
+
+
+def new_master_key():
+    return base64.b64encode(os.urandom(KEY_SIZE)).decode()
+
+
+def _subkey(key, purpose):
+    try:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    except ImportError as err:
+        raise RuntimeError(NEEDS_CRYPTOGRAPHY) from err
+    return HKDF(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=None, info=purpose).derive(key)
+
+
+class ChunkCipher:
+    """Names, seals and opens individual chunks under one session key"""
+
+    def __init__(self, key, algorithm=DEFAULT_ALGORITHM):
+        self.algorithm = algorithm
+        # Never use one key for two primitives: the chunk-id MAC and the AEAD get their own
+        self._mac_key = _subkey(key, b'kyc-recording-store chunk-id')
+        self._aead = _aead(algorithm, _subkey(key, b'kyc-recording-store chunk-aead'))
+
+    def chunk_id(self, data):
+        """Keyed hash of a chunk's plaintext; equal chunks in one session share an id"""
+        return hmac.new(self._mac_key, data, hashlib.sha256).hexdigest()
+
+    def seal(self, chunk_id, data):
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, data, chunk_id.encode())
+
+    def seal_into(self, chunk_id, data, buffer):
+        """Seal into a reusable buffer of at least NONCE_SIZE + len(data) + TAG_SIZE bytes; returns a view of it"""
+        view = memoryview(buffer)[:NONCE_SIZE + len(data) + TAG_SIZE]
+        if not hasattr(self._aead, 'encrypt_into'):
+            # Older cryptography releases: one extra copy
+            view[:] = self.seal(chunk_id, data)
+            return view
+        nonce = os.urandom(NONCE_SIZE)
+        view[:NONCE_SIZE] = nonce
+        self._aead.encrypt_into(nonce, data, chunk_id.encode(), view[NONCE_SIZE:])
+        return view
+
+    def open(self, chunk_id, sealed):
+        """Decrypt a chunk; raises cryptography's InvalidTag if it was altered or moved"""
+        return self._aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], chunk_id.encode())
+
+
+class KeyWrapper:
+    """Wraps session data keys under the master key"""
+
+    def __init__(self, master_key):
+        self._aead = _aead('aes-256-gcm', master_key)
+
+    def new_session_key(self, session_id):
+        """Return (data key, wrapped key) for a new session"""
+        key = os.urandom(KEY_SIZE)
+        nonce = os.urandom(NONCE_SIZE)
+        return key, nonce + self._aead.encrypt(nonce, key, session_id.encode())
+
+    def unwrap(self, session_id, wrapped):
+        return self._aead.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], session_id.encode())
+
+
+def benchmark(megabytes=256, algorithm=DEFAULT_ALGORITHM, workers=None):
+    """Compare put() CPU seconds for the same data with and without encryption"""
+    from recording_store import RecordingStore
+
+    # Incompressible, like encoded video, and unique per run so nothing deduplicates
+    payload = os.urandom(megabytes * 1024 * 1024)
+    results = {}
+    for label, master_key in (('plaintext', None), ('encrypted', os.urandom(KEY_SIZE))):
+        root = tempfile.mkdtemp(prefix='kyc-store-bench-')
+        try:
+            store = RecordingStore(root, master_key=master_key, algorithm=algorithm, workers=workers)
+            cpu_started, wall_started = time.process_time(), time.perf_counter()
+            store.put('A1B2', 'recording', 'bench.webm', io.BytesIO(payload), session_id='bench')
+            cpu = time.process_time() - cpu_started
+            wall = time.perf_counter() - wall_started
+            store.close()
+        finally:
+            shutil.rmtree(root)
+        results[label] = {'cpu_seconds': round(cpu, 3), 'wall_seconds': round(wall, 3),
+                          'mb_per_second': round(megabytes / wall, 1)}
+
+    plain, encrypted = results['plaintext']['cpu_seconds'], results['encrypted']['cpu_seconds']
+    results['algorithm'] = algorithm
+    results['cpu_overhead_percent'] = round((encrypted - plain) / plain * 100, 1) if plain else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the ingest cost of encrypted recording storage")
+    parser.add_argument('--megabytes', type=int, default=256)
+    parser.add_argument('--algorithm', choices=ALGORITHMS, default=DEFAULT_ALGORITHM)
+    parser.add_argument('--workers', type=int, default=None, help="Encryption threads (default: store default)")
+    parser.add_argument('--new-master-key', action='store_true', help=f"Print a fresh value for {MASTER_KEY_ENV}")
+    args = parser.parse_args()
+
+    if args.new_master_key:
+        print(new_master_key())
+        return
+    print(json.dumps(benchmark(args.megabytes, args.algorithm, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
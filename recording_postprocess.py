@@ -0,0 +1,176 @@
+"""Post-process KYC recordings so reviewers can seek instantly.
+
+MediaRecorder writes WebM without cues or a duration header, so players have to
+scan the whole file to seek. This remuxes finished recordings (stream copy, no
+re-encoding) to add cues and duration, or to fragmented MP4, and writes a
+keyframe index next to each output. Work is spread over a process pool.
+
+Requires ffmpeg and ffprobe on PATH.
+
+Usage:
+    python recording_postprocess.py recordings/*.webm --output-dir processed
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+
+CONTAINERS = {
+    # Cues go at the front so the index is read before any media data
+    'webm': ['-f', 'webm', '-cues_to_front', '1', '-reserve_index_space', '200k'],
+    'mp4': ['-f', 'mp4', '-movflags', '+frag_keyframe+empty_moov+default_base_moof'],
+}
+
+
+@dataclass
+class RemuxResult:
+    source: str
+    output: str
+    index: str
+    duration: float
+    keyframes: int
+    bytes_in: int
+    bytes_out: int
+    seconds: float
+
+
+def check_tools():
+    """Raise if ffmpeg or ffprobe are not installed"""
+    missing = [tool for tool in ('ffmpeg', 'ffprobe') if shutil.which(tool) is None]
+    if missing:
+        raise RuntimeError(f"Recording post-processing needs {' and '.join(missing)} on PATH")
+
+
+def output_path_for(source, output_dir, container):
+    """Return the output file path for a recording"""
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(output_dir, f"{name}.{container}")
+
+
+def remux(source, output, container='webm'):
+    """Copy all streams into a seekable container without re-encoding"""
+    subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+         '-fflags', '+genpts', '-i', source,
+         '-map', '0', '-c', 'copy', *CONTAINERS[container], output],
+        check=True
+    )
+
+
+def build_keyframe_index(path):
+    """Return the duration and a list of (seconds, byte offset) for every video keyframe"""
+    probe = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'packet=pts_time,pos,flags:format=duration',
+         '-of', 'json', path],
+        check=True, capture_output=True, text=True
+    )
+    info = json.loads(probe.stdout)
+    keyframes = [
+        (float(packet['pts_time']), int(packet['pos']))
+        for packet in info.get('packets', [])
+        if 'K' in packet.get('flags', '') and packet.get('pts_time') not in (None, 'N/A')
+        and packet.get('pos') not in (None, 'N/A')
+    ]
+    duration = float(info.get('format', {}).get('duration') or (keyframes[-1][0] if keyframes else 0.0))
+    return duration, keyframes
+
+
+def find_keyframe(keyframes, seconds):
+    """Return the last keyframe at or before the given time, for instant seeking"""
+    lo, hi = 0, len(keyframes)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keyframes[mid][0] <= seconds:
+            lo = mid + 1
+        else:
+            hi = mid
+    return keyframes[lo - 1] if lo else (keyframes[0] if keyframes else None)
+
+
+def process_recording(source, output_dir, container='webm'):
+    """Remux one recording and write its keyframe index as <output>.index.json"""
+    started = time.perf_counter()
+    output = output_path_for(source, output_dir, container)
+    bytes_in = os.path.getsize(source)
+    # Remux to a temporary file and rename, so a source already in the output
+    # directory is never truncated while ffmpeg is still reading it
+    partial = f"{output}.partial"
+    try:
+        remux(source, partial, container)
+        os.replace(partial, output)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    duration, keyframes = build_keyframe_index(output)
+
+    index_path = f"{output}.index.json"
+    with open(index_path, 'w') as f:
+        json.dump({'duration': duration, 'keyframes': keyframes}, f)
+
+    return RemuxResult(
+        source=source,
+        output=output,
+        index=index_path,
+        duration=duration,
+        keyframes=len(keyframes),
+        bytes_in=bytes_in,
+        bytes_out=os.path.getsize(output),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def process_recordings(sources, output_dir, container='webm', workers=None):
+    """Post-process recordings on a process pool; returns (results, failures, stats)"""
+    if container not in CONTAINERS:
+        raise ValueError(f"Unsupported container: {container}")
+    check_tools()
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    results, failures = [], []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_recording, source, output_dir, container): source for source in sources}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except (subprocess.CalledProcessError, OSError, ValueError) as err:
+                failures.append((futures[future], str(err)))
+    elapsed = time.perf_counter() - started
+
+    hours = elapsed / 3600
+    stats = {
+        'recordings': len(results),
+        'failed': len(failures),
+        'workers': workers,
+        'elapsed_seconds': round(elapsed, 3),
+        'recordings_per_hour_per_core': round(len(results) / hours / workers, 1) if hours else 0.0,
+        'media_seconds_per_second': round(sum(r.duration for r in results) / elapsed, 1) if elapsed else 0.0,
+    }
+    return results, failures, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remux KYC recordings and build keyframe indexes")
+    parser.add_argument('sources', nargs='+', help="Recording files to process")
+    parser.add_argument('--output-dir', default='processed_recordings')
+    parser.add_argument('--format', choices=sorted(CONTAINERS), default='webm',
+                        help="webm adds cues and duration; mp4 writes fragmented MP4")
+    parser.add_argument('--workers', type=int, default=None, help="Pool size (default: CPU count)")
+    args = parser.parse_args()
+
+    results, failures, stats = process_recordings(args.sources, args.output_dir, args.format, args.workers)
+    for result in results:
+        print(json.dumps(asdict(result)))
+    for source, error in failures:
+        print(f"FAILED {source}: {error}")
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
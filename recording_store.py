@@ -0,0 +1,536 @@
+"""Server-side storage for KYC recordings and snapshots.
+
+Files are split into content-addressed chunks (SHA-256), so re-uploads and
+identical snapshots are stored once. New chunks live in a hot tier on local
+disk; compaction moves chunks that have not been read recently into compressed
+pack archives in a cold tier, which can be a local directory or anything with
+the same put/get-range/delete interface (e.g. an S3-compatible bucket). Object
+metadata is indexed in SQLite so lookups by room code or date use B-tree
+indexes, and every object carries an expiry from the retention policy.
+
+With a master key, chunks are encrypted at rest under a per-session key (see
+recording_crypto). A session is whatever the caller passes as session_id, one
+per KYC session; room codes are reused, so they are never used for keys. Chunk
+ids are then keyed hashes, so deduplication stays within a session and
+plaintext hashes are never stored. Hashing and encryption
+run on a thread pool while earlier chunks are written, and read_range()
+decrypts only the chunks a seek touches.
+
+Usage:
+    store = RecordingStore('kyc_store', master_key=load_master_key())
+    object_id = store.put('A1B2', 'recording', 'KYC_Recording_A1B2.webm', open(path, 'rb'), session_id=session_id)
+    store.start_background_compaction()
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import metrics
+from recording_crypto import DEFAULT_ALGORITHM, NONCE_SIZE, TAG_SIZE, ChunkCipher, KeyWrapper
+
+CHUNK_SIZE = 4 * 1024 * 1024
+HOT_IDLE_DAYS = 7          # Chunks not read for this long are moved to the cold tier
+PACK_TARGET_SIZE = 256 * 1024 * 1024
+PACK_MIN_LIVE_RATIO = 0.5  # Packs with less live data than this are rewritten
+CRYPTO_WORKERS = min(4, os.cpu_count() or 1)
+
+# Days to keep each kind of object before it is deleted
+RETENTION_DAYS = {
+    'recording': 365 * 5,
+    'snapshot': 365 * 5,
+    'document': 365 * 5,
+}
+
+INGESTED_BYTES = metrics.counter('kyc_ingested_bytes_total', 'Bytes of snapshots and recordings ingested', ('kind',))
+STORED_BYTES = metrics.counter('kyc_store_new_chunk_bytes_total', 'Bytes written as new chunks after deduplication')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    id TEXT PRIMARY KEY,
+    room_code TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_room ON objects (room_code, created_at);
+CREATE INDEX IF NOT EXISTS objects_created ON objects (created_at);
+CREATE INDEX IF NOT EXISTS objects_expires ON objects (expires_at);
+
+CREATE TABLE IF NOT EXISTS object_chunks (
+    object_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (object_id, seq)
+);
+CREATE INDEX IF NOT EXISTS object_chunks_hash ON object_chunks (hash);
+
+CREATE TABLE IF NOT EXISTS chunks (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    pack TEXT,
+    pack_offset INTEGER,
+    pack_length INTEGER,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    key_id TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_pack ON chunks (pack);
+CREATE INDEX IF NOT EXISTS chunks_access ON chunks (pack, last_access);
+
+CREATE TABLE IF NOT EXISTS packs (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS session_keys (
+    session_id TEXT PRIMARY KEY,
+    algorithm TEXT NOT NULL,
+    wrapped_key BLOB NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+class DirectoryBackend:
+    """Cold tier stored as files in a local directory, with S3-style object operations"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def put_object(self, key, data):
+        tmp = self._path(key) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(key))
+
+    def get_range(self, key, offset, length):
+        with open(self._path(key), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def delete_object(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class RecordingStore:
+    """Content-addressed, tiered store for KYC media with SQLite metadata"""
+
+    def __init__(self, root, cold_backend=None, retention_days=None, hot_idle_days=HOT_IDLE_DAYS,
+                 master_key=None, algorithm=DEFAULT_ALGORITHM, workers=None):
+        self.hot_root = os.path.join(root, 'hot')
+        os.makedirs(self.hot_root, exist_ok=True)
+        self.cold = cold_backend or DirectoryBackend(os.path.join(root, 'cold'))
+        self.retention_days = {**RETENTION_DAYS, **(retention_days or {})}
+        self.hot_idle_seconds = hot_idle_days * 86400
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        # Stores created before encryption support lack the key column
+        if 'key_id' not in {row[1] for row in self._db.execute('PRAGMA table_info(chunks)')}:
+            self._db.execute('ALTER TABLE chunks ADD COLUMN key_id TEXT')
+        if 'session_id' not in {row[1] for row in self._db.execute('PRAGMA table_info(objects)')}:
+            self._db.execute('ALTER TABLE objects ADD COLUMN session_id TEXT')
+        self._db.execute('CREATE INDEX IF NOT EXISTS objects_session ON objects (session_id)')
+        self._stop = threading.Event()
+        self._compactor = None
+        self._wrapper = KeyWrapper(master_key) if master_key else None
+        self.algorithm = algorithm
+        self._ciphers = {}  # session id -> ChunkCipher
+        # Sessions and chunks that uploads in progress rely on; garbage collection leaves them alone
+        self._pinned_sessions = Counter()
+        self._pinned_chunks = Counter()
+        workers = workers or CRYPTO_WORKERS
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recording-store')
+        self._max_in_flight = workers * 2
+
+    def _hot_path(self, digest):
+        return os.path.join(self.hot_root, digest[:2], digest[2:4], digest)
+
+    def _write_hot_chunk(self, digest, data):
+        path = self._hot_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _unpin(pins, keys):
+        for key in keys:
+            pins[key] -= 1
+            if not pins[key]:
+                del pins[key]
+
+    def _session_cipher(self, session_id, create=False):
+        """Return the session's cipher. With create, a missing key is generated and stored;
+        otherwise a missing key is an error, never replaced."""
+        with self._lock:
+            cipher = self._ciphers.get(session_id)
+            if cipher:
+                return cipher
+            row = self._db.execute(
+                'SELECT algorithm, wrapped_key FROM session_keys WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            if row:
+                cipher = self._ciphers[session_id] = ChunkCipher(self._wrapper.unwrap(session_id, row[1]), row[0])
+                return cipher
+            if not create:
+                raise RuntimeError(f"No key for session {session_id}: it was shredded or the index is damaged")
+            key, wrapped = self._wrapper.new_session_key(session_id)
+            with self._db:
+                self._db.execute(
+                    'INSERT INTO session_keys (session_id, algorithm, wrapped_key, created_at) VALUES (?, ?, ?, ?)',
+                    (session_id, self.algorithm, wrapped, _now().isoformat())
+                )
+            cipher = self._ciphers[session_id] = ChunkCipher(key, self.algorithm)
+            return cipher
+
+    @staticmethod
+    def _prepare_chunk(cipher, data, buffer):
+        """Return (chunk id, bytes to store); runs on the pool"""
+        if cipher is None:
+            return hashlib.sha256(data).hexdigest(), data
+        digest = cipher.chunk_id(data)
+        return digest, cipher.seal_into(digest, data, buffer)
+
+    def put(self, room_code, kind, name, fileobj, retention_days=None, session_id=None):
+        """Store a file-like object and return its object id.
+
+        session_id groups the objects of one KYC session under one key; without it
+        the object gets a key of its own.
+        """
+        object_id = uuid.uuid4().hex
+        session_id = session_id or object_id
+        created = _now()
+        days = retention_days if retention_days is not None else self.retention_days[kind]
+        size = 0
+        new_bytes = 0
+        hashes = []
+        written = {}  # hot files this upload created: hash -> plaintext size
+
+        # Reading, hashing, encrypting and writing chunks happen without the store lock, so a
+        # slow client upload does not stall every other call. Meanwhile the session key and
+        # every chunk the upload refers to are pinned, so garbage collection can neither shred
+        # nor delete them; refcounts and the object row are committed in one short transaction.
+        with self._lock:
+            cipher = self._session_cipher(session_id, create=True) if self._wrapper else None
+            self._pinned_sessions[session_id] += 1
+        key_id = session_id if cipher else None
+        try:
+            # Hash/encrypt the next few chunks on the pool while this thread writes the current one.
+            # Ciphertext goes into reused buffers, one per chunk in flight.
+            in_flight = deque()
+            buffers = [bytearray(NONCE_SIZE + CHUNK_SIZE + TAG_SIZE) for _ in range(self._max_in_flight)] \
+                if cipher else [None] * self._max_in_flight
+            while True:
+                data = fileobj.read(CHUNK_SIZE) if buffers else None
+                if data:
+                    size += len(data)
+                    buffer = buffers.pop()
+                    in_flight.append((len(data), buffer, self._pool.submit(self._prepare_chunk, cipher, data, buffer)))
+                    continue
+                if not in_flight:
+                    break
+                length, buffer, future = in_flight.popleft()
+                digest, stored = future.result()
+                with self._lock:
+                    self._pinned_chunks[digest] += 1
+                    hashes.append(digest)
+                    known = self._db.execute('SELECT 1 FROM chunks WHERE hash = ?', (digest,)).fetchone()
+                if not known and digest not in written:
+                    self._write_hot_chunk(digest, stored)
+                    written[digest] = length
+                buffers.append(buffer)
+
+            # One transaction per object so a failed upload leaves no dangling refcounts
+            with self._lock, self._db:
+                for digest in hashes:
+                    if self._db.execute('SELECT 1 FROM chunks WHERE hash = ?', (digest,)).fetchone():
+                        self._db.execute('UPDATE chunks SET refcount = refcount + 1 WHERE hash = ?', (digest,))
+                        continue
+                    if digest not in written:
+                        raise RuntimeError(f"Chunk {digest} disappeared during upload")
+                    new_bytes += written[digest]
+                    self._db.execute(
+                        'INSERT INTO chunks (hash, size, refcount, last_access, key_id) VALUES (?, ?, 1, ?, ?)',
+                        (digest, written[digest], time.time(), key_id)
+                    )
+                self._db.execute(
+                    'INSERT INTO objects (id, room_code, kind, name, size, created_at, expires_at, session_id) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (object_id, room_code, kind, name, size, created.isoformat(),
+                     (created + timedelta(days=days)).isoformat(), session_id)
+                )
+                self._db.executemany(
+                    'INSERT INTO object_chunks (object_id, seq, hash) VALUES (?, ?, ?)',
+                    [(object_id, seq, digest) for seq, digest in enumerate(hashes)]
+                )
+        except BaseException:
+            self._discard_written(written, Counter(hashes))
+            raise
+        finally:
+            with self._lock:
+                self._unpin(self._pinned_chunks, hashes)
+                self._unpin(self._pinned_sessions, [session_id])
+        INGESTED_BYTES.labels(kind).inc(size)
+        STORED_BYTES.inc(new_bytes)
+        return object_id
+
+    def _discard_written(self, written, own_pins):
+        """Remove hot files a failed upload created that no chunk row or other upload needs"""
+        with self._lock:
+            for digest in written:
+                if self._pinned_chunks[digest] > own_pins[digest]:
+                    continue
+                if self._db.execute('SELECT 1 FROM chunks WHERE hash = ?', (digest,)).fetchone():
+                    continue
+                try:
+                    os.remove(self._hot_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def _read_stored(self, digest):
+        """Return a chunk's stored bytes (still encrypted) and its key id"""
+        with self._lock:
+            pack, offset, length, compressed, key_id = self._db.execute(
+                'SELECT pack, pack_offset, pack_length, compressed, key_id FROM chunks WHERE hash = ?', (digest,)
+            ).fetchone()
+            if pack is None:
+                self._db.execute('UPDATE chunks SET last_access = ? WHERE hash = ?', (time.time(), digest))
+                with open(self._hot_path(digest), 'rb') as f:
+                    return f.read(), key_id
+        data = self.cold.get_range(pack, offset, length)
+        return (zlib.decompress(data) if compressed else data), key_id
+
+    def _read_chunk(self, digest):
+        data, key_id = self._read_stored(digest)
+        if key_id is None:
+            return data
+        if self._wrapper is None:
+            raise RuntimeError("This store holds encrypted chunks; open it with the master key")
+        return self._session_cipher(key_id).open(digest, data)
+
+    def read(self, object_id):
+        """Yield the object's bytes chunk by chunk"""
+        with self._lock:
+            hashes = [row[0] for row in self._db.execute(
+                'SELECT hash FROM object_chunks WHERE object_id = ? ORDER BY seq', (object_id,)
+            )]
+        for digest in hashes:
+            yield self._read_chunk(digest)
+
+    def read_range(self, object_id, offset, length):
+        """Return length bytes from offset, decrypting only the chunks that cover the range"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT oc.hash, c.size FROM object_chunks oc JOIN chunks c ON c.hash = oc.hash '
+                'WHERE oc.object_id = ? ORDER BY oc.seq', (object_id,)
+            ).fetchall()
+        parts = []
+        end = offset + length
+        position = 0
+        for digest, size in rows:
+            if position + size > offset and position < end:
+                data = self._read_chunk(digest)
+                parts.append(data[max(offset - position, 0):end - position])
+            position += size
+            if position >= end:
+                break
+        return b''.join(parts)
+
+    def find(self, room_code=None, since=None, until=None, kind=None):
+        """Return object metadata by room code and/or creation date range"""
+        clauses, params = [], []
+        if room_code is not None:
+            clauses.append('room_code = ?')
+            params.append(room_code)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since.isoformat())
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until.isoformat())
+        if kind is not None:
+            clauses.append('kind = ?')
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT id, room_code, kind, name, size, created_at, expires_at FROM objects {where} '
+                'ORDER BY created_at', params
+            ).fetchall()
+        columns = ('id', 'room_code', 'kind', 'name', 'size', 'created_at', 'expires_at')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def delete(self, object_id):
+        """Drop an object; its chunks are reclaimed by the next compaction"""
+        with self._lock, self._db:
+            # An object can reference the same chunk many times (e.g. silence), one reference per use
+            self._db.executemany(
+                'UPDATE chunks SET refcount = refcount - ? WHERE hash = ?',
+                [(count, digest) for digest, count in self._db.execute(
+                    'SELECT hash, COUNT(*) FROM object_chunks WHERE object_id = ? GROUP BY hash', (object_id,)
+                ).fetchall()]
+            )
+            self._db.execute('DELETE FROM object_chunks WHERE object_id = ?', (object_id,))
+            self._db.execute('DELETE FROM objects WHERE id = ?', (object_id,))
+
+    def expire(self, now=None):
+        """Delete objects whose retention period has passed; returns how many"""
+        now = now or _now()
+        with self._lock:
+            expired = [row[0] for row in self._db.execute(
+                'SELECT id FROM objects WHERE expires_at <= ?', (now.isoformat(),)
+            )]
+        for object_id in expired:
+            self.delete(object_id)
+        return len(expired)
+
+    def _collect_garbage(self):
+        """Remove unreferenced chunks from the hot tier"""
+        with self._lock, self._db:
+            # An upload in progress may be about to revive a dead chunk
+            dead = [row[0] for row in self._db.execute(
+                'SELECT hash FROM chunks WHERE refcount <= 0 AND pack IS NULL'
+            ) if row[0] not in self._pinned_chunks]
+            for digest in dead:
+                try:
+                    os.remove(self._hot_path(digest))
+                except FileNotFoundError:
+                    pass
+            self._db.executemany('DELETE FROM chunks WHERE hash = ?', [(digest,) for digest in dead])
+            # Crypto-shred sessions with no objects left; any dead chunks in packs become unreadable
+            shredded = [row[0] for row in self._db.execute(
+                'SELECT session_id FROM session_keys WHERE session_id NOT IN '
+                '(SELECT session_id FROM objects WHERE session_id IS NOT NULL)'
+            ) if row[0] not in self._pinned_sessions]
+            self._db.executemany('DELETE FROM session_keys WHERE session_id = ?', [(sid,) for sid in shredded])
+            for session_id in shredded:
+                self._ciphers.pop(session_id, None)
+        return len(dead)
+
+    def _write_pack(self, chunks):
+        """Compress chunks into one cold archive; chunks is a list of (hash, stored bytes, key id)"""
+        name = f"pack-{uuid.uuid4().hex}.bin"
+        parts, entries, offset = [], [], 0
+        for digest, data, key_id in chunks:
+            # Ciphertext does not compress, so don't spend CPU trying
+            packed = zlib.compress(data, 6) if key_id is None else data
+            compressed = len(packed) < len(data)
+            if not compressed:
+                packed = data
+            parts.append(packed)
+            entries.append((name, offset, len(packed), int(compressed), digest))
+            offset += len(packed)
+        self.cold.put_object(name, b''.join(parts))
+        with self._lock, self._db:
+            self._db.execute('INSERT INTO packs (name, size) VALUES (?, ?)', (name, offset))
+            self._db.executemany(
+                'UPDATE chunks SET pack = ?, pack_offset = ?, pack_length = ?, compressed = ? WHERE hash = ?',
+                entries
+            )
+        return name
+
+    def _demote_idle_chunks(self, now):
+        """Move hot chunks that have not been read recently into cold packs"""
+        cutoff = now - self.hot_idle_seconds
+        with self._lock:
+            idle = self._db.execute(
+                'SELECT hash, size, key_id FROM chunks WHERE pack IS NULL AND refcount > 0 AND last_access < ? '
+                'ORDER BY last_access', (cutoff,)
+            ).fetchall()
+
+        moved = 0
+        batch, batch_size = [], 0
+        for digest, size, key_id in idle + [(None, 0, None)]:
+            if digest is not None:
+                with open(self._hot_path(digest), 'rb') as f:
+                    batch.append((digest, f.read(), key_id))
+                batch_size += size
+            if batch and (digest is None or batch_size >= PACK_TARGET_SIZE):
+                self._write_pack(batch)
+                for packed_digest, _, _ in batch:
+                    os.remove(self._hot_path(packed_digest))
+                moved += len(batch)
+                batch, batch_size = [], 0
+        return moved
+
+    def _rewrite_sparse_packs(self):
+        """Rewrite cold packs that are mostly dead data and delete empty ones"""
+        with self._lock:
+            packs = self._db.execute(
+                'SELECT p.name, p.size, COALESCE(SUM(CASE WHEN c.refcount > 0 THEN c.pack_length END), 0) '
+                'FROM packs p LEFT JOIN chunks c ON c.pack = p.name GROUP BY p.name'
+            ).fetchall()
+
+        rewritten = 0
+        for name, size, live in packs:
+            if size and live / size >= PACK_MIN_LIVE_RATIO:
+                continue
+            # Held for the whole rewrite: a put() that revived a dead chunk in between would
+            # otherwise be left pointing into the deleted pack
+            with self._lock:
+                survivors = [digest for digest, refcount in self._db.execute(
+                    'SELECT hash, refcount FROM chunks WHERE pack = ?', (name,)
+                ) if refcount > 0 or digest in self._pinned_chunks]
+                if survivors:
+                    self._write_pack([(digest, *self._read_stored(digest)) for digest in survivors])
+                with self._db:
+                    self._db.execute('DELETE FROM chunks WHERE pack = ? AND refcount <= 0', (name,))
+                    self._db.execute('DELETE FROM packs WHERE name = ?', (name,))
+            self.cold.delete_object(name)
+            rewritten += 1
+        return rewritten
+
+    def compact(self, now=None):
+        """Apply retention, reclaim dead chunks and tier idle data; returns a summary"""
+        now = now or _now()
+        return {
+            'expired_objects': self.expire(now),
+            'deleted_hot_chunks': self._collect_garbage(),
+            'demoted_chunks': self._demote_idle_chunks(now.timestamp()),
+            'rewritten_packs': self._rewrite_sparse_packs(),
+        }
+
+    def start_background_compaction(self, interval_seconds=3600):
+        """Run compact() periodically on a daemon thread"""
+        def run():
+            while not self._stop.wait(interval_seconds):
+                self.compact()
+
+        self._compactor = threading.Thread(target=run, name='recording-store-compactor', daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join()
+        self._pool.shutdown()
+        with self._lock:
+            self._db.commit()
+            self._db.close()
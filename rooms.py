@@ -0,0 +1,12 @@
+import random
+import secrets
+import string
+
+
+def generate_room_code():
+    """Generate a simple 4-character room code"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
+
+def generate_reconnect_token(room_code):
+    """Generate a token that lets this participant resume its signaling session in a room"""
+    return f"{room_code}-{secrets.token_urlsafe(16)}"
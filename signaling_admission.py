@@ -0,0 +1,331 @@
+"""Admission control, rate limiting and room lifecycle for the signaling relay.
+
+The relay calls admit() for every decoded message before fan-out:
+- Each connection has a token bucket. Cheap, high-volume messages
+  (ice-candidate, mute-state) are shed first. Call-critical messages
+  (join, offer, answer, ice-restart) may borrow a small reserve, so a
+  noisy client loses its candidates before its call breaks. Connections
+  that keep hitting the limit are told to disconnect.
+- Each room has a message quota per window and a memory budget for frames
+  held for a peer that has not joined yet. Over budget, the oldest
+  candidates are evicted before anything is refused.
+- Rooms expire through a hashed timer wheel once their last participant
+  has left and nobody touches them for ROOM_IDLE_SECONDS; a room with a
+  connected participant never expires. Activity only updates a timestamp,
+  and the wheel re-checks an entry when its slot comes round, so expiry is
+  O(1) amortized even with millions of rooms.
+
+Usage:
+    python signaling_admission.py   # admit() cost and expiry cost at scale
+"""
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+
+MESSAGE_RATE = 20.0          # Tokens refilled per second per connection
+MESSAGE_BURST = 60.0         # Bucket capacity; covers the ICE candidate burst at call start
+CRITICAL_RESERVE = 10.0      # Tokens critical messages may borrow below zero
+STRIKES_BEFORE_DISCONNECT = 50
+
+MESSAGE_COSTS = {'offer': 5.0, 'answer': 5.0, 'join': 5.0, 'ice-restart': 5.0}
+CRITICAL_TYPES = frozenset(('join', 'leave', 'offer', 'answer', 'ice-restart', 'session-ended'))
+
+ROOM_QUOTA = 1200            # Messages per room per window
+ROOM_QUOTA_WINDOW = 60.0
+ROOM_MAX_PARTICIPANTS = 2
+ROOM_MEMORY_BUDGET = 256 * 1024  # Bytes of held frames per room
+ROOM_IDLE_SECONDS = 300.0
+MAX_ROOMS = 2_000_000
+
+WHEEL_SLOTS = 512
+WHEEL_TICK = 1.0
+
+
+@dataclass(frozen=True)
+class Admission:
+    allowed: bool
+    reason: str = ''
+    disconnect: bool = False
+
+
+ACCEPTED = Admission(True)
+RATE_LIMITED = Admission(False, 'rate-limited')
+RATE_LIMITED_DISCONNECT = Admission(False, 'rate-limited', disconnect=True)
+ROOM_QUOTA_EXCEEDED = Admission(False, 'room-quota')
+ROOM_FULL = Admission(False, 'room-full')
+SERVER_BUSY = Admission(False, 'server-busy', disconnect=True)
+NOT_JOINED = Admission(False, 'not-joined')
+
+
+class TokenBucket:
+    """Refills continuously; take() never allocates"""
+
+    __slots__ = ('tokens', 'updated', 'strikes')
+
+    def __init__(self, now):
+        self.tokens = MESSAGE_BURST
+        self.updated = now
+        self.strikes = 0
+
+    def take(self, cost, now, reserve=0.0):
+        self.tokens = min(MESSAGE_BURST, self.tokens + (now - self.updated) * MESSAGE_RATE)
+        self.updated = now
+        if self.tokens - cost < -reserve:
+            self.strikes += 1
+            return False
+        self.tokens -= cost
+        self.strikes = 0
+        return True
+
+
+class Room:
+    """Participants, quota window and frames held for a peer that has not joined"""
+
+    __slots__ = ('code', 'participants', 'last_active', 'window_start', 'window_count', 'held', 'held_bytes')
+
+    def __init__(self, code, now):
+        self.code = code
+        self.participants = set()
+        self.last_active = now
+        self.window_start = now
+        self.window_count = 0
+        self.held = deque()  # (message type, frame)
+        self.held_bytes = 0
+
+
+class TimerWheel:
+    """Hashed timing wheel; entries past one revolution stay in their slot until due"""
+
+    def __init__(self, now, slots=WHEEL_SLOTS, tick=WHEEL_TICK):
+        self._slots = [dict() for _ in range(slots)]
+        self._tick = tick
+        self._current = int(now / tick)
+        self._slot_of = {}
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def schedule(self, key, deadline):
+        self.cancel(key)
+        # Never schedule into a tick that has already been swept
+        tick = max(int(deadline / self._tick), self._current + 1)
+        slot = tick % len(self._slots)
+        self._slots[slot][key] = deadline
+        self._slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self, now):
+        """Return the keys whose deadline has passed"""
+        expired = []
+        target = int(now / self._tick)
+        # After a long pause every slot is due, so one revolution is enough
+        steps = min(target - self._current, len(self._slots))
+        for step in range(1, steps + 1):
+            bucket = self._slots[(self._current + step) % len(self._slots)]
+            due = [key for key, deadline in bucket.items() if deadline <= now]
+            for key in due:
+                del bucket[key]
+                del self._slot_of[key]
+            expired.extend(due)
+        self._current = max(self._current, target)
+        return expired
+
+
+class AdmissionController:
+    """Decides whether each signaling message is relayed, and expires idle rooms"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        now = clock()
+        self._buckets = {}      # connection id -> TokenBucket
+        self._membership = {}   # connection id -> room code
+        self._rooms = {}        # room code -> Room
+        self._wheel = TimerWheel(now)
+        self.counters = {
+            'accepted': 0, 'rate_limited': 0, 'disconnected': 0, 'room_quota_exceeded': 0,
+            'room_full': 0, 'server_busy': 0, 'not_joined': 0, 'held_evicted': 0, 'held_refused': 0,
+            'rooms_created': 0, 'rooms_expired': 0,
+        }
+
+    def connect(self, connection_id):
+        self._buckets[connection_id] = TokenBucket(self._clock())
+
+    def disconnect(self, connection_id):
+        """Forget a connection; its room lingers until idle expiry so the peer can resume"""
+        self._buckets.pop(connection_id, None)
+        room = self._rooms.get(self._membership.pop(connection_id, None))
+        if room:
+            self._leave(connection_id, room, self._clock())
+
+    def _leave(self, connection_id, room, now):
+        # The idle timer only runs while the room is empty
+        room.participants.discard(connection_id)
+        if not room.participants:
+            room.last_active = now
+            self._wheel.schedule(room.code, now + ROOM_IDLE_SECONDS)
+
+    def _join(self, connection_id, code, now):
+        room = self._rooms.get(code)
+        if room is None:
+            if len(self._rooms) >= MAX_ROOMS:
+                self.counters['server_busy'] += 1
+                return SERVER_BUSY
+            room = self._rooms[code] = Room(code, now)
+            self.counters['rooms_created'] += 1
+        if connection_id not in room.participants and len(room.participants) >= ROOM_MAX_PARTICIPANTS:
+            self.counters['room_full'] += 1
+            return ROOM_FULL
+        previous = self._membership.get(connection_id)
+        if previous is not None and previous != code:
+            self._leave(connection_id, self._rooms[previous], now)
+        if not room.participants:
+            self._wheel.cancel(code)
+        room.participants.add(connection_id)
+        self._membership[connection_id] = code
+        return ACCEPTED
+
+    def admit(self, connection_id, message):
+        """Check rate limit, membership and room quota for one decoded message"""
+        now = self._clock()
+        kind = message['type']
+        bucket = self._buckets[connection_id]
+        critical = kind in CRITICAL_TYPES
+        if not bucket.take(MESSAGE_COSTS.get(kind, 1.0), now, CRITICAL_RESERVE if critical else 0.0):
+            self.counters['rate_limited'] += 1
+            if bucket.strikes >= STRIKES_BEFORE_DISCONNECT:
+                self.counters['disconnected'] += 1
+                return RATE_LIMITED_DISCONNECT
+            return RATE_LIMITED
+
+        code = message['room']
+        if kind == 'join':
+            verdict = self._join(connection_id, code, now)
+            if not verdict.allowed:
+                return verdict
+        elif self._membership.get(connection_id) != code:
+            self.counters['not_joined'] += 1
+            return NOT_JOINED
+
+        room = self._rooms[code]
+        room.last_active = now
+        if kind == 'leave':
+            self._leave(connection_id, room, now)
+            del self._membership[connection_id]
+        if now - room.window_start >= ROOM_QUOTA_WINDOW:
+            room.window_start = now
+            room.window_count = 0
+        if room.window_count >= ROOM_QUOTA and not critical:
+            self.counters['room_quota_exceeded'] += 1
+            return ROOM_QUOTA_EXCEEDED
+        room.window_count += 1
+        self.counters['accepted'] += 1
+        return ACCEPTED
+
+    def hold(self, code, kind, frame):
+        """Keep a frame for a peer that has not joined; returns False if it does not fit"""
+        room = self._rooms.get(code)
+        if room is None:
+            return False
+        size = len(frame)
+        # Evict oldest candidates first; the offer is worth more than any one candidate
+        while room.held_bytes + size > ROOM_MEMORY_BUDGET:
+            victim = next((entry for entry in room.held if entry[0] == 'ice-candidate'), None)
+            if victim is None:
+                self.counters['held_refused'] += 1
+                return False
+            room.held.remove(victim)
+            room.held_bytes -= len(victim[1])
+            self.counters['held_evicted'] += 1
+        room.held.append((kind, frame))
+        room.held_bytes += size
+        return True
+
+    def release_held(self, code):
+        """Return and clear the frames held for a room, in arrival order"""
+        room = self._rooms.get(code)
+        if room is None or not room.held:
+            return []
+        frames = [frame for _, frame in room.held]
+        room.held.clear()
+        room.held_bytes = 0
+        return frames
+
+    def expire_idle(self):
+        """Drop empty rooms idle past ROOM_IDLE_SECONDS; returns their codes"""
+        now = self._clock()
+        expired = []
+        for code in self._wheel.advance(now):
+            room = self._rooms.get(code)
+            if room is None or room.participants:
+                # Rejoined since; the timer is armed again when the room next empties
+                continue
+            deadline = room.last_active + ROOM_IDLE_SECONDS
+            if deadline > now:
+                self._wheel.schedule(code, deadline)
+                continue
+            del self._rooms[code]
+            expired.append(code)
+        self.counters['rooms_expired'] += len(expired)
+        return expired
+
+    def metrics(self):
+        """Counters plus current rooms, connections and held memory"""
+        return {
+            **self.counters,
+            'active_rooms': len(self._rooms),
+            'active_connections': len(self._buckets),
+            'held_bytes': sum(room.held_bytes for room in self._rooms.values()),
+            'timers': len(self._wheel),
+        }
+
+
+def benchmark(rooms=1_000_000, messages=200_000):
+    """Measure admit() cost and idle-expiry cost with many live rooms"""
+    now = [0.0]
+    controller = AdmissionController(clock=lambda: now[0])
+
+    started = time.perf_counter()
+    for i in range(rooms):
+        connection_id = i
+        controller.connect(connection_id)
+        controller.admit(connection_id, {'type': 'join', 'room': f'{i:06X}'})
+    join_us = (time.perf_counter() - started) / rooms * 1e6
+
+    # Candidates spread over 1000 connections, each well inside its rate limit
+    candidates = [{'type': 'ice-candidate', 'room': f'{i:06X}'} for i in range(1000)]
+    started = time.perf_counter()
+    for i in range(messages):
+        now[0] += 0.001
+        controller.admit(i % 1000, candidates[i % 1000])
+    admit_us = (time.perf_counter() - started) / messages * 1e6
+
+    # Everyone hangs up and the rooms go idle; sweep once per simulated second
+    for connection_id in range(rooms):
+        controller.disconnect(connection_id)
+    started = time.perf_counter()
+    sweeps = 0
+    while now[0] < ROOM_IDLE_SECONDS + WHEEL_SLOTS * WHEEL_TICK:
+        now[0] += WHEEL_TICK
+        controller.expire_idle()
+        sweeps += 1
+    expire_seconds = time.perf_counter() - started
+
+    metrics = controller.metrics()
+    return {
+        'rooms': rooms,
+        'join_us': round(join_us, 2),
+        'admit_us': round(admit_us, 2),
+        'sweeps': sweeps,
+        'expired': metrics['rooms_expired'],
+        'expire_ns_per_room': round(expire_seconds / max(metrics['rooms_expired'], 1) * 1e9, 1),
+        'rate_limited': metrics['rate_limited'],
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
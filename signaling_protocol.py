@@ -0,0 +1,460 @@
+"""Versioned signaling message schema, validation and wire encodings.
+
+The relay calls decode_message() on every inbound frame before fan-out. Frames
+are size-checked before parsing and must match the schema for their type
+exactly (no unknown fields, bounded strings), so malformed floods are rejected
+cheaply with a ProtocolError.
+
+Two encodings are supported and negotiated at join:
+- 'json': the original text frames.
+- 'cbor-zdict': binary CBOR frames with SDP bodies deflated against a shared
+  dictionary of common SDP lines, which is where most of the bytes are.
+
+Every client sends its join as JSON, listing the encodings it accepts; the
+relay picks one with negotiate_encoding() and uses it for everything after,
+in both directions, re-encoding frames between peers that differ. The
+browser page offers only 'json' (browsers have no deflate with a preset
+dictionary), so the compact encoding is for native clients.
+
+Usage:
+    python signaling_protocol.py   # bytes and CPU per call for each encoding
+"""
+import json
+import re
+import struct
+import time
+import zlib
+
+PROTOCOL_VERSION = 1
+MAX_FRAME_BYTES = 64 * 1024
+MAX_SDP_BYTES = 32 * 1024
+ENCODINGS = ('cbor-zdict', 'json')  # Server preference order
+
+ROOM_CODE = re.compile(r'^[A-Z0-9]{4}$')
+
+# Lines seen in nearly every browser offer/answer; deflate back-references them
+SDP_DICTIONARY = (
+    b"a=rtcp-fb:96 goog-remb\r\na=rtcp-fb:96 transport-cc\r\na=rtcp-fb:96 ccm fir\r\n"
+    b"a=rtcp-fb:96 nack\r\na=rtcp-fb:96 nack pli\r\na=rtpmap:97 rtx/90000\r\n"
+    b"a=fmtp:97 apt=96\r\na=rtpmap:96 VP8/90000\r\na=rtpmap:98 VP9/90000\r\n"
+    b"a=fmtp:98 profile-id=0\r\na=rtpmap:102 H264/90000\r\n"
+    b"a=fmtp:102 level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42e01f\r\n"
+    b"a=rtpmap:45 AV1/90000\r\na=rtpmap:111 opus/48000/2\r\na=rtcp-fb:111 transport-cc\r\n"
+    b"a=fmtp:111 minptime=10;useinbandfec=1;usedtx=1\r\n"
+    b"a=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level\r\n"
+    b"a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time\r\n"
+    b"a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01\r\n"
+    b"a=extmap:4 urn:ietf:params:rtp-hdrext:sdes:mid\r\n"
+    b"a=extmap:9 urn:ietf:params:rtp-hdrext:sdes:rtp-stream-id\r\n"
+    b"a=extmap:10 urn:ietf:params:rtp-hdrext:sdes:repaired-rtp-stream-id\r\n"
+    b"a=extmap:14 urn:ietf:params:rtp-hdrext:toffset\r\n"
+    b"a=extmap:13 urn:3gpp:video-orientation\r\n"
+    b"a=extmap:12 http://www.webrtc.org/experiments/rtp-hdrext/playout-delay\r\n"
+    b"a=rtcp-mux\r\na=rtcp-rsize\r\na=sendrecv\r\na=setup:actpass\r\na=setup:active\r\n"
+    b"a=ice-options:trickle\r\na=fingerprint:sha-256 \r\na=ice-ufrag:\r\na=ice-pwd:\r\n"
+    b"c=IN IP4 0.0.0.0\r\na=rtcp:9 IN IP4 0.0.0.0\r\n"
+    b"m=video 9 UDP/TLS/RTP/SAVPF \r\nm=audio 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126\r\n"
+    b"m=application 9 UDP/DTLS/SCTP webrtc-datachannel\r\na=sctp-port:5000\r\n"
+    b"a=max-message-size:262144\r\na=msid-semantic: WMS\r\na=group:BUNDLE 0 1 2\r\n"
+    b"v=0\r\no=- 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\na=extmap-allow-mixed\r\n"
+)
+
+
+class ProtocolError(ValueError):
+    """A signaling frame that must be dropped"""
+
+
+# Field checkers: each returns None if the value is acceptable
+
+def _text(max_len):
+    def check(value):
+        return None if isinstance(value, str) and len(value) <= max_len else f'expected text <= {max_len} chars'
+    return check
+
+
+def _one_of(*choices):
+    def check(value):
+        return None if value in choices else f'expected one of {choices}'
+    return check
+
+
+def _room(value):
+    return None if isinstance(value, str) and ROOM_CODE.match(value) else 'invalid room code'
+
+
+def _bool(value):
+    return None if isinstance(value, bool) else 'expected boolean'
+
+
+def _version(value):
+    return None if isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= PROTOCOL_VERSION \
+        else 'unsupported protocol version'
+
+
+def _encodings(value):
+    if isinstance(value, list) and len(value) <= 8 and all(isinstance(e, str) and len(e) <= 32 for e in value):
+        return None
+    return 'expected a short list of encodings'
+
+
+def _description(kind):
+    def check(value):
+        if not isinstance(value, dict) or set(value) != {'type', 'sdp'} or value['type'] != kind:
+            return f'expected {{type: {kind}, sdp}}'
+        sdp = value['sdp']
+        if not isinstance(sdp, str) or len(sdp) > MAX_SDP_BYTES or not sdp.startswith('v=0'):
+            return 'invalid sdp'
+        return None
+    return check
+
+
+def _candidate(value):
+    if not isinstance(value, dict) or not set(value) <= {'candidate', 'sdpMid', 'sdpMLineIndex', 'usernameFragment'}:
+        return 'invalid candidate'
+    if not isinstance(value.get('candidate'), str) or len(value['candidate']) > 512:
+        return 'invalid candidate'
+    if value.get('sdpMid') is not None and not (isinstance(value['sdpMid'], str) and len(value['sdpMid']) <= 32):
+        return 'invalid sdpMid'
+    index = value.get('sdpMLineIndex')
+    if index is not None and not (isinstance(index, int) and 0 <= index < 64):
+        return 'invalid sdpMLineIndex'
+    return None
+
+
+REQUIRED, OPTIONAL = True, False
+
+# type -> field -> (checker, required). 'type' and 'v' are checked for every message.
+SCHEMAS = {
+    'join': {'room': (_room, REQUIRED), 'role': (_one_of('agent', 'customer'), REQUIRED),
+             'token': (_text(128), OPTIONAL), 'resume': (_bool, OPTIONAL), 'encodings': (_encodings, OPTIONAL)},
+    'leave': {'room': (_room, REQUIRED)},
+    'ready': {'room': (_room, REQUIRED)},
+    'offer': {'room': (_room, REQUIRED), 'offer': (_description('offer'), REQUIRED)},
+    'answer': {'room': (_room, REQUIRED), 'answer': (_description('answer'), REQUIRED)},
+    'ice-candidate': {'room': (_room, REQUIRED), 'candidate': (_candidate, REQUIRED)},
+    'ice-restart': {'room': (_room, REQUIRED)},
+    'video-mode': {'room': (_room, REQUIRED), 'mode': (_one_of('face', 'document'), REQUIRED)},
+    'video-mode-ack': {'room': (_room, REQUIRED), 'mode': (_one_of('face', 'document'), REQUIRED)},
+    'mute-state': {'room': (_room, REQUIRED), 'audioMuted': (_bool, REQUIRED), 'videoOff': (_bool, REQUIRED)},
+    'agent-reviewing': {'room': (_room, REQUIRED), 'active': (_bool, REQUIRED)},
+    'take-photo': {'room': (_room, REQUIRED), 'id': (_text(64), REQUIRED)},
+    'photo-error': {'room': (_room, REQUIRED), 'id': (_text(64), REQUIRED), 'reason': (_text(256), OPTIONAL)},
+    'session-ended': {'room': (_room, REQUIRED)},
+}
+
+
+def validate_message(message):
+    """Check a decoded message against its schema; returns it or raises ProtocolError"""
+    if not isinstance(message, dict):
+        raise ProtocolError('message must be an object')
+    kind = message.get('type')
+    # Checked before the lookup: a list or object here would make it raise TypeError
+    schema = SCHEMAS.get(kind) if isinstance(kind, str) else None
+    if schema is None:
+        raise ProtocolError(f"unknown message type: {str(kind)[:32]}")
+    if 'v' in message and _version(message['v']):
+        raise ProtocolError('unsupported protocol version')
+
+    for field in message:
+        if field not in schema and field not in ('type', 'v'):
+            raise ProtocolError(f'unexpected field: {field[:32]}')
+    for field, (check, required) in schema.items():
+        if field not in message:
+            if required:
+                raise ProtocolError(f'missing field: {field}')
+            continue
+        error = check(message[field])
+        if error:
+            raise ProtocolError(f'{field}: {error}')
+    return message
+
+
+def negotiate_encoding(join_message):
+    """Pick the wire encoding for a connection from the encodings its join offered"""
+    offered = join_message.get('encodings') or ['json']
+    for encoding in ENCODINGS:
+        if encoding in offered:
+            return encoding
+    return 'json'
+
+
+# Minimal CBOR (RFC 8949) for the value types signaling uses
+
+def _cbor_head(major, length, out):
+    if length < 24:
+        out.append(major << 5 | length)
+    elif length < 0x100:
+        out += struct.pack('>BB', major << 5 | 24, length)
+    elif length < 0x10000:
+        out += struct.pack('>BH', major << 5 | 25, length)
+    elif length < 0x100000000:
+        out += struct.pack('>BI', major << 5 | 26, length)
+    else:
+        out += struct.pack('>BQ', major << 5 | 27, length)
+
+
+def _cbor_encode(value, out):
+    if value is None:
+        out.append(0xf6)
+    elif value is True:
+        out.append(0xf5)
+    elif value is False:
+        out.append(0xf4)
+    elif isinstance(value, int):
+        if value >= 0:
+            _cbor_head(0, value, out)
+        else:
+            _cbor_head(1, -1 - value, out)
+    elif isinstance(value, float):
+        out += struct.pack('>Bd', 0xfb, value)
+    elif isinstance(value, bytes):
+        _cbor_head(2, len(value), out)
+        out += value
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        _cbor_head(3, len(data), out)
+        out += data
+    elif isinstance(value, (list, tuple)):
+        _cbor_head(4, len(value), out)
+        for item in value:
+            _cbor_encode(item, out)
+    elif isinstance(value, dict):
+        _cbor_head(5, len(value), out)
+        for key, item in value.items():
+            _cbor_encode(key, out)
+            _cbor_encode(item, out)
+    else:
+        raise TypeError(f'cannot encode {type(value).__name__}')
+
+
+def _cbor_decode(data, pos, depth=0):
+    if depth > 8:
+        raise ProtocolError('frame nested too deeply')
+    if pos >= len(data):
+        raise ProtocolError('truncated frame')
+    initial = data[pos]
+    major, info = initial >> 5, initial & 0x1f
+    pos += 1
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info == 22:
+            return None, pos
+        if info == 27:
+            return struct.unpack_from('>d', data, pos)[0], pos + 8
+        raise ProtocolError('unsupported simple value')
+    if info < 24:
+        length = info
+    elif info in (24, 25, 26, 27):
+        size = 1 << (info - 24)
+        if pos + size > len(data):
+            raise ProtocolError('truncated frame')
+        length = int.from_bytes(data[pos:pos + size], 'big')
+        pos += size
+    else:
+        raise ProtocolError('indefinite lengths are not supported')
+
+    if major == 0:
+        return length, pos
+    if major == 1:
+        return -1 - length, pos
+    if major in (2, 3):
+        if pos + length > len(data):
+            raise ProtocolError('truncated frame')
+        chunk = bytes(data[pos:pos + length])
+        return (chunk if major == 2 else chunk.decode('utf-8')), pos + length
+    if length > 256:
+        raise ProtocolError('container too large')
+    if major == 4:
+        items = []
+        for _ in range(length):
+            item, pos = _cbor_decode(data, pos, depth + 1)
+            items.append(item)
+        return items, pos
+    if major == 5:
+        result = {}
+        for _ in range(length):
+            key, pos = _cbor_decode(data, pos, depth + 1)
+            value, pos = _cbor_decode(data, pos, depth + 1)
+            if not isinstance(key, str):
+                raise ProtocolError('map keys must be text')
+            result[key] = value
+        return result, pos
+    raise ProtocolError('unsupported CBOR type')
+
+
+def _deflate_sdp(sdp):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=SDP_DICTIONARY)
+    return compressor.compress(sdp.encode('utf-8')) + compressor.flush()
+
+
+def _inflate_sdp(data):
+    decompressor = zlib.decompressobj(-15, zdict=SDP_DICTIONARY)
+    sdp = decompressor.decompress(data, MAX_SDP_BYTES + 1)
+    if len(sdp) > MAX_SDP_BYTES or decompressor.unconsumed_tail:
+        raise ProtocolError('sdp too large')
+    return sdp.decode('utf-8')
+
+
+def encode_message(message, encoding='json'):
+    """Serialize a message for the wire"""
+    if encoding == 'json':
+        return json.dumps(message, separators=(',', ':'))
+    if encoding == 'cbor-zdict':
+        compact = dict(message)
+        for field in ('offer', 'answer'):
+            if field in compact:
+                compact[field] = {**compact[field], 'sdp': _deflate_sdp(compact[field]['sdp'])}
+        out = bytearray()
+        _cbor_encode(compact, out)
+        return bytes(out)
+    raise ValueError(f'unknown encoding: {encoding}')
+
+
+def decode_message(frame, encoding='json'):
+    """Parse and validate an inbound frame; raises ProtocolError for anything malformed"""
+    if len(frame) > MAX_FRAME_BYTES:
+        raise ProtocolError('frame too large')
+    if encoding == 'json':
+        try:
+            message = json.loads(frame)
+        except (ValueError, RecursionError) as err:
+            # RecursionError: a frame of a few thousand nested brackets
+            raise ProtocolError('invalid JSON') from err
+    elif encoding == 'cbor-zdict':
+        if not isinstance(frame, (bytes, bytearray, memoryview)):
+            raise ProtocolError('expected a binary frame')
+        try:
+            message, end = _cbor_decode(memoryview(frame) if isinstance(frame, bytes) else frame, 0)
+        except (struct.error, UnicodeDecodeError) as err:
+            raise ProtocolError('invalid CBOR') from err
+        if end != len(frame):
+            raise ProtocolError('trailing bytes in frame')
+        for field in ('offer', 'answer'):
+            description = message.get(field) if isinstance(message, dict) else None
+            if isinstance(description, dict) and isinstance(description.get('sdp'), bytes):
+                try:
+                    description['sdp'] = _inflate_sdp(description['sdp'])
+                except (zlib.error, UnicodeDecodeError) as err:
+                    raise ProtocolError('invalid compressed sdp') from err
+    else:
+        raise ValueError(f'unknown encoding: {encoding}')
+    return validate_message(message)
+
+
+# Video codecs of a desktop Chrome offer: payload type, rtpmap, fmtp, retransmission payload type
+_CHROME_VIDEO_CODECS = (
+    (96, 'VP8/90000', None, 97),
+    (102, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42001f', 103),
+    (104, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=0;profile-level-id=42001f', 105),
+    (106, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42e01f', 107),
+    (108, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=0;profile-level-id=42e01f', 109),
+    (127, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=4d001f', 125),
+    (39, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=0;profile-level-id=4d001f', 40),
+    (45, 'AV1/90000', 'level-idx=5;profile=0;tier=0', 46),
+    (98, 'VP9/90000', 'profile-id=0', 99),
+    (100, 'VP9/90000', 'profile-id=2', 101),
+    (112, 'H264/90000', 'level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=64001f', 113),
+)
+
+
+def _browser_offer():
+    """An offer as desktop Chrome sends it: audio, video with every codec and RTX, and a data channel"""
+    transport = (
+        "c=IN IP4 0.0.0.0\r\na=rtcp:9 IN IP4 0.0.0.0\r\na=ice-ufrag:Xb3k\r\n"
+        "a=ice-pwd:Q8x2v9W1pLmN4cR7tY6uZ0aB\r\na=ice-options:trickle\r\n"
+        "a=fingerprint:sha-256 4F:2A:91:0C:7D:33:E8:5B:A2:16:C4:9F:08:7E:D1:6A:3B:55:C0:94:1E:"
+        "AF:62:D8:07:B3:4C:E9:75:10:8D:2F\r\na=setup:actpass\r\n"
+    )
+    audio = (
+        "m=audio 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126\r\n" + transport + "a=mid:0\r\n"
+        "a=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level\r\n"
+        "a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time\r\n"
+        "a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01\r\n"
+        "a=extmap:4 urn:ietf:params:rtp-hdrext:sdes:mid\r\n"
+        "a=sendrecv\r\na=msid:9c7e5b1a-3f0d-4c8e-a2b6-7d1f0e9a4c35 5e2b8c71-0a9d-4f36-b1e7-c4d8a2f6e903\r\n"
+        "a=rtcp-mux\r\na=rtcp-rsize\r\na=rtpmap:111 opus/48000/2\r\na=rtcp-fb:111 transport-cc\r\n"
+        "a=fmtp:111 minptime=10;useinbandfec=1\r\na=rtpmap:63 red/48000/2\r\na=fmtp:63 111/111\r\n"
+        "a=rtpmap:9 G722/8000\r\na=rtpmap:0 PCMU/8000\r\na=rtpmap:8 PCMA/8000\r\na=rtpmap:13 CN/8000\r\n"
+        "a=rtpmap:110 telephone-event/48000\r\na=rtpmap:126 telephone-event/8000\r\n"
+        "a=ssrc:3904417613 cname:k9PqZ3sTb2Lx8VwQ\r\n"
+        "a=ssrc:3904417613 msid:9c7e5b1a-3f0d-4c8e-a2b6-7d1f0e9a4c35 5e2b8c71-0a9d-4f36-b1e7-c4d8a2f6e903\r\n"
+    )
+    payloads = [str(pt) for codec in _CHROME_VIDEO_CODECS for pt in (codec[0], codec[3])] + ['116', '117', '118']
+    codecs = []
+    for pt, rtpmap, fmtp, rtx in _CHROME_VIDEO_CODECS:
+        codecs.append(f"a=rtpmap:{pt} {rtpmap}\r\n")
+        codecs += [f"a=rtcp-fb:{pt} {fb}\r\n" for fb in ('goog-remb', 'transport-cc', 'ccm fir', 'nack', 'nack pli')]
+        if fmtp:
+            codecs.append(f"a=fmtp:{pt} {fmtp}\r\n")
+        codecs.append(f"a=rtpmap:{rtx} rtx/90000\r\na=fmtp:{rtx} apt={pt}\r\n")
+    video = (
+        f"m=video 9 UDP/TLS/RTP/SAVPF {' '.join(payloads)}\r\n" + transport + "a=mid:1\r\n"
+        "a=extmap:14 urn:ietf:params:rtp-hdrext:toffset\r\n"
+        "a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time\r\n"
+        "a=extmap:13 urn:3gpp:video-orientation\r\n"
+        "a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01\r\n"
+        "a=extmap:5 http://www.webrtc.org/experiments/rtp-hdrext/playout-delay\r\n"
+        "a=extmap:6 http://www.webrtc.org/experiments/rtp-hdrext/video-content-type\r\n"
+        "a=extmap:7 http://www.webrtc.org/experiments/rtp-hdrext/video-timing\r\n"
+        "a=extmap:8 http://www.webrtc.org/experiments/rtp-hdrext/color-space\r\n"
+        "a=extmap:4 urn:ietf:params:rtp-hdrext:sdes:mid\r\n"
+        "a=extmap:10 urn:ietf:params:rtp-hdrext:sdes:rtp-stream-id\r\n"
+        "a=extmap:11 urn:ietf:params:rtp-hdrext:sdes:repaired-rtp-stream-id\r\n"
+        "a=sendrecv\r\na=msid:9c7e5b1a-3f0d-4c8e-a2b6-7d1f0e9a4c35 b7d3f0e2-6c1a-48b9-9e54-2a0f8d7c1b6e\r\n"
+        "a=rtcp-mux\r\na=rtcp-rsize\r\n" + ''.join(codecs) +
+        "a=rtpmap:116 red/90000\r\na=rtpmap:117 rtx/90000\r\na=fmtp:117 apt=116\r\na=rtpmap:118 ulpfec/90000\r\n"
+        "a=ssrc-group:FID 1725038846 2861137702\r\n"
+        "a=ssrc:1725038846 cname:k9PqZ3sTb2Lx8VwQ\r\n"
+        "a=ssrc:1725038846 msid:9c7e5b1a-3f0d-4c8e-a2b6-7d1f0e9a4c35 b7d3f0e2-6c1a-48b9-9e54-2a0f8d7c1b6e\r\n"
+        "a=ssrc:2861137702 cname:k9PqZ3sTb2Lx8VwQ\r\n"
+        "a=ssrc:2861137702 msid:9c7e5b1a-3f0d-4c8e-a2b6-7d1f0e9a4c35 b7d3f0e2-6c1a-48b9-9e54-2a0f8d7c1b6e\r\n"
+    )
+    data = (
+        "m=application 9 UDP/DTLS/SCTP webrtc-datachannel\r\n" + transport + "a=mid:2\r\n"
+        "a=sctp-port:5000\r\na=max-message-size:262144\r\n"
+    )
+    return ("v=0\r\no=- 4611731400430051336 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n"
+            "a=group:BUNDLE 0 1 2\r\na=extmap-allow-mixed\r\na=msid-semantic: WMS 9c7e5b1a-3f0d-4c8e-a2b6-7d1f0e9a4c35\r\n"
+            + audio + video + data)
+
+
+def _sample_call():
+    """Messages one side sends during a typical call setup"""
+    sdp = _browser_offer()
+    messages = [
+        {'v': 1, 'type': 'join', 'room': 'A1B2', 'role': 'agent', 'token': 'A1B2-x' * 4, 'resume': False,
+         'encodings': list(ENCODINGS)},
+        {'v': 1, 'type': 'ready', 'room': 'A1B2'},
+        {'v': 1, 'type': 'offer', 'room': 'A1B2', 'offer': {'type': 'offer', 'sdp': sdp}},
+    ]
+    for i in range(12):
+        messages.append({'v': 1, 'type': 'ice-candidate', 'room': 'A1B2', 'candidate': {
+            'candidate': f'candidate:{842163049 + i} 1 udp 1677729535 203.0.113.{i} {50000 + i} typ srflx '
+                         f'raddr 192.168.1.{i} rport {50000 + i} generation 0 ufrag Xb3k network-cost 999',
+            'sdpMid': '0', 'sdpMLineIndex': 0, 'usernameFragment': 'Xb3k'}})
+    return messages
+
+
+def benchmark(iterations=2000):
+    """Compare bytes per call and relay decode/validate CPU per call for each encoding"""
+    messages = _sample_call()
+    results = {}
+    for encoding in ('json', 'cbor-zdict'):
+        frames = [encode_message(m, encoding) for m in messages]
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for frame in frames:
+                decode_message(frame, encoding)
+        decode_us = (time.perf_counter() - started) / iterations * 1e6
+        results[encoding] = {
+            'bytes_per_call': sum(len(f if isinstance(f, bytes) else f.encode()) for f in frames),
+            'relay_decode_us_per_call': round(decode_us, 1),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
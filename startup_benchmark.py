@@ -0,0 +1,129 @@
+"""Cold-start and per-rerun cost of the Streamlit app.
+
+Runs video_call_app.py under Streamlit's AppTest:
+- Cold start: time to import Streamlit and complete the first script run,
+  measured in a fresh interpreter each time.
+- Rerun cost: CPU and wall time per rerun for the landing page and for an
+  agent and a customer in a call, which are the reruns users trigger most.
+
+Results can be saved as a baseline and compared on later runs, so startup
+cost is tracked as features are added.
+
+Usage:
+    python startup_benchmark.py --save .harness/baselines/startup.json
+    python startup_benchmark.py --compare .harness/baselines/startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_call_app.py')
+REGRESSION_TOLERANCE = 0.15
+
+SCENARIOS = {
+    'landing': {},
+    'agent_in_call': {'room_code': 'A1B2', 'console_room_code': 'A1B2', 'reconnect_token': 'A1B2-token',
+                      'console_token': 'A1B2-token', 'in_call': True, 'is_agent': True},
+    'customer_in_call': {'room_code': 'A1B2', 'reconnect_token': 'A1B2-token', 'in_call': True, 'is_agent': False},
+}
+
+
+def cold_start_child():
+    """Runs in a fresh interpreter: import Streamlit, then do the first script run"""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+    AppTest.from_file(APP, default_timeout=60).run()
+    finished = time.perf_counter()
+    print(json.dumps({'import_ms': (imported - started) * 1000, 'first_run_ms': (finished - imported) * 1000}))
+
+
+def measure_cold_start(runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, __file__, '--cold-start-child'],
+                                check=True, capture_output=True, text=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+
+def measure_reruns(reruns):
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    for name, state in SCENARIOS.items():
+        app = AppTest.from_file(APP, default_timeout=60)
+        for key, value in state.items():
+            app.session_state[key] = value
+        app.run()  # Warm caches, as a returning user's rerun would
+
+        cpu, wall = [], []
+        for _ in range(reruns):
+            cpu_started, wall_started = time.process_time(), time.perf_counter()
+            app.run()
+            cpu.append((time.process_time() - cpu_started) * 1000)
+            wall.append((time.perf_counter() - wall_started) * 1000)
+        if app.exception:
+            raise RuntimeError(f"{name} rerun raised: {app.exception[0].message}")
+        results[name] = {
+            'rerun_cpu_ms': round(statistics.median(cpu), 2),
+            'rerun_wall_ms': round(statistics.median(wall), 2),
+            'rerun_wall_p95_ms': round(sorted(wall)[int(0.95 * (len(wall) - 1))], 2),
+        }
+    return results
+
+
+def compare(report, baseline):
+    """Return every timing more than REGRESSION_TOLERANCE slower than the baseline"""
+    regressions = []
+
+    def walk(current, previous, path):
+        for key, value in current.items():
+            old = previous.get(key)
+            if isinstance(value, dict) and isinstance(old, dict):
+                walk(value, old, path + [key])
+            elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old > 0:
+                if (value - old) / old > REGRESSION_TOLERANCE:
+                    regressions.append({'metric': '.'.join(path + [key]), 'baseline': old, 'current': value})
+
+    walk(report, baseline, [])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Streamlit cold start and rerun cost")
+    parser.add_argument('--cold-starts', type=int, default=5)
+    parser.add_argument('--reruns', type=int, default=50)
+    parser.add_argument('--save', help="Write results to this baseline file")
+    parser.add_argument('--compare', help="Compare against this baseline file; exit 1 on regression")
+    parser.add_argument('--cold-start-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        cold_start_child()
+        return
+
+    report = {'cold_start': measure_cold_start(args.cold_starts), 'reruns': measure_reruns(args.reruns)}
+    output = {'results': report}
+    if args.compare:
+        with open(args.compare) as f:
+            output['regressions'] = compare(report, json.load(f)['results'])
+    print(json.dumps(output, indent=2))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': report}, f, indent=2)
+    if output.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Drive the call page's low-power policy (power_policy.js) with synthetic stat traces."""
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+POLICY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'power_policy.js')
+
+DRIVER = """
+const policy = require(process.argv[1]);
+const trace = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+let state = policy.initialPowerState();
+const levels = [];
+for (const signals of trace) {
+    state = policy.nextPowerState(state, signals);
+    levels.push(state.level);
+}
+console.log(JSON.stringify(levels));
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason="needs node")
+
+
+def sample(reason='none', **overrides):
+    signals = {'qualityLimitationReason': reason, 'batteryLevel': 0.8, 'charging': False,
+               'hidden': False, 'agentReviewing': False, 'detailRequested': False}
+    signals.update(overrides)
+    return signals
+
+
+def levels(trace):
+    result = subprocess.run(['node', '-e', DRIVER, POLICY], input=json.dumps(trace),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_cpu_limits_step_down_and_recover_slowly():
+    trace = [sample('cpu')] * 4 + [sample()] * 20
+    assert levels(trace) == [0, 1, 1, 2] + [2] * 9 + [1] + [1] * 9 + [0]
+
+
+def test_cpu_step_down_stops_at_minimal():
+    assert levels([sample('cpu')] * 10)[-1] == 2
+
+
+def test_hidden_tab_cap_clears_on_the_next_visible_sample():
+    trace = [sample(hidden=True)] * 12 + [sample()] * 12
+    assert levels(trace) == [2] * 12 + [0] * 12
+
+
+def test_low_battery_cap_clears_when_charging():
+    trace = [sample(batteryLevel=0.05)] * 5 + [sample(batteryLevel=0.15)] * 3 \
+        + [sample(batteryLevel=0.15, charging=True)]
+    assert levels(trace) == [2] * 5 + [1] * 3 + [0]
+
+
+def test_cap_clearing_keeps_cpu_level():
+    trace = [sample('cpu')] * 2 + [sample('cpu', hidden=True)] + [sample('cpu')]
+    assert levels(trace) == [0, 1, 2, 2]
+    assert levels(trace + [sample()])[-1] == 2
+    assert levels([sample('cpu')] * 2 + [sample(hidden=True), sample()]) == [0, 1, 2, 1]
+
+
+def test_review_pauses_and_resumes_at_full_quality():
+    trace = [sample('cpu')] * 2 + [sample(agentReviewing=True)] * 3 + [sample()]
+    assert levels(trace) == [0, 1, 3, 3, 3, 0]
+
+
+def test_detail_request_forces_full_quality():
+    trace = [sample('cpu')] * 4 + [sample(hidden=True, detailRequested=True)]
+    assert levels(trace)[-1] == 0
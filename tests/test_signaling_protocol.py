@@ -0,0 +1,94 @@
+"""Hostile and malformed frames must be rejected with ProtocolError, never crash the relay."""
+import json
+import zlib
+
+import pytest
+
+from signaling_protocol import (MAX_FRAME_BYTES, SDP_DICTIONARY, ProtocolError, _cbor_encode, decode_message,
+                                encode_message)
+
+OFFER = {'type': 'offer', 'room': 'AB12', 'offer': {'type': 'offer', 'sdp': 'v=0\r\no=- 2 IN IP4 127.0.0.1\r\n'}}
+
+
+def cbor(value):
+    out = bytearray()
+    _cbor_encode(value, out)
+    return bytes(out)
+
+
+@pytest.mark.parametrize('encoding', ['json', 'cbor-zdict'])
+def test_round_trip(encoding):
+    assert decode_message(encode_message(OFFER, encoding), encoding) == OFFER
+
+
+@pytest.mark.parametrize('kind', [[1], {'a': 1}, None, 3, True])
+@pytest.mark.parametrize('encoding', ['json', 'cbor-zdict'])
+def test_non_text_type_is_rejected(kind, encoding):
+    frame = json.dumps({'type': kind, 'room': 'AB12'}) if encoding == 'json' else cbor({'type': kind, 'room': 'AB12'})
+    with pytest.raises(ProtocolError, match='unknown message type'):
+        decode_message(frame, encoding)
+
+
+def test_deeply_nested_json_is_rejected():
+    depth = (MAX_FRAME_BYTES - 16) // 2
+    with pytest.raises(ProtocolError):
+        decode_message('[' * depth + ']' * depth)
+    with pytest.raises(ProtocolError):
+        decode_message('{"type":"join","x":' + '[' * depth + ']' * depth + '}')
+
+
+def test_deeply_nested_cbor_is_rejected():
+    with pytest.raises(ProtocolError, match='nested'):
+        decode_message(b'\x81' * 1000 + b'\x00', 'cbor-zdict')
+
+
+@pytest.mark.parametrize('frame', ['', 'null', '"join"', '[]', '{"type":"join"', b'\xff\xfe\x00'])
+def test_malformed_json_is_rejected(frame):
+    with pytest.raises(ProtocolError):
+        decode_message(frame)
+
+
+@pytest.mark.parametrize('frame', [
+    b'',
+    b'\x1b\xff',                               # truncated length
+    b'\x63\xff\xfe\xfd',                       # text that is not UTF-8
+    b'\xa1\x01\x01',                           # non-text map key
+    b'\x9f\xff',                               # indefinite length
+    b'\x9b' + b'\xff' * 8,                     # huge container
+    b'\xfb\x00',                               # truncated float
+    b'\xa1\x64type\x64join\x00',               # trailing bytes
+])
+def test_malformed_cbor_is_rejected(frame):
+    with pytest.raises(ProtocolError):
+        decode_message(frame, 'cbor-zdict')
+
+
+def test_text_frame_on_binary_encoding_is_rejected():
+    with pytest.raises(ProtocolError):
+        decode_message(encode_message(OFFER, 'json'), 'cbor-zdict')
+
+
+def test_compressed_sdp_that_is_not_utf8_is_rejected():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=SDP_DICTIONARY)
+    sdp = compressor.compress(b'v=0\xff\xfe') + compressor.flush()
+    frame = cbor({'type': 'offer', 'room': 'AB12', 'offer': {'type': 'offer', 'sdp': sdp}})
+    with pytest.raises(ProtocolError):
+        decode_message(frame, 'cbor-zdict')
+
+
+def test_oversized_frame_is_rejected_before_parsing():
+    with pytest.raises(ProtocolError, match='too large'):
+        decode_message('[' * (MAX_FRAME_BYTES + 1))
+
+
+@pytest.mark.parametrize('message', [
+    {'type': 'join', 'room': 'AB12', 'role': 'agent', 'extra': 1},
+    {'type': 'join', 'room': 'ab12', 'role': 'agent'},
+    {'type': 'join', 'room': 'AB12', 'role': ['agent']},
+    {'type': 'join', 'room': 'AB12', 'role': 'agent', 'v': 99},
+    {'type': 'ice-candidate', 'room': 'AB12', 'candidate': {'candidate': 'x', 'sdpMLineIndex': [0]}},
+    {'type': 'offer', 'room': 'AB12', 'offer': {'type': 'offer', 'sdp': ['v=0']}},
+])
+def test_schema_violations_are_rejected(message):
+    with pytest.raises(ProtocolError):
+        decode_message(json.dumps(message))
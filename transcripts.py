@@ -0,0 +1,332 @@
+"""Transcribe stored KYC recordings and search them by phrase.
+
+A batch job over the RecordingStore. Each recording's audio is streamed
+through ffmpeg as 16 kHz mono PCM and transcribed in 30 second windows, with
+a small overlap so no word is cut at a window edge. Transcription uses a local
+CPU-only Whisper model and runs on a process pool, one model per worker. Every
+word goes into an inverted index (term -> recording, position, start, end) in
+SQLite, so a phrase search returns the offsets reviewers can jump to.
+
+Indexing is incremental: recordings already in the index are skipped, and
+--watch keeps polling the store for new ones.
+
+Requires ffmpeg on PATH and: pip install faster-whisper
+
+Usage:
+    python transcripts.py index kyc_store --workers 4
+    python transcripts.py index kyc_store --watch 60
+    python transcripts.py search kyc_store "I give my consent"
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from recording_crypto import load_master_key
+from recording_postprocess import check_tools
+from recording_store import RecordingStore
+
+SAMPLE_RATE = 16000
+WINDOW_SECONDS = 30.0   # Whisper's native context length
+OVERLAP_SECONDS = 1.0   # Audio carried into the next window so edge words are heard whole
+DEFAULT_MODEL = 'base'
+SNIPPET_WORDS = 8
+
+TOKEN = re.compile(r"\w+(?:'\w+)?")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    object_id TEXT PRIMARY KEY,
+    room_code TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    duration REAL NOT NULL,
+    words INTEGER NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_created ON transcripts (created_at);
+
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    word TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS postings_term ON postings (term, object_id, position);
+CREATE INDEX IF NOT EXISTS postings_position ON postings (object_id, position);
+"""
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN.findall(text)]
+
+
+# Per-process state for pool workers, set up once by _init_worker
+_worker_store = None
+_worker_model = None
+
+
+def _init_worker(store_root, model_name):
+    global _worker_store, _worker_model
+    from faster_whisper import WhisperModel
+    _worker_store = RecordingStore(store_root, master_key=load_master_key())
+    # One thread per process: the pool provides the parallelism
+    _worker_model = WhisperModel(model_name, device='cpu', compute_type='int8', cpu_threads=1)
+
+
+def _pcm_windows(chunks):
+    """Decode a recording to 16 kHz mono PCM and yield (offset seconds, float32 samples) windows"""
+    import numpy as np
+
+    decoder = subprocess.Popen(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+         '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+
+    def feed():
+        try:
+            for chunk in chunks:
+                decoder.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            decoder.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    window_bytes = int(WINDOW_SECONDS * SAMPLE_RATE) * 2
+    overlap = int(OVERLAP_SECONDS * SAMPLE_RATE)
+    carry = np.zeros(0, dtype=np.float32)
+    offset = 0.0
+    while True:
+        data = decoder.stdout.read(window_bytes)
+        if not data:
+            break
+        samples = np.concatenate([carry, np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0])
+        yield offset, samples
+        carry = samples[-overlap:]
+        offset += (len(samples) - len(carry)) / SAMPLE_RATE
+
+    feeder.join()
+    if decoder.wait():
+        raise subprocess.CalledProcessError(decoder.returncode, 'ffmpeg')
+
+
+def transcribe_recording(object_id):
+    """Transcribe one stored recording; returns (object_id, duration, [(word, start, end)], seconds)"""
+    started = time.perf_counter()
+    words = []
+    tail = []       # Words in the current window's overlap, replaced if the next window hears them whole
+    boundary = 0.0  # Words starting before this were taken from the previous window
+    duration = 0.0
+    for offset, samples in _pcm_windows(_worker_store.read(object_id)):
+        segments, _ = _worker_model.transcribe(samples, beam_size=1, word_timestamps=True,
+                                               vad_filter=True, condition_on_previous_text=False)
+        duration = offset + len(samples) / SAMPLE_RATE
+        next_boundary = duration - OVERLAP_SECONDS
+        tail = []
+        for segment in segments:
+            for word in segment.words:
+                start = round(offset + word.start, 2)
+                if start < boundary:
+                    continue
+                entry = (word.word.strip(), start, round(offset + word.end, 2))
+                (words if start < next_boundary else tail).append(entry)
+        boundary = next_boundary
+    words.extend(tail)
+    return object_id, duration, words, time.perf_counter() - started
+
+
+class TranscriptIndex:
+    """Inverted index of transcribed words with their offsets"""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def indexed_ids(self):
+        return {row[0] for row in self._db.execute('SELECT object_id FROM transcripts')}
+
+    def add(self, recording, duration, words, seconds):
+        """Index one recording's words in a single transaction"""
+        rows = []
+        position = 0
+        for word, start, end in words:
+            for term in tokenize(word):
+                rows.append((term, recording['id'], position, start, end, word))
+                position += 1
+        with self._db:
+            self._db.execute('DELETE FROM postings WHERE object_id = ?', (recording['id'],))
+            self._db.executemany(
+                'INSERT INTO postings (term, object_id, position, start, end, word) VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+            self._db.execute(
+                'INSERT OR REPLACE INTO transcripts (object_id, room_code, name, created_at, duration, words, seconds) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (recording['id'], recording['room_code'], recording['name'], recording['created_at'],
+                 duration, position, seconds)
+            )
+
+    def remove(self, object_id):
+        with self._db:
+            self._db.execute('DELETE FROM postings WHERE object_id = ?', (object_id,))
+            self._db.execute('DELETE FROM transcripts WHERE object_id = ?', (object_id,))
+
+    def search(self, phrase, room_code=None, limit=50):
+        """Return where the phrase is spoken: recording, start/end offsets and surrounding words"""
+        terms = tokenize(phrase)
+        if not terms:
+            return []
+
+        # Find the rarest term, counting each one only up to the rarest count seen so far,
+        # so a common word like "the" costs no more than the rare word next to it
+        anchor, rarest = 0, None
+        for i, term in enumerate(terms):
+            cap = -1 if rarest is None else rarest
+            count = self._db.execute(
+                'SELECT COUNT(*) FROM (SELECT 1 FROM postings WHERE term = ? LIMIT ?)', (term, cap)
+            ).fetchone()[0]
+            if rarest is None or count < rarest:
+                anchor, rarest = i, count
+            if not rarest:
+                return []
+
+        # Each occurrence of the rarest term is a candidate; check it by reading the few
+        # positions around it through the (object_id, position) index
+        candidates = self._db.execute(
+            'SELECT object_id, position FROM postings WHERE term = ? ORDER BY object_id, position', (terms[anchor],)
+        ).fetchall()
+        recordings = {}
+        matches = []
+        for object_id, anchor_position in candidates:
+            position = anchor_position - anchor
+            if object_id not in recordings:
+                recordings[object_id] = self._db.execute(
+                    'SELECT room_code, name, created_at FROM transcripts WHERE object_id = ?', (object_id,)
+                ).fetchone()
+            info = recordings[object_id]
+            if info is None or (room_code is not None and info[0] != room_code):
+                continue
+            context = self._db.execute(
+                'SELECT position, start, end, word, term FROM postings WHERE object_id = ? AND position BETWEEN ? AND ? '
+                'ORDER BY position',
+                (object_id, position - SNIPPET_WORDS, position + len(terms) - 1 + SNIPPET_WORDS)
+            ).fetchall()
+            hit = [row for row in context if position <= row[0] < position + len(terms)]
+            if [row[4] for row in hit] != terms:
+                continue
+            matches.append({
+                'object_id': object_id,
+                'room_code': info[0],
+                'name': info[1],
+                'created_at': info[2],
+                'start': hit[0][1],
+                'end': hit[-1][2],
+                'snippet': ' '.join(row[3] for row in context),
+            })
+            if len(matches) >= limit:
+                break
+        return matches
+
+    def close(self):
+        self._db.close()
+
+
+def index_pending(store_root, index, model_name=DEFAULT_MODEL, workers=None):
+    """Transcribe recordings not yet in the index; returns (failures, stats)"""
+    check_tools()
+    store = RecordingStore(store_root, master_key=load_master_key())
+    try:
+        recordings = {r['id']: r for r in store.find(kind='recording')}
+    finally:
+        store.close()
+
+    # Transcripts follow their recordings out of retention
+    done = index.indexed_ids()
+    for object_id in done - recordings.keys():
+        index.remove(object_id)
+    pending = {object_id: r for object_id, r in recordings.items() if object_id not in done}
+
+    workers = workers or os.cpu_count() or 1
+    failures = []
+    media_seconds = 0.0
+    indexed = 0
+    started = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(store_root, model_name)) as pool:
+            futures = {pool.submit(transcribe_recording, object_id): object_id for object_id in pending}
+            for future in as_completed(futures):
+                try:
+                    object_id, duration, words, seconds = future.result()
+                except Exception as err:
+                    # One unreadable recording or crashed worker must not abort the rest of the batch
+                    failures.append((futures[future], f"{type(err).__name__}: {err}"))
+                    continue
+                # Written as each recording finishes, so an interrupted run resumes where it stopped
+                index.add(pending[object_id], duration, words, seconds)
+                media_seconds += duration
+                indexed += 1
+    elapsed = time.perf_counter() - started
+
+    stats = {
+        'indexed': indexed,
+        'failed': len(failures),
+        'workers': workers,
+        'elapsed_seconds': round(elapsed, 3),
+        'media_seconds': round(media_seconds, 1),
+        # Above 1.0 means each core transcribes faster than real time
+        'realtime_factor_per_core': round(media_seconds / elapsed / workers, 2) if indexed else 0.0,
+    }
+    return failures, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe KYC recordings and search transcripts")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = commands.add_parser('index', help="Transcribe recordings not yet indexed")
+    index_parser.add_argument('store', help="RecordingStore root directory")
+    index_parser.add_argument('--index', help="Index database (default: <store>/transcripts.sqlite)")
+    index_parser.add_argument('--model', default=DEFAULT_MODEL, help="Whisper model size or path")
+    index_parser.add_argument('--workers', type=int, default=None, help="Pool size (default: CPU count)")
+    index_parser.add_argument('--watch', type=float, default=None, help="Keep polling every N seconds")
+
+    search_parser = commands.add_parser('search', help="Find where a phrase is spoken")
+    search_parser.add_argument('store', help="RecordingStore root directory")
+    search_parser.add_argument('phrase')
+    search_parser.add_argument('--index', help="Index database (default: <store>/transcripts.sqlite)")
+    search_parser.add_argument('--room', default=None, help="Only this room code")
+    search_parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    index = TranscriptIndex(args.index or os.path.join(args.store, 'transcripts.sqlite'))
+    try:
+        if args.command == 'search':
+            for match in index.search(args.phrase, room_code=args.room, limit=args.limit):
+                print(json.dumps(match, ensure_ascii=False))
+            return
+
+        while True:
+            failures, stats = index_pending(args.store, index, args.model, args.workers)
+            for object_id, error in failures:
+                print(f"FAILED {object_id}: {error}")
+            print(json.dumps(stats))
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
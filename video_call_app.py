@@ -1,8 +1,11 @@
 import streamlit as st
-import random
-import string
-import base64
-from datetime import datetime
+import json
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from rooms import generate_room_code, generate_reconnect_token
 
 # Page config
 st.set_page_config(
@@ -11,95 +14,121 @@ st.set_page_config(
     layout="wide"
 )
 
-def generate_room_code():
-    """Generate a simple 4-character room code"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
+# Initialize session state with persistence. Each default is a factory, so every
+# session gets its own lists and sets.
+SESSION_DEFAULTS = {
+    'room_code': str,
+    'in_call': bool,
+    'is_agent': bool,
+    'snapshots': list,
+    'reconnect_token': str,
+    'snapshot_file_ids': set,
+    'console_room_code': str,
+    'console_token': str,
+    'console_switched_room': str,
+}
+for key, factory in SESSION_DEFAULTS.items():
+    if key not in st.session_state:
+        st.session_state[key] = factory()
 
-# Initialize session state with persistence
-if 'room_code' not in st.session_state:
-    st.session_state.room_code = ''
-if 'in_call' not in st.session_state:
-    st.session_state.in_call = False
-if 'is_agent' not in st.session_state:
-    st.session_state.is_agent = False
-if 'snapshots' not in st.session_state:
-    st.session_state.snapshots = []
+# Everything collected about one customer, dropped when the agent moves on
+CUSTOMER_STATE = ('snapshots', 'snapshot_file_ids')
 
-# Signaling server
-SIGNALING_SERVER = "wss://signaling-server-2g74.onrender.com"
 
-def main():
-    st.title("🎥 Video KYC Application")
-    
-    # Instructions
-    with st.expander("ℹ️ How to Use"):
-        st.markdown("""
-        **For Agents:**
-        1. Click "Start KYC Session" to create a room
-        2. Share the room code with customer
-        3. Click "Start Camera" when customer joins
-        4. Use "Capture KYC Photo" to take customer snapshots
-        5. Use "Start Recording" to record the entire call
-        
-        **For Customers:**
-        1. Enter the room code provided by agent
-        2. Click "Join Session"
-        3. Click "Start Camera" to begin KYC
-        
-        **Features:**
-        - Click on video to switch between large/small view
-        - Flip camera button cycles through all available cameras
-        - Agent can capture and save customer snapshots
-        - Agent can record the entire call with both video and audio
-        """)
-    
-    st.markdown("---")
-    
-    if not st.session_state.in_call:
-        # Main menu
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("👨‍💼 Agent Portal")
-            if st.button("🚀 Start KYC Session", type="primary", use_container_width=True):
-                room_code = generate_room_code()
-                st.session_state.room_code = room_code
-                st.session_state.in_call = True
-                st.session_state.is_agent = True
-                st.rerun()
-        
-        with col2:
-            st.subheader("👤 Customer Portal")
-            with st.form("join_form"):
-                room_input = st.text_input("Enter Room Code", max_chars=4, placeholder="e.g., A1B2")
-                if st.form_submit_button("📞 Join Session", type="secondary", use_container_width=True):
-                    if room_input:
-                        st.session_state.room_code = room_input.upper()
-                        st.session_state.in_call = True
-                        st.session_state.is_agent = False
-                        st.rerun()
-    else:
-        # Video call interface
-        role = "Agent" if st.session_state.is_agent else "Customer"
-        st.success(f"✅ **Room: {st.session_state.room_code}** | You are: {role}")
-        
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            if st.session_state.is_agent:
-                st.info(f"💡 Share this room code with customer: **{st.session_state.room_code}**")
-            else:
-                st.info(f"📱 Connected to KYC session: **{st.session_state.room_code}**")
-        with col2:
-            if st.button("❌ End Session", type="primary", use_container_width=True):
-                st.session_state.in_call = False
-                st.session_state.room_code = ''
-                st.session_state.is_agent = False
-                st.rerun()
-        
-        st.markdown("---")
-        
-        # Real-time video call interface
-        st.components.v1.html(f"""
+def reset_customer_state():
+    for key in CUSTOMER_STATE:
+        st.session_state[key] = SESSION_DEFAULTS[key]()
+
+
+@st.cache_resource
+def load_config():
+    """Process-wide settings, read once per server process rather than on every rerun"""
+    from signaling_protocol import PROTOCOL_VERSION
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'power_policy.js'), encoding='utf-8') as f:
+        power_policy = f.read()
+    return {
+        'signaling_server': os.environ.get("KYC_SIGNALING_SERVER", "wss://signaling-server-2g74.onrender.com"),
+        'protocol_version': PROTOCOL_VERSION,
+        # Also save each party's audio as its own file, for transcription
+        'record_separate_audio': os.environ.get("KYC_RECORD_SEPARATE_AUDIO", "").lower() in ('1', 'true', 'yes'),
+        # Our own TURN server for the pre-call uplink probe; without one the probe is skipped
+        'probe_turn_server': {
+            'urls': os.environ["KYC_PROBE_TURN_URL"],
+            'username': os.environ.get("KYC_PROBE_TURN_USERNAME", ""),
+            'credential': os.environ.get("KYC_PROBE_TURN_CREDENTIAL", ""),
+        } if os.environ.get("KYC_PROBE_TURN_URL") else None,
+        'power_policy': power_policy,
+    }
+
+
+@dataclass
+class AppMetrics:
+    rerun_seconds: object
+    active_rooms: object
+    session_seconds: object
+    ingested_bytes: object
+
+
+@st.cache_resource
+def app_metrics():
+    """Register the app's series once per process and start the metrics endpoint"""
+    import metrics
+    # Binding and importing http.server happen off the first run's critical path
+    threading.Thread(target=metrics.start_http_server, name='metrics-http', daemon=True).start()
+    return AppMetrics(
+        rerun_seconds=metrics.histogram('kyc_app_rerun_seconds', 'Time to run main() for one Streamlit rerun'),
+        active_rooms=metrics.gauge('kyc_active_rooms', 'Agent KYC sessions currently open'),
+        session_seconds=metrics.histogram('kyc_session_duration_seconds', 'Length of finished agent sessions',
+                                          buckets=metrics.DURATION_BUCKETS),
+        ingested_bytes=metrics.counter('kyc_ingested_bytes_total', 'Bytes of snapshots and recordings ingested',
+                                       ('kind',)),
+    )
+
+
+class RoomLease:
+    """Counts an agent's room in active_rooms until it is released, or until Streamlit
+    drops the session (a tab closed without End Session) and the lease is collected"""
+
+    def __init__(self, app):
+        self._app = app
+        self._started_at = time.monotonic()
+        app.active_rooms.inc()
+        self._finalizer = weakref.finalize(self, app.active_rooms.dec)
+
+    def release(self):
+        if self._finalizer.alive:
+            self._app.session_seconds.observe(time.monotonic() - self._started_at)
+            self._finalizer()
+
+
+def open_room_lease():
+    """Release the session's current room, if any, and count a new one"""
+    close_room_lease()
+    st.session_state.room_lease = RoomLease(app_metrics())
+
+
+def close_room_lease():
+    lease = st.session_state.pop('room_lease', None)
+    if lease is not None:
+        lease.release()
+
+
+# Stand-ins for the per-session values in the cached call page template
+ROOM_CODE_SLOT = '__KYC_ROOM_CODE__'
+TOKEN_SLOT = '__KYC_RECONNECT_TOKEN__'
+
+
+def call_page_html(room_code, token, is_agent):
+    """The embedded call page for one session: the shared template with its room and token filled in"""
+    return call_page_template(is_agent).replace(ROOM_CODE_SLOT, room_code).replace(TOKEN_SLOT, token)
+
+
+@st.cache_resource(show_spinner=False)
+def call_page_template(is_agent):
+    """Build the ~100 KB call page once per role and process, shared by every session"""
+    config = load_config()
+    room_code, token = ROOM_CODE_SLOT, TOKEN_SLOT
+    return f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -190,6 +219,38 @@ def main():
             backdrop-filter: blur(10px);
             z-index: 10;
         }}
+        .media-state {{
+            position: absolute;
+            top: 55px;
+            left: 15px;
+            background: rgba(239, 68, 68, 0.85);
+            color: white;
+            padding: 6px 14px;
+            border-radius: 15px;
+            font-size: 12px;
+            font-weight: 600;
+            z-index: 10;
+            display: none;
+        }}
+        .media-state.show {{
+            display: block;
+        }}
+        .quality-badge {{
+            position: absolute;
+            top: 50px;
+            right: 15px;
+            background: rgba(0,0,0,0.85);
+            color: white;
+            padding: 6px 14px;
+            border-radius: 15px;
+            font-size: 12px;
+            font-weight: 600;
+            z-index: 10;
+            display: none;
+        }}
+        .quality-badge.show {{
+            display: block;
+        }}
         .status {{
             position: absolute;
             top: 15px;
@@ -259,6 +320,12 @@ def main():
         .btn-record {{
             background: linear-gradient(135deg, #fa709a 0%, #fee140 100%);
         }}
+        .btn-document {{
+            background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
+        }}
+        .btn-document.active {{
+            background: linear-gradient(135deg, #0ea5e9 0%, #0369a1 100%);
+        }}
         .btn-record.recording {{
             background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%);
             animation: pulse 2s infinite;
@@ -277,6 +344,13 @@ def main():
             background: rgba(0,0,0,0.3);
             border-radius: 10px;
         }}
+        .received-documents a {{
+            display: block;
+            text-align: center;
+            color: white;
+            margin-bottom: 10px;
+            font-size: 14px;
+        }}
         .snapshot-preview {{
             position: fixed;
             top: 50%;
@@ -379,12 +453,15 @@ def main():
 </head>
 <body>
     <div id="connectionStatus">🔄 Connecting to server...</div>
+    {('<div class="received-documents" id="receivedDocuments"></div>' if is_agent else '')}
     
     <div class="video-container" id="videoContainer">
         <video id="remoteVideo" autoplay playsinline></video>
         <video id="localVideo" autoplay muted playsinline onclick="switchView()"></video>
         <div class="video-label" id="mainLabel">Customer</div>
         <div class="status" id="connectionState">Waiting...</div>
+        <div class="media-state" id="remoteMediaState"></div>
+        <div class="quality-badge" id="qualityBadge"></div>
     </div>
 
     <div class="controls">
@@ -404,8 +481,11 @@ def main():
             <span>🔄</span>
             <span>Flip Camera</span>
         </button>
-        {('<button class="btn btn-capture" id="captureBtn" onclick="captureSnapshot()" disabled><span>📸</span><span>Capture Photo</span></button>' if st.session_state.is_agent else '')}
-        {('<button class="btn btn-record" id="recordBtn" onclick="toggleRecording()" disabled><span>⏺️</span><span>Start Recording</span></button>' if st.session_state.is_agent else '')}
+        {('<button class="btn btn-capture" id="captureBtn" onclick="captureSnapshot()" disabled><span>📸</span><span>Capture Photo</span></button>' if is_agent else '')}
+        {('<button class="btn btn-record" id="recordBtn" onclick="toggleRecording()" disabled><span>⏺️</span><span>Start Recording</span></button>' if is_agent else '')}
+        {('<button class="btn btn-document" id="docModeBtn" onclick="toggleDocumentMode()" disabled><span>📄</span><span>Document Mode</span></button>' if is_agent else '')}
+        {('<button class="btn btn-document" id="reviewBtn" onclick="toggleReviewPause()" disabled><span>⏸️</span><span>Reviewing Docs</span></button>' if is_agent else '')}
+        {('' if is_agent else '<button class="btn btn-document" id="uploadBtn" onclick="chooseDocument()" disabled><span>📤</span><span>Send Document</span></button><input type="file" id="documentInput" accept="image/*,application/pdf" multiple hidden onchange="uploadDocument(this)">')}
     </div>
 
     <div class="overlay" id="overlay" onclick="closePreview()"></div>
@@ -419,14 +499,132 @@ def main():
         </div>
     </div>
 
+    <script id="frameQualityWorker" type="javascript/worker">
+        // Scores downscaled frames for sharpness, exposure and face presence off the main thread
+        const faceDetector = typeof FaceDetector !== 'undefined'
+            ? new FaceDetector({{ fastMode: true, maxDetectedFaces: 1 }})
+            : null;
+        const SHARPNESS_REFERENCE = 300;  // Laplacian variance of a crisp 320px-wide frame
+
+        function scoreLuma(imageData) {{
+            const {{ width, height, data }} = imageData;
+            const luma = new Float32Array(width * height);
+            const histogram = new Uint32Array(256);
+            let sum = 0, clipped = 0;
+            for (let i = 0, p = 0; p < luma.length; i += 4, p++) {{
+                const y = 0.299 * data[i] + 0.587 * data[i + 1] + 0.114 * data[i + 2];
+                luma[p] = y;
+                histogram[y | 0]++;
+                sum += y;
+                if (y < 16 || y > 240) clipped++;
+            }}
+            
+            // Histogram spread: distance between the 5th and 95th luma percentiles
+            let low = -1, high = 255, seen = 0;
+            for (let v = 0; v < 256; v++) {{
+                seen += histogram[v];
+                if (low < 0 && seen >= luma.length * 0.05) low = v;
+                if (seen >= luma.length * 0.95) {{
+                    high = v;
+                    break;
+                }}
+            }}
+            
+            // Variance of the 4-neighbour Laplacian: blurry frames have little high-frequency energy
+            let lapSum = 0, lapSqSum = 0, count = 0;
+            for (let y = 1; y < height - 1; y++) {{
+                for (let x = 1; x < width - 1; x++) {{
+                    const p = y * width + x;
+                    const lap = 4 * luma[p] - luma[p - 1] - luma[p + 1] - luma[p - width] - luma[p + width];
+                    lapSum += lap;
+                    lapSqSum += lap * lap;
+                    count++;
+                }}
+            }}
+            const lapMean = lapSum / count;
+            const lapVariance = lapSqSum / count - lapMean * lapMean;
+            
+            const meanLuma = sum / luma.length / 255;
+            const clippedRatio = clipped / luma.length;
+            return {{
+                sharpness: Math.min(1, lapVariance / SHARPNESS_REFERENCE),
+                exposure: Math.max(0, 1 - Math.abs(meanLuma - 0.5) * 2 - clippedRatio),
+                contrast: Math.max(0, high - low) / 255
+            }};
+        }}
+
+        self.onmessage = async function(event) {{
+            const {{ id, timestamp, bitmap }} = event.data;
+            try {{
+                const canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+                const ctx = canvas.getContext('2d', {{ willReadFrequently: true }});
+                ctx.drawImage(bitmap, 0, 0);
+                const scores = scoreLuma(ctx.getImageData(0, 0, bitmap.width, bitmap.height));
+                
+                let face = null;
+                if (faceDetector) {{
+                    const faces = await faceDetector.detect(bitmap);
+                    face = faces.length > 0
+                        ? Math.min(1, faces[0].boundingBox.width * faces[0].boundingBox.height / (bitmap.width * bitmap.height) * 8)
+                        : 0;
+                }}
+                self.postMessage({{ id, timestamp, face, ...scores }});
+            }} catch (err) {{
+                self.postMessage({{ id, timestamp, error: err.message }});
+            }} finally {{
+                bitmap.close();
+            }}
+        }};
+    </script>
+    <script id="speakerMixerWorklet" type="javascript/worklet">
+        // Mixes agent and customer audio with slow per-speaker gain normalization
+        const TARGET_RMS = 0.08;
+        const SPEECH_GATE = 0.01;   // Below this the speaker is silent; keep the last level
+        const MAX_GAIN = 4;
+
+        class SpeakerMixer extends AudioWorkletProcessor {{
+            constructor() {{
+                super();
+                this.levels = [TARGET_RMS, TARGET_RMS];
+                this.gains = [1, 1];
+            }}
+
+            process(inputs, outputs) {{
+                const out = outputs[0][0];
+                if (!out) return true;
+                out.fill(0);
+                
+                for (let speaker = 0; speaker < inputs.length; speaker++) {{
+                    const channel = inputs[speaker][0];
+                    if (!channel) continue;
+                    
+                    let energy = 0;
+                    for (let i = 0; i < channel.length; i++) energy += channel[i] * channel[i];
+                    const rms = Math.sqrt(energy / channel.length);
+                    if (rms > SPEECH_GATE) {{
+                        this.levels[speaker] = this.levels[speaker] * 0.995 + rms * 0.005;
+                    }}
+                    
+                    const targetGain = Math.min(MAX_GAIN, TARGET_RMS / Math.max(this.levels[speaker], 1e-4));
+                    this.gains[speaker] += (targetGain - this.gains[speaker]) * 0.01;
+                    const gain = this.gains[speaker];
+                    for (let i = 0; i < channel.length; i++) out[i] += channel[i] * gain;
+                }}
+                
+                for (let i = 0; i < out.length; i++) out[i] = Math.tanh(out[i]);  // Soft clip
+                return true;
+            }}
+        }}
+        registerProcessor('speaker-mixer', SpeakerMixer);
+    </script>
     <script>
         let localVideo = document.getElementById('localVideo');
         let remoteVideo = document.getElementById('remoteVideo');
         let localStream = null;
         let peerConnection = null;
         let ws = null;
-        let isAgent = {str(st.session_state.is_agent).lower()};
-        let roomCode = '{st.session_state.room_code}';
+        let isAgent = {str(is_agent).lower()};
+        let roomCode = '{room_code}';
         let isMuted = false;
         let isVideoOff = false;
         let isLargeView = false;
@@ -437,11 +635,124 @@ def main():
         let mediaRecorder = null;
         let recordedChunks = [];
         let isRecording = false;
+        let recordingAudio = null;
+        let speakerRecorders = [];
+        const SPEECH_MIX_BITRATE = 48000;      // Opus is transparent for speech well below this
+        const SPEECH_TRACK_BITRATE = 32000;
+        const RECORD_SEPARATE_AUDIO = {str(config['record_separate_audio']).lower()};   // Per-party audio files, from config
+        
+        // Reconnection state
+        let reconnectToken = '{token}' || sessionStorage.getItem('reconnectToken') || '';
+        const consoleToken = '{token}';  // Names this console's room-switch channel; fixed for its lifetime
+        let hasJoined = false;
+        let signalingRetries = 0;
+        let signalingReconnectTimer = null;
+        let pendingSignaling = [];
+        let iceRestartAttempts = 0;
+        let iceRestartTimer = null;
+        let restartIceOnReconnect = false;    // Set when ICE must restart once signaling is back
+        const SIGNALING_BASE_DELAY = 250;     // First reconnect after 250ms
+        const SIGNALING_MAX_DELAY = 10000;    // Never wait more than 10s between attempts
+        const ICE_RESTART_BASE_DELAY = 200;
+        const ICE_RESTART_MAX_DELAY = 8000;
+        const DISCONNECT_GRACE_MS = 700;      // 'disconnected' often heals on its own
+        const SIGNALING_PROTOCOL_VERSION = {config['protocol_version']};
+        
+        // Codec policy: phones favour hardware H.264, desktops favour VP9/AV1 when efficient
+        const isMobileDevice = navigator.userAgentData
+            ? navigator.userAgentData.mobile
+            : /Android|iPhone|iPad|iPod|Mobile/i.test(navigator.userAgent);
+        const MOBILE_CODEC_ORDER = ['video/H264', 'video/VP8', 'video/VP9', 'video/AV1'];
+        const DESKTOP_CODEC_ORDER = ['video/VP9', 'video/AV1', 'video/H264', 'video/VP8'];
+        const HEAVY_CODECS = ['video/VP9', 'video/AV1'];
+        
+        // Sender settings per KYC phase. Document mode trades frame rate for sharp text:
+        // the same bitrate spread over fewer frames gives each frame more bits.
+        const VIDEO_MODES = {{
+            face: {{
+                contentHint: '',
+                degradationPreference: 'balanced',
+                maxBitrate: 2500000,  // 2.5 Mbps for HD quality
+                maxFramerate: 30
+            }},
+            document: {{
+                contentHint: 'detail',
+                degradationPreference: 'maintain-resolution',
+                maxBitrate: 2500000,
+                maxFramerate: 10
+            }}
+        }};
+        let videoMode = 'face';        // Mode of our own outgoing video
+        let remoteVideoMode = 'face';  // Mode the customer last confirmed (agent only)
+        const VIDEO_MODE_ACK_TIMEOUT_MS = 5000;
+        let videoModeAckTimer = null;
+        
+        // Starting quality picked by the pre-call probe; caps every video mode
+        const QUALITY_TIERS = [
+            {{ name: 'HD', width: 1280, height: 720, frameRate: 30, maxBitrate: 2500000 }},
+            {{ name: 'SD', width: 960, height: 540, frameRate: 30, maxBitrate: 1200000 }},
+            {{ name: 'Low', width: 640, height: 360, frameRate: 24, maxBitrate: 600000 }}
+        ];
+        const PROBE_DURATION_MS = 1000;
+        const PROBE_MIN_LOOPBACK_MBPS = 40;  // Slower local SCTP throughput points to a weak CPU
+        const PROBE_CONNECT_TIMEOUT_MS = 1500;  // A relay slower than this only delays the camera
+        const PROBE_TURN_SERVER = {json.dumps(config['probe_turn_server'])};  // Ours, from config; null skips the uplink probe
+        let callTier = QUALITY_TIERS[0];
+        let cameraCapabilities = null;
+        
+        // Low-power mode for long sessions on phones (customer only); policy in power_policy.js
+{config['power_policy']}
+        let powerState = initialPowerState();
+        let agentReviewing = false;
+        let batteryManager = null;
+        
+        // Peer-to-peer data channels for control messages and file transfers
+        let controlChannel = null;
+        let fileChannel = null;
+        let incomingFile = null;
+        let fileSendQueue = Promise.resolve();
+        let photoRequestTimer = null;
+        let pendingPhotoId = null;                      // Only the newest photo request is shown
+        const FILE_CHUNK_SIZE = 16 * 1024;              // Safe SCTP message size across browsers
+        const FILE_BUFFER_HIGH_WATER = 256 * 1024;      // Pause sending above this
+        const FILE_BUFFER_LOW_WATER = 64 * 1024;        // Resume once drained below this
+        const PHOTO_REQUEST_TIMEOUT_MS = 8000;
+        const OBJECT_URL_LIFETIME_MS = 60000;           // Long enough for the download to start
+        const MAX_TRANSFER_BYTES = 20 * 1024 * 1024;    // Larger transfers are refused before buffering
+        // What the agent accepts, whatever the customer's page claims: MIME type -> extensions
+        const ACCEPTED_FILE_TYPES = {{
+            'image/jpeg': ['jpg', 'jpeg'],
+            'image/png': ['png'],
+            'image/webp': ['webp'],
+            'image/heic': ['heic', 'heif'],
+            'application/pdf': ['pdf']
+        }};
+        let receivedDocumentUrls = [];
+        
+        // Live frame quality scoring of the customer's video (agent only)
+        const QUALITY_SAMPLE_INTERVAL_MS = 500;  // 2 fps is plenty for framing feedback
+        const QUALITY_FRAME_WIDTH = 320;
+        const QUALITY_QUEUE_LIMIT = 2;           // Older frames are dropped, never queued
+        const QUALITY_WORKERS = Math.min(2, Math.max(1, (navigator.hardwareConcurrency || 2) - 2));
+        let qualityWorkers = [];
+        let qualityQueue = [];
+        let qualityFrameId = 0;
+        let lastQualitySample = 0;
+        let lastQualityTimestamp = 0;
+        let latestQuality = null;
+        let qualityMonitorTimer = null;
+        
+        // Rolling buffer of recent customer frames for best-frame snapshots. Frames are kept at
+        // full resolution so the saved snapshot is too; only a small copy is scored. The count
+        // bounds memory: eight 1080p frames are ~64 MB.
+        const FRAME_BUFFER_SIZE = 8;             // ~4 s at the 2 fps sample rate
+        let frameBuffer = [];
         
         // Persist session state
         sessionStorage.setItem('roomCode', roomCode);
         sessionStorage.setItem('isAgent', isAgent);
         sessionStorage.setItem('inCall', 'true');
+        sessionStorage.setItem('reconnectToken', reconnectToken);
 
         const configuration = {{
             iceServers: [
@@ -472,8 +783,37 @@ def main():
             iceTransportPolicy: 'all'
         }};
 
+        // Exponential backoff with jitter so many clients don't reconnect in lockstep
+        function backoffDelay(attempt, baseDelay, maxDelay) {{
+            const delay = Math.min(maxDelay, baseDelay * Math.pow(2, attempt));
+            return delay / 2 + Math.random() * delay / 2;
+        }}
+
+        // Offers, restart requests and candidates are stale by the time the socket is back:
+        // they are dropped while it is down and ws.onopen restarts ICE instead
+        const UNQUEUED_WHILE_OFFLINE = ['offer', 'ice-restart', 'ice-candidate'];
+
+        // Send a signaling message, queueing it while the socket is reconnecting
+        function sendSignaling(message) {{
+            if (ws && ws.readyState === WebSocket.OPEN) {{
+                ws.send(JSON.stringify({{ v: SIGNALING_PROTOCOL_VERSION, ...message }}));
+            }} else if (UNQUEUED_WHILE_OFFLINE.includes(message.type)) {{
+                if (peerConnection) restartIceOnReconnect = true;
+            }} else {{
+                pendingSignaling.push(message);
+            }}
+        }}
+
+        function flushPendingSignaling() {{
+            const queued = pendingSignaling;
+            pendingSignaling = [];
+            queued.forEach(message => sendSignaling(message));
+        }}
+
         function connectSignaling() {{
-            const signalingServer = '{SIGNALING_SERVER}';
+            clearTimeout(signalingReconnectTimer);
+            signalingReconnectTimer = null;
+            const signalingServer = '{config['signaling_server']}';
             ws = new WebSocket(signalingServer);
             
             ws.onopen = function() {{
@@ -481,11 +821,34 @@ def main():
                 document.getElementById('connectionStatus').innerHTML = '✅ Connected to server';
                 document.getElementById('connectionStatus').style.background = 'rgba(74, 222, 128, 0.3)';
                 
-                ws.send(JSON.stringify({{
+                const resuming = hasJoined;
+                sendSignaling({{
                     type: 'join',
                     room: roomCode,
-                    role: isAgent ? 'agent' : 'customer'
-                }}));
+                    role: isAgent ? 'agent' : 'customer',
+                    token: reconnectToken,
+                    resume: resuming,
+                    encodings: ['json']
+                }});
+                hasJoined = true;
+                signalingRetries = 0;
+                flushPendingSignaling();
+                
+                // The network may have changed while we were away, and anything the restart loop
+                // or trickle ICE tried to send was dropped; make sure media still flows
+                if (resuming && peerConnection) {{
+                    const state = peerConnection.connectionState;
+                    if (restartIceOnReconnect) {{
+                        // Forced even if 'connected': after a network switch that state is stale
+                        clearTimeout(iceRestartTimer);
+                        iceRestartTimer = null;
+                        restartIce();
+                        scheduleIceRestart(ICE_RESTART_BASE_DELAY);
+                    }} else if (state === 'disconnected' || state === 'failed') {{
+                        scheduleIceRestart(0);
+                    }}
+                }}
+                restartIceOnReconnect = false;
             }};
             
             ws.onerror = function(error) {{
@@ -497,7 +860,8 @@ def main():
             ws.onclose = function() {{
                 document.getElementById('connectionStatus').innerHTML = '⚠️ Disconnected - Reconnecting...';
                 document.getElementById('connectionStatus').style.background = 'rgba(251, 146, 60, 0.3)';
-                setTimeout(connectSignaling, 3000);
+                const delay = backoffDelay(signalingRetries++, SIGNALING_BASE_DELAY, SIGNALING_MAX_DELAY);
+                signalingReconnectTimer = setTimeout(connectSignaling, delay);
             }};
             
             ws.onmessage = async function(event) {{
@@ -521,17 +885,19 @@ def main():
                     if (!isAgent && peerConnection) {{
                         await peerConnection.setRemoteDescription(new RTCSessionDescription(message.offer));
                         const answer = await peerConnection.createAnswer();
+                        answer.sdp = tuneOpus(answer.sdp);
                         await peerConnection.setLocalDescription(answer);
-                        ws.send(JSON.stringify({{
+                        sendSignaling({{
                             type: 'answer',
                             room: roomCode,
                             answer: answer
-                        }}));
+                        }});
                     }}
                     break;
                     
                 case 'answer':
-                    if (isAgent && peerConnection) {{
+                    // An answer to an offer we have since replaced would throw in 'stable'
+                    if (isAgent && peerConnection && peerConnection.signalingState === 'have-local-offer') {{
                         await peerConnection.setRemoteDescription(new RTCSessionDescription(message.answer));
                     }}
                     break;
@@ -545,13 +911,65 @@ def main():
                         }}
                     }}
                     break;
+                    
+                case 'video-mode':
+                case 'video-mode-ack':
+                case 'mute-state':
+                case 'agent-reviewing':
+                case 'take-photo':
+                case 'photo-error':
+                    // Control messages relayed by the server while the data channel is down
+                    await handleControlMessage(message);
+                    break;
+                    
+                case 'ice-restart':
+                    // Only the agent creates offers, so the customer asks it to restart
+                    if (isAgent && peerConnection) {{
+                        await restartIce();
+                    }}
+                    break;
+                    
+                case 'session-ended':
+                    if (!isAgent) {{
+                        endSessionForCustomer();
+                    }}
+                    break;
+            }}
+        }}
+
+        // The agent has moved on: stop reconnecting and release the camera instead of
+        // asking the empty room for ICE restarts for as long as the page stays open
+        function endSessionForCustomer() {{
+            clearTimeout(iceRestartTimer);
+            iceRestartTimer = null;
+            restartIceOnReconnect = false;
+            pendingSignaling = [];
+            if (peerConnection) {{
+                peerConnection.close();
+                peerConnection = null;
+            }}
+            if (localStream) {{
+                localStream.getTracks().forEach(track => track.stop());
+            }}
+            remoteVideo.srcObject = null;
+            if (ws) {{
+                ws.onopen = ws.onclose = ws.onerror = ws.onmessage = null;
+                ws.close();
+                ws = null;
             }}
+            document.getElementById('connectionState').textContent = 'Ended';
+            document.getElementById('connectionStatus').innerHTML = '✅ The agent has ended your session. You can close this page.';
+            document.getElementById('connectionStatus').style.background = 'rgba(0,0,0,0.3)';
         }}
 
         async function enumerateCameras() {{
             try {{
-                // Request permissions first
+                // Request permissions first, and note what the camera can deliver
                 const tempStream = await navigator.mediaDevices.getUserMedia({{ video: true }});
+                const tempTrack = tempStream.getVideoTracks()[0];
+                if (tempTrack && tempTrack.getCapabilities) {{
+                    cameraCapabilities = tempTrack.getCapabilities();
+                }}
                 tempStream.getTracks().forEach(track => track.stop());
                 
                 // Now enumerate devices
@@ -574,24 +992,154 @@ def main():
             }}
         }}
 
+        function cameraConstraints() {{
+            return {{
+                width: {{ ideal: callTier.width, max: 1920 }}, 
+                height: {{ ideal: callTier.height, max: 1080 }},
+                frameRate: {{ ideal: callTier.frameRate, max: 30 }}
+            }};
+        }}
+
+        // Push data between two in-page peer connections; returns Mbps. Directly connected, this
+        // exercises the same DTLS/SCTP stack as the call, so a low figure means the CPU will
+        // struggle. With the sender forced onto our own TURN relay the data goes up to the relay
+        // and back, so the figure bounds what the customer's uplink delivered. Only bytes that
+        // arrive are counted: the channel never retransmits.
+        async function measureLoopbackThroughput(senderConfig = {{}}) {{
+            const sender = new RTCPeerConnection(senderConfig);
+            const receiver = new RTCPeerConnection();
+            try {{
+                sender.onicecandidate = e => e.candidate && receiver.addIceCandidate(e.candidate);
+                receiver.onicecandidate = e => e.candidate && sender.addIceCandidate(e.candidate);
+                
+                const channel = sender.createDataChannel('probe', {{ ordered: false, maxRetransmits: 0 }});
+                channel.bufferedAmountLowThreshold = FILE_BUFFER_LOW_WATER;
+                let received = 0;
+                receiver.ondatachannel = e => {{
+                    e.channel.onmessage = msg => {{ received += msg.data.byteLength || msg.data.size || 0; }};
+                }};
+                
+                const offer = await sender.createOffer();
+                await sender.setLocalDescription(offer);
+                await receiver.setRemoteDescription(offer);
+                const answer = await receiver.createAnswer();
+                await receiver.setLocalDescription(answer);
+                await sender.setRemoteDescription(answer);
+                await new Promise((resolve, reject) => {{
+                    channel.onopen = resolve;
+                    setTimeout(() => reject(new Error('Loopback channel did not open')), PROBE_CONNECT_TIMEOUT_MS);
+                }});
+                
+                const payload = new ArrayBuffer(FILE_CHUNK_SIZE);
+                const started = performance.now();
+                while (performance.now() - started < PROBE_DURATION_MS) {{
+                    await waitForBufferDrain(channel);
+                    channel.send(payload);
+                }}
+                await new Promise(resolve => setTimeout(resolve, 100));
+                return received * 8 / ((performance.now() - started) / 1000) / 1e6;
+            }} finally {{
+                sender.close();
+                receiver.close();
+            }}
+        }}
+
+        async function canEncodeSmoothly(tier) {{
+            if (!navigator.mediaCapabilities || !navigator.mediaCapabilities.encodingInfo) return true;
+            try {{
+                const info = await navigator.mediaCapabilities.encodingInfo({{
+                    type: 'webrtc',
+                    video: {{
+                        contentType: isMobileDevice ? 'video/H264' : 'video/VP8',
+                        width: tier.width,
+                        height: tier.height,
+                        bitrate: tier.maxBitrate,
+                        framerate: tier.frameRate
+                    }}
+                }});
+                return info.supported && info.smooth;
+            }} catch (err) {{
+                return true;
+            }}
+        }}
+
+        // Pick the highest quality tier the camera, encoder, CPU and network can sustain
+        async function runPreCallProbe() {{
+            document.getElementById('connectionStatus').innerHTML = '📶 Checking your device and connection...';
+            const reasons = [];
+            let tierIndex = 0;
+            
+            // Camera: skip tiers the sensor cannot deliver
+            if (cameraCapabilities && cameraCapabilities.height && cameraCapabilities.height.max) {{
+                while (tierIndex < QUALITY_TIERS.length - 1 && QUALITY_TIERS[tierIndex].height > cameraCapabilities.height.max) {{
+                    tierIndex++;
+                    reasons.push('camera');
+                }}
+            }}
+            
+            // Encoder: skip tiers the device cannot encode in real time
+            while (tierIndex < QUALITY_TIERS.length - 1 && !(await canEncodeSmoothly(QUALITY_TIERS[tierIndex]))) {{
+                tierIndex++;
+                reasons.push('encoder');
+            }}
+            
+            // Network: upload throughput through our own TURN relay, with headroom for audio and
+            // overhead. Only a hint: the round trip also includes the relay and the downlink, so it
+            // steps down at most one tier, and a missing or slow relay leaves the device's tier
+            // for congestion control to adapt from.
+            if (PROBE_TURN_SERVER) {{
+                try {{
+                    const uplinkMbps = await measureLoopbackThroughput({{
+                        iceServers: [PROBE_TURN_SERVER],
+                        iceTransportPolicy: 'relay'
+                    }});
+                    console.log(`Pre-call uplink throughput: ${{uplinkMbps.toFixed(2)}} Mbps`);
+                    if (tierIndex < QUALITY_TIERS.length - 1 && uplinkMbps * 1e6 < QUALITY_TIERS[tierIndex].maxBitrate * 1.5) {{
+                        tierIndex++;
+                        reasons.push('network');
+                    }}
+                }} catch (err) {{
+                    console.warn('Uplink probe skipped:', err);
+                }}
+            }}
+            
+            // CPU: loopback transfer throughput
+            try {{
+                const loopbackMbps = await measureLoopbackThroughput();
+                console.log(`Pre-call loopback throughput: ${{loopbackMbps.toFixed(1)}} Mbps`);
+                if (loopbackMbps < PROBE_MIN_LOOPBACK_MBPS && tierIndex < QUALITY_TIERS.length - 1) {{
+                    tierIndex++;
+                    reasons.push('cpu');
+                }}
+            }} catch (err) {{
+                console.warn('Loopback probe failed:', err);
+            }}
+            
+            const tier = QUALITY_TIERS[tierIndex];
+            console.log(`Pre-call probe selected ${{tier.name}}`, reasons);
+            document.getElementById('connectionStatus').innerHTML = `📶 Starting in ${{tier.name}} (${{tier.width}}x${{tier.height}})`;
+            return tier;
+        }}
+
         async function startCall() {{
             try {{
                 // Enumerate available cameras first
                 await enumerateCameras();
                 
+                // Customers start at a quality their device and network can sustain
+                if (!isAgent) {{
+                    callTier = await runPreCallProbe();
+                }}
+                
                 // Get initial camera device ID
                 const videoConstraints = availableCameras.length > 0 
                     ? {{ 
                         deviceId: {{ exact: availableCameras[currentCameraIndex].deviceId }},
-                        width: {{ ideal: 1280, max: 1920 }}, 
-                        height: {{ ideal: 720, max: 1080 }},
-                        frameRate: {{ ideal: 30, max: 30 }}
+                        ...cameraConstraints()
                     }}
                     : {{ 
                         facingMode: currentFacingMode,
-                        width: {{ ideal: 1280, max: 1920 }}, 
-                        height: {{ ideal: 720, max: 1080 }},
-                        frameRate: {{ ideal: 30, max: 30 }}
+                        ...cameraConstraints()
                     }};
                 
                 localStream = await navigator.mediaDevices.getUserMedia({{
@@ -614,9 +1162,17 @@ def main():
                 if (isAgent) {{
                     document.getElementById('captureBtn').disabled = false;
                     document.getElementById('recordBtn').disabled = false;
+                    document.getElementById('docModeBtn').disabled = false;
+                    document.getElementById('reviewBtn').disabled = false;
+                }} else {{
+                    document.getElementById('uploadBtn').disabled = false;
                 }}
                 
                 await initWebRTC();
+                
+                if (!isAgent) {{
+                    await startPowerMonitor();
+                }}
             }} catch (err) {{
                 console.error('Media error:', err);
                 alert('Could not access camera/microphone. Please check permissions.');
@@ -625,28 +1181,33 @@ def main():
 
         async function initWebRTC() {{
             peerConnection = new RTCPeerConnection(configuration);
+            
+            // The agent owns the data channels; they must exist before the first offer
+            if (isAgent) {{
+                setupDataChannel(peerConnection.createDataChannel('kyc-control', {{
+                    ordered: true,
+                    priority: 'high'
+                }}));
+                setupDataChannel(peerConnection.createDataChannel('kyc-files', {{
+                    ordered: true,
+                    priority: 'very-low'
+                }}));
+            }}
+            peerConnection.ondatachannel = function(event) {{
+                setupDataChannel(event.channel);
+            }};
 
             localStream.getTracks().forEach(track => {{
                 const sender = peerConnection.addTrack(track, localStream);
                 
                 if (track.kind === 'video') {{
-                    const parameters = sender.getParameters();
-                    if (!parameters.encodings) {{
-                        parameters.encodings = [{{}}];
-                    }}
-                    
-                    // High-quality encoding parameters
-                    parameters.encodings[0].maxBitrate = 2500000; // 2.5 Mbps for HD quality
-                    parameters.encodings[0].maxFramerate = 30;
-                    parameters.encodings[0].scaleResolutionDownBy = 1.0; // No downscaling
-                    parameters.encodings[0].priority = 'high';
-                    parameters.encodings[0].networkPriority = 'high';
-                    
-                    sender.setParameters(parameters).catch(err => {{
+                    applyVideoEncoding(sender).catch(err => {{
                         console.warn('Could not set encoding parameters:', err);
                     }});
                 }}
             }});
+            
+            await applyCodecPreferences();
 
             peerConnection.ontrack = function(event) {{
                 if (!remoteVideo.srcObject) {{
@@ -656,16 +1217,19 @@ def main():
                     
                     // Monitor video quality
                     monitorVideoQuality();
+                    if (isAgent) {{
+                        startFrameQualitySampling();
+                    }}
                 }}
             }};
 
             peerConnection.onicecandidate = function(event) {{
-                if (event.candidate && ws && ws.readyState === WebSocket.OPEN) {{
-                    ws.send(JSON.stringify({{
+                if (event.candidate) {{
+                    sendSignaling({{
                         type: 'ice-candidate',
                         room: roomCode,
                         candidate: event.candidate
-                    }}));
+                    }});
                 }}
             }};
 
@@ -676,33 +1240,341 @@ def main():
                 
                 if (state === 'connected') {{
                     document.getElementById('connectionState').style.color = '#4ade80';
-                }} else if (state === 'disconnected' || state === 'failed') {{
+                    iceRestartAttempts = 0;
+                    clearTimeout(iceRestartTimer);
+                    iceRestartTimer = null;
+                }} else if (state === 'disconnected') {{
+                    document.getElementById('connectionState').style.color = '#ef4444';
+                    scheduleIceRestart(DISCONNECT_GRACE_MS);
+                }} else if (state === 'failed') {{
                     document.getElementById('connectionState').style.color = '#ef4444';
+                    scheduleIceRestart(0);
                 }}
             }};
 
-            if (ws && ws.readyState === WebSocket.OPEN) {{
-                ws.send(JSON.stringify({{
-                    type: 'ready',
-                    room: roomCode
-                }}));
+            sendSignaling({{
+                type: 'ready',
+                room: roomCode
+            }});
+        }}
+
+        // Ask MediaCapabilities whether a codec can be encoded power-efficiently (i.e. in hardware)
+        async function isCodecPowerEfficient(mimeType) {{
+            if (!navigator.mediaCapabilities || !navigator.mediaCapabilities.encodingInfo) return null;
+            try {{
+                const info = await navigator.mediaCapabilities.encodingInfo({{
+                    type: 'webrtc',
+                    video: {{
+                        contentType: mimeType,
+                        width: 1280,
+                        height: 720,
+                        bitrate: 2500000,
+                        framerate: 30
+                    }}
+                }});
+                return info.supported && info.powerEfficient;
+            }} catch (err) {{
+                return null;
+            }}
+        }}
+
+        async function buildVideoCodecOrder() {{
+            const capabilities = (window.RTCRtpReceiver && RTCRtpReceiver.getCapabilities)
+                ? RTCRtpReceiver.getCapabilities('video')
+                : null;
+            if (!capabilities) return null;
+            
+            const policyOrder = isMobileDevice ? MOBILE_CODEC_ORDER : DESKTOP_CODEC_ORDER;
+            const mediaCodecs = capabilities.codecs.filter(c => policyOrder.includes(c.mimeType));
+            const auxCodecs = capabilities.codecs.filter(c => !policyOrder.includes(c.mimeType));
+            
+            const efficiency = {{}};
+            for (const mimeType of new Set(mediaCodecs.map(c => c.mimeType))) {{
+                efficiency[mimeType] = await isCodecPowerEfficient(mimeType);
+            }}
+            
+            const rank = codec => [
+                // Software-only VP9/AV1 costs too much CPU; push it behind the lighter codecs
+                efficiency[codec.mimeType] === false && HEAVY_CODECS.includes(codec.mimeType) ? 1 : 0,
+                efficiency[codec.mimeType] === true ? 0 : 1,
+                policyOrder.indexOf(codec.mimeType),
+                // Constrained baseline with packetization-mode=1 is the profile phones accelerate
+                /packetization-mode=1/.test(codec.sdpFmtpLine || '') ? 0 : 1,
+                /profile-level-id=42e0/.test(codec.sdpFmtpLine || '') ? 0 : 1
+            ];
+            const sorted = mediaCodecs.slice().sort((a, b) => {{
+                const ra = rank(a), rb = rank(b);
+                for (let i = 0; i < ra.length; i++) {{
+                    if (ra[i] !== rb[i]) return ra[i] - rb[i];
+                }}
+                return 0;
+            }});
+            
+            // Keep RTX/RED/FEC entries so retransmission and protection still negotiate
+            return sorted.concat(auxCodecs);
+        }}
+
+        async function applyCodecPreferences() {{
+            if (!peerConnection || !window.RTCRtpTransceiver || !('setCodecPreferences' in RTCRtpTransceiver.prototype)) {{
+                return;
+            }}
+            
+            try {{
+                const codecOrder = await buildVideoCodecOrder();
+                if (!codecOrder || codecOrder.length === 0) return;
+                
+                peerConnection.getTransceivers().forEach(transceiver => {{
+                    const track = transceiver.sender.track;
+                    if (track && track.kind === 'video') {{
+                        transceiver.setCodecPreferences(codecOrder);
+                    }}
+                }});
+                console.log('Video codec preference:', codecOrder[0].mimeType, isMobileDevice ? '(mobile)' : '(desktop)');
+            }} catch (err) {{
+                console.warn('Could not set codec preferences:', err);
+            }}
+        }}
+
+        // Enable Opus in-band FEC and DTX: resilient to loss, near-silent during pauses
+        function tuneOpus(sdp) {{
+            const match = sdp.match(/a=rtpmap:(\\d+) opus\\/48000[^\\r\\n]*/i);
+            if (!match) return sdp;
+            const payloadType = match[1];
+            const fmtpPattern = new RegExp(`a=fmtp:${{payloadType}} ([^\\r\\n]*)`);
+            
+            if (!fmtpPattern.test(sdp)) {{
+                return sdp.replace(match[0], `${{match[0]}}\\r\\na=fmtp:${{payloadType}} useinbandfec=1;usedtx=1`);
+            }}
+            return sdp.replace(fmtpPattern, (line, params) => {{
+                let tuned = params;
+                if (!/useinbandfec=/.test(tuned)) tuned += ';useinbandfec=1';
+                if (!/usedtx=/.test(tuned)) tuned += ';usedtx=1';
+                return `a=fmtp:${{payloadType}} ${{tuned}}`;
+            }});
+        }}
+
+        // Apply the current video mode to a video sender and its track
+        async function applyVideoEncoding(sender) {{
+            const mode = VIDEO_MODES[videoMode];
+            if (sender.track && 'contentHint' in sender.track) {{
+                sender.track.contentHint = mode.contentHint;
+            }}
+            
+            const parameters = sender.getParameters();
+            if (!parameters.encodings || parameters.encodings.length === 0) {{
+                parameters.encodings = [{{}}];
+            }}
+            
+            // High-quality encoding parameters
+            const power = POWER_LEVELS[powerState.level];
+            parameters.encodings[0].maxBitrate = Math.min(mode.maxBitrate, callTier.maxBitrate);
+            parameters.encodings[0].maxFramerate = Math.min(mode.maxFramerate, callTier.frameRate, power.maxFramerate);
+            parameters.encodings[0].scaleResolutionDownBy = power.scaleResolutionDownBy;
+            parameters.encodings[0].active = power.active;
+            parameters.encodings[0].priority = 'high';
+            parameters.encodings[0].networkPriority = 'high';
+            parameters.degradationPreference = mode.degradationPreference;
+            
+            await sender.setParameters(parameters);
+        }}
+
+        // Force the encoder to emit a keyframe. generateKeyFrame() where supported;
+        // otherwise pausing and resuming the encoding restarts it on a keyframe.
+        async function requestKeyFrame(sender) {{
+            if (typeof sender.generateKeyFrame === 'function') {{
+                await sender.generateKeyFrame();
+                return;
+            }}
+            const parameters = sender.getParameters();
+            if (!parameters.encodings || !parameters.encodings.length || !parameters.encodings[0].active) return;
+            parameters.encodings[0].active = false;
+            await sender.setParameters(parameters);
+            const resumed = sender.getParameters();
+            resumed.encodings[0].active = true;
+            await sender.setParameters(resumed);
+        }}
+
+        // Customer side: switch the outgoing camera between face and document settings
+        async function setVideoMode(mode) {{
+            if (!VIDEO_MODES[mode]) return;
+            videoMode = mode;
+            if (mode === 'document') {{
+                // Detail requested: ramp straight back up from any low-power level
+                agentReviewing = false;
+                powerState = nextPowerState(powerState, {{ detailRequested: true }});
+            }}
+            
+            const videoSender = peerConnection && peerConnection.getSenders().find(s => s.track && s.track.kind === 'video');
+            if (videoSender) {{
+                try {{
+                    await applyVideoEncoding(videoSender);
+                    // Start the new mode on a fresh keyframe so document detail is sharp immediately
+                    await requestKeyFrame(videoSender);
+                }} catch (err) {{
+                    console.warn('Could not apply video mode:', err);
+                }}
+            }}
+            
+            sendControl({{
+                type: 'video-mode-ack',
+                mode: mode
+            }});
+            console.log('Video mode:', mode);
+        }}
+
+        async function collectPowerSignals() {{
+            let qualityLimitationReason = 'none';
+            if (peerConnection) {{
+                const stats = await peerConnection.getStats();
+                stats.forEach(report => {{
+                    if (report.type === 'outbound-rtp' && report.kind === 'video' && report.qualityLimitationReason) {{
+                        qualityLimitationReason = report.qualityLimitationReason;
+                    }}
+                }});
+            }}
+            return {{
+                qualityLimitationReason,
+                batteryLevel: batteryManager ? batteryManager.level : null,
+                charging: batteryManager ? batteryManager.charging : true,
+                hidden: document.visibilityState === 'hidden',
+                agentReviewing,
+                detailRequested: videoMode === 'document'
+            }};
+        }}
+
+        async function evaluatePowerMode() {{
+            const videoSender = peerConnection && peerConnection.getSenders().find(s => s.track && s.track.kind === 'video');
+            if (!videoSender) return;
+            
+            try {{
+                const next = nextPowerState(powerState, await collectPowerSignals());
+                const changed = next.level !== powerState.level;
+                powerState = next;
+                if (changed) {{
+                    console.log('Power mode:', POWER_LEVELS[next.level].name);
+                    await applyVideoEncoding(videoSender);
+                }}
+            }} catch (err) {{
+                console.warn('Power mode evaluation failed:', err);
+            }}
+        }}
+
+        async function startPowerMonitor() {{
+            if (navigator.getBattery) {{
+                try {{
+                    batteryManager = await navigator.getBattery();
+                    batteryManager.addEventListener('levelchange', evaluatePowerMode);
+                    batteryManager.addEventListener('chargingchange', evaluatePowerMode);
+                }} catch (err) {{
+                    batteryManager = null;
+                }}
             }}
+            document.addEventListener('visibilitychange', evaluatePowerMode);
+            setInterval(evaluatePowerMode, POWER_SAMPLE_INTERVAL_MS);
         }}
 
-        async function createOffer() {{
+        // Agent side: pause the customer's video while reviewing documents
+        function toggleReviewPause() {{
+            agentReviewing = !agentReviewing;
+            sendControl({{
+                type: 'agent-reviewing',
+                active: agentReviewing
+            }});
+            const btn = document.getElementById('reviewBtn');
+            btn.classList.toggle('active', agentReviewing);
+            btn.innerHTML = agentReviewing
+                ? '<span>▶️</span><span>Resume Video</span>'
+                : '<span>⏸️</span><span>Reviewing Docs</span>';
+        }}
+
+        // Agent side: ask the customer's device to switch modes
+        function toggleDocumentMode() {{
+            const nextMode = remoteVideoMode === 'document' ? 'face' : 'document';
+            if (nextMode === 'document' && agentReviewing) {{
+                // The customer resumes full video for document mode on its own
+                toggleReviewPause();
+            }}
+            sendControl({{
+                type: 'video-mode',
+                mode: nextMode
+            }});
+            document.getElementById('docModeBtn').disabled = true;
+            // Don't leave the button stuck if the customer never confirms
+            clearTimeout(videoModeAckTimer);
+            videoModeAckTimer = setTimeout(() => {{
+                console.warn('No video mode confirmation from customer');
+                updateDocumentModeButton(remoteVideoMode);
+            }}, VIDEO_MODE_ACK_TIMEOUT_MS);
+        }}
+
+        function updateDocumentModeButton(mode) {{
+            clearTimeout(videoModeAckTimer);
+            videoModeAckTimer = null;
+            remoteVideoMode = mode;
+            const btn = document.getElementById('docModeBtn');
+            if (!btn) return;
+            btn.disabled = false;
+            btn.classList.toggle('active', mode === 'document');
+            btn.innerHTML = mode === 'document'
+                ? '<span>🙂</span><span>Face Mode</span>'
+                : '<span>📄</span><span>Document Mode</span>';
+        }}
+
+        async function createOffer(options = {{}}) {{
             try {{
-                const offer = await peerConnection.createOffer();
+                const offer = await peerConnection.createOffer(options);
+                offer.sdp = tuneOpus(offer.sdp);
                 await peerConnection.setLocalDescription(offer);
-                ws.send(JSON.stringify({{
+                sendSignaling({{
                     type: 'offer',
                     room: roomCode,
                     offer: offer
-                }}));
+                }});
             }} catch (err) {{
                 console.error('Error creating offer:', err);
             }}
         }}
 
+        // Renegotiate ICE on the existing connection; tracks, recording and snapshots are kept
+        async function restartIce() {{
+            if (!peerConnection) return;
+            document.getElementById('connectionState').textContent = 'Reconnecting...';
+            document.getElementById('connectionState').style.color = '#f59e0b';
+            
+            if (isAgent) {{
+                await createOffer({{ iceRestart: true }});
+            }} else {{
+                sendSignaling({{
+                    type: 'ice-restart',
+                    room: roomCode
+                }});
+            }}
+        }}
+
+        // Retry ICE restarts with exponential backoff until the connection recovers
+        function scheduleIceRestart(initialDelay) {{
+            if (iceRestartTimer) return;
+            const delay = initialDelay + (iceRestartAttempts > 0
+                ? backoffDelay(iceRestartAttempts - 1, ICE_RESTART_BASE_DELAY, ICE_RESTART_MAX_DELAY)
+                : 0);
+            
+            iceRestartTimer = setTimeout(async () => {{
+                iceRestartTimer = null;
+                if (!peerConnection || peerConnection.connectionState === 'connected' || peerConnection.connectionState === 'closed') {{
+                    return;
+                }}
+                if (!ws || ws.readyState !== WebSocket.OPEN) {{
+                    // Nothing would reach the peer; ws.onopen restarts once signaling is back
+                    restartIceOnReconnect = true;
+                    return;
+                }}
+                iceRestartAttempts++;
+                console.log(`ICE restart attempt ${{iceRestartAttempts}}`);
+                await restartIce();
+                scheduleIceRestart(ICE_RESTART_BASE_DELAY);
+            }}, delay);
+        }}
+
         function toggleMute() {{
             if (localStream) {{
                 const audioTrack = localStream.getAudioTracks()[0];
@@ -711,6 +1583,7 @@ def main():
                     isMuted = !audioTrack.enabled;
                     const btn = document.getElementById('muteBtn');
                     btn.innerHTML = isMuted ? '<span>🔇</span><span>Unmute</span>' : '<span>🎤</span><span>Mute</span>';
+                    sendMediaState();
                 }}
             }}
         }}
@@ -723,6 +1596,7 @@ def main():
                     isVideoOff = !videoTrack.enabled;
                     const btn = document.getElementById('videoBtn');
                     btn.innerHTML = isVideoOff ? '<span>📹</span><span>Start Video</span>' : '<span>📹</span><span>Stop Video</span>';
+                    sendMediaState();
                 }}
             }}
         }}
@@ -757,9 +1631,7 @@ def main():
                 const newStream = await navigator.mediaDevices.getUserMedia({{
                     video: {{ 
                         deviceId: {{ exact: nextCamera.deviceId }},
-                        width: {{ ideal: 1280, max: 1920 }}, 
-                        height: {{ ideal: 720, max: 1080 }},
-                        frameRate: {{ ideal: 30, max: 30 }}
+                        ...cameraConstraints()
                     }}
                 }});
                 
@@ -771,15 +1643,7 @@ def main():
                     await videoSender.replaceTrack(newVideoTrack);
                     
                     // Reapply encoding parameters for quality
-                    const parameters = videoSender.getParameters();
-                    if (parameters.encodings && parameters.encodings.length > 0) {{
-                        parameters.encodings[0].maxBitrate = 2500000;
-                        parameters.encodings[0].maxFramerate = 30;
-                        parameters.encodings[0].scaleResolutionDownBy = 1.0;
-                        parameters.encodings[0].priority = 'high';
-                        parameters.encodings[0].networkPriority = 'high';
-                        await videoSender.setParameters(parameters).catch(e => console.warn('Encoding params:', e));
-                    }}
+                    await applyVideoEncoding(videoSender).catch(e => console.warn('Encoding params:', e));
                 }}
                 
                 // Update local stream
@@ -787,10 +1651,8 @@ def main():
                 localStream.addTrack(newVideoTrack);
                 localVideo.srcObject = localStream;
                 
-                // Update recording stream if recording
-                if (isRecording && mediaRecorder) {{
-                    await stopAndRestartRecording();
-                }}
+                // An active recording keeps going: the composite canvas draws from
+                // localVideo and the audio graph is untouched by a video-only switch
                 
                 console.log('Camera flipped successfully to:', nextCamera.label);
             }} catch (err) {{
@@ -815,22 +1677,313 @@ def main():
             }}
         }}
 
+        // Data channel plane: 'kyc-control' carries small JSON control messages,
+        // 'kyc-files' carries chunked bulk transfers (photos, customer documents)
+        function setupDataChannel(channel) {{
+            channel.binaryType = 'arraybuffer';
+            
+            if (channel.label === 'kyc-control') {{
+                controlChannel = channel;
+                controlChannel.onmessage = async function(event) {{
+                    let message;
+                    try {{
+                        message = JSON.parse(event.data);
+                    }} catch (err) {{
+                        console.warn('Ignoring malformed control message:', err);
+                        return;
+                    }}
+                    await handleControlMessage(message);
+                }};
+            }} else if (channel.label === 'kyc-files') {{
+                fileChannel = channel;
+                fileChannel.bufferedAmountLowThreshold = FILE_BUFFER_LOW_WATER;
+                fileChannel.onmessage = handleFileMessage;
+            }}
+            
+            channel.onopen = function() {{
+                console.log(`Data channel open: ${{channel.label}}`);
+                if (channel.label === 'kyc-control') {{
+                    sendMediaState();
+                }}
+            }};
+        }}
+
+        // Send a control message peer-to-peer, falling back to the signaling server
+        function sendControl(message) {{
+            if (controlChannel && controlChannel.readyState === 'open') {{
+                controlChannel.send(JSON.stringify(message));
+            }} else {{
+                sendSignaling({{ ...message, room: roomCode }});
+            }}
+        }}
+
+        async function handleControlMessage(message) {{
+            switch (message.type) {{
+                case 'video-mode':
+                    if (!isAgent) {{
+                        await setVideoMode(message.mode);
+                    }}
+                    break;
+                    
+                case 'video-mode-ack':
+                    if (isAgent) {{
+                        updateDocumentModeButton(message.mode);
+                    }}
+                    break;
+                    
+                case 'mute-state':
+                    updateRemoteMediaState(message.audioMuted, message.videoOff);
+                    break;
+                    
+                case 'agent-reviewing':
+                    if (!isAgent) {{
+                        agentReviewing = message.active;
+                        await evaluatePowerMode();
+                    }}
+                    break;
+                    
+                case 'take-photo':
+                    if (!isAgent) {{
+                        await sendFullResolutionPhoto(message.id);
+                    }}
+                    break;
+                    
+                case 'photo-error':
+                    if (!isAgent || message.id !== pendingPhotoId) break;
+                    console.warn('Customer device could not take photo:', message.reason);
+                    clearTimeout(photoRequestTimer);
+                    pendingPhotoId = null;
+                    captureVideoFrame();
+                    break;
+            }}
+        }}
+
+        function handleFileMessage(event) {{
+            if (typeof event.data !== 'string') {{
+                if (incomingFile) {{
+                    incomingFile.received += event.data.byteLength;
+                    if (incomingFile.received > incomingFile.size) {{
+                        // More than announced: drop what we have and ignore the rest of this file
+                        console.warn(`Aborting transfer: more than the announced ${{incomingFile.size}} bytes`);
+                        incomingFile = null;
+                        return;
+                    }}
+                    incomingFile.chunks.push(event.data);
+                }}
+                return;
+            }}
+            
+            let message;
+            try {{
+                message = JSON.parse(event.data);
+            }} catch (err) {{
+                console.warn('Ignoring malformed file message:', err);
+                return;
+            }}
+            if (message.type === 'file-start') {{
+                incomingFile = null;
+                if (!Number.isInteger(message.size) || message.size < 0 || message.size > MAX_TRANSFER_BYTES) {{
+                    console.warn(`Refusing transfer of ${{message.size}} bytes`);
+                    return;
+                }}
+                incomingFile = {{ meta: message.meta || {{}}, size: message.size, chunks: [], received: 0 }};
+                // The photo is on its way; a large one may take longer than the fallback timeout
+                if (incomingFile.meta.kind === 'photo' && incomingFile.meta.id === pendingPhotoId) {{
+                    clearTimeout(photoRequestTimer);
+                }}
+            }} else if (message.type === 'file-end' && incomingFile) {{
+                const transfer = incomingFile;
+                incomingFile = null;
+                if (transfer.received !== transfer.size) {{
+                    console.warn(`Incomplete transfer: ${{transfer.received}}/${{transfer.size}} bytes`);
+                    return;
+                }}
+                handleReceivedFile(new Blob(transfer.chunks, {{ type: transfer.meta.mimeType }}), transfer.meta);
+            }}
+        }}
+
+        // Extension to save a received file under, or null if its type or name is not accepted.
+        // Both come from the customer's page, so the accept filter there proves nothing.
+        function acceptedExtension(meta) {{
+            const extensions = ACCEPTED_FILE_TYPES[meta.mimeType];
+            if (!extensions) return null;
+            if (meta.kind === 'photo') return extensions[0];
+            const match = /[.]([A-Za-z0-9]{{1,5}})$/.exec(typeof meta.name === 'string' ? meta.name : '');
+            const extension = match && match[1].toLowerCase();
+            return extensions.includes(extension) ? extension : null;
+        }}
+
+        function handleReceivedFile(blob, meta) {{
+            console.log(`Received ${{meta.kind}}: ${{blob.size}} bytes`);
+            const extension = acceptedExtension(meta);
+            if (!extension) {{
+                console.warn('Ignoring file of unaccepted type:', meta.mimeType);
+                return;
+            }}
+            
+            if (meta.kind === 'photo') {{
+                if (meta.id !== pendingPhotoId) {{
+                    console.warn('Ignoring photo for a superseded request');
+                    return;
+                }}
+                clearTimeout(photoRequestTimer);
+                pendingPhotoId = null;
+                showSnapshot(URL.createObjectURL(blob));
+            }} else if (meta.kind === 'document') {{
+                // The agent decides whether to save it; nothing is downloaded automatically
+                const url = URL.createObjectURL(blob);
+                receivedDocumentUrls.push(url);
+                const link = document.createElement('a');
+                link.href = url;
+                link.download = `KYC_Document_${{roomCode}}_${{receivedDocumentUrls.length}}.${{extension}}`;
+                link.textContent = `📄 Save document from customer: ${{meta.name}} (${{Math.ceil(blob.size / 1024)}} KB)`;
+                document.getElementById('receivedDocuments').appendChild(link);
+            }}
+        }}
+
+        // Wait until the channel has drained below the low-water mark
+        function waitForBufferDrain(channel) {{
+            if (channel.bufferedAmount <= FILE_BUFFER_HIGH_WATER) return Promise.resolve();
+            return new Promise(resolve => {{
+                channel.addEventListener('bufferedamountlow', resolve, {{ once: true }});
+            }});
+        }}
+
+        // Stream a blob in chunks, pausing whenever the SCTP send buffer fills up.
+        // Transfers are serialized so chunks of different files never interleave.
+        function sendFile(blob, meta) {{
+            const transfer = fileSendQueue.then(async () => {{
+                if (!fileChannel || fileChannel.readyState !== 'open') {{
+                    throw new Error('File channel is not open');
+                }}
+                
+                fileChannel.send(JSON.stringify({{
+                    type: 'file-start',
+                    size: blob.size,
+                    meta: {{ ...meta, mimeType: blob.type || meta.mimeType || 'application/octet-stream' }}
+                }}));
+                for (let offset = 0; offset < blob.size; offset += FILE_CHUNK_SIZE) {{
+                    await waitForBufferDrain(fileChannel);
+                    const chunk = await blob.slice(offset, offset + FILE_CHUNK_SIZE).arrayBuffer();
+                    fileChannel.send(chunk);
+                }}
+                fileChannel.send(JSON.stringify({{ type: 'file-end' }}));
+                console.log(`Sent ${{meta.kind}}: ${{blob.size}} bytes`);
+            }});
+            fileSendQueue = transfer.catch(() => {{}});
+            return transfer;
+        }}
+
+        // Customer side: take a still at full sensor resolution and stream it to the agent
+        async function sendFullResolutionPhoto(id) {{
+            const videoTrack = localStream && localStream.getVideoTracks()[0];
+            try {{
+                if (!videoTrack || typeof ImageCapture === 'undefined') {{
+                    throw new Error('ImageCapture not supported');
+                }}
+                
+                const imageCapture = new ImageCapture(videoTrack);
+                const capabilities = await imageCapture.getPhotoCapabilities();
+                const photoSettings = capabilities.imageWidth && capabilities.imageHeight
+                    ? {{ imageWidth: capabilities.imageWidth.max, imageHeight: capabilities.imageHeight.max }}
+                    : {{}};
+                const blob = await imageCapture.takePhoto(photoSettings);
+                await sendFile(blob, {{ kind: 'photo', id: id, mimeType: 'image/jpeg' }});
+            }} catch (err) {{
+                console.warn('Full-resolution photo failed:', err);
+                sendControl({{ type: 'photo-error', id: id, reason: err.message }});
+            }}
+        }}
+
+        function chooseDocument() {{
+            document.getElementById('documentInput').click();
+        }}
+
+        // Customer side: send an ID document or other file chosen from the device
+        async function uploadDocument(input) {{
+            const files = Array.from(input.files || []);
+            input.value = '';
+            for (const file of files) {{
+                if (file.size > MAX_TRANSFER_BYTES) {{
+                    alert(`${{file.name}} is too large to send (max ${{MAX_TRANSFER_BYTES / 1024 / 1024}} MB)`);
+                    continue;
+                }}
+                try {{
+                    document.getElementById('connectionStatus').innerHTML = `📤 Sending ${{file.name}}...`;
+                    await sendFile(file, {{ kind: 'document', name: file.name }});
+                    document.getElementById('connectionStatus').innerHTML = `✅ Sent ${{file.name}}`;
+                }} catch (err) {{
+                    console.error('Document upload failed:', err);
+                    alert('Could not send document: ' + err.message);
+                }}
+            }}
+        }}
+
+        function sendMediaState() {{
+            sendControl({{
+                type: 'mute-state',
+                audioMuted: isMuted,
+                videoOff: isVideoOff
+            }});
+        }}
+
+        function updateRemoteMediaState(audioMuted, videoOff) {{
+            const indicator = document.getElementById('remoteMediaState');
+            const labels = [];
+            if (audioMuted) labels.push('🔇 Muted');
+            if (videoOff) labels.push('🚫 Video off');
+            indicator.textContent = labels.join(' · ');
+            indicator.classList.toggle('show', labels.length > 0);
+        }}
+
+        function showSnapshot(url) {{
+            capturedSnapshot = url;
+            document.getElementById('snapshotImg').src = capturedSnapshot;
+            document.getElementById('overlay').classList.add('show');
+            document.getElementById('snapshotPreview').classList.add('show');
+        }}
+
+        // Agent side: request a full-resolution photo, falling back to a video frame grab
         function captureSnapshot() {{
             if (!remoteVideo.srcObject) {{
                 alert('No customer video available to capture!');
                 return;
             }}
             
+            // Blur in the received video is often just the encoder under congestion, which a sensor
+            // photo does not suffer from. Only a scene problem (no face, too dark) would spoil the
+            // photo as well, so only then fall back to the best recent frame.
+            if (!fileChannel || fileChannel.readyState !== 'open' || (latestQuality && !isSceneUsable(latestQuality))) {{
+                captureVideoFrame();
+                return;
+            }}
+            
+            const id = `${{Date.now()}}-${{Math.random().toString(36).slice(2, 8)}}`;
+            pendingPhotoId = id;
+            sendControl({{ type: 'take-photo', id: id }});
+            clearTimeout(photoRequestTimer);
+            photoRequestTimer = setTimeout(() => {{
+                console.warn('Photo request timed out, grabbing video frame instead');
+                pendingPhotoId = null;
+                captureVideoFrame();
+            }}, PHOTO_REQUEST_TIMEOUT_MS);
+        }}
+
+        // Save the best frame from the rolling buffer, or the live frame when the buffer is
+        // empty or the newest frame is the best one; both are at full resolution
+        function captureVideoFrame() {{
+            if (!remoteVideo.srcObject) return;
+            
+            let best = pickBestFrame();
+            if (best && best === frameBuffer[frameBuffer.length - 1]) best = null;
+            const source = best ? best.bitmap : remoteVideo;
             const canvas = document.createElement('canvas');
-            canvas.width = remoteVideo.videoWidth;
-            canvas.height = remoteVideo.videoHeight;
+            canvas.width = best ? source.width : remoteVideo.videoWidth;
+            canvas.height = best ? source.height : remoteVideo.videoHeight;
             const ctx = canvas.getContext('2d');
-            ctx.drawImage(remoteVideo, 0, 0, canvas.width, canvas.height);
+            ctx.drawImage(source, 0, 0, canvas.width, canvas.height);
             
-            capturedSnapshot = canvas.toDataURL('image/jpeg', 0.9);
-            document.getElementById('snapshotImg').src = capturedSnapshot;
-            document.getElementById('overlay').classList.add('show');
-            document.getElementById('snapshotPreview').classList.add('show');
+            showSnapshot(canvas.toDataURL('image/jpeg', 0.9));
         }}
 
         function saveSnapshot() {{
@@ -852,6 +2005,11 @@ def main():
         function closePreview() {{
             document.getElementById('overlay').classList.remove('show');
             document.getElementById('snapshotPreview').classList.remove('show');
+            if (capturedSnapshot && capturedSnapshot.startsWith('blob:')) {{
+                // saveSnapshot may have just clicked a download link for it
+                const url = capturedSnapshot;
+                setTimeout(() => URL.revokeObjectURL(url), OBJECT_URL_LIFETIME_MS);
+            }}
             capturedSnapshot = null;
         }}
         
@@ -877,37 +2035,20 @@ def main():
                 // Capture canvas stream at 60fps
                 const canvasStream = canvas.captureStream(60);
                 
-                // Create audio context to mix audio streams
-                const audioContext = new AudioContext({{ sampleRate: 48000 }});
-                const audioDestination = audioContext.createMediaStreamDestination();
-                
-                // Add local audio
-                if (localStream && localStream.getAudioTracks().length > 0) {{
-                    const localAudioSource = audioContext.createMediaStreamSource(
-                        new MediaStream([localStream.getAudioTracks()[0]])
-                    );
-                    localAudioSource.connect(audioDestination);
-                }}
-                
-                // Add remote audio
-                if (remoteVideo.srcObject && remoteVideo.srcObject.getAudioTracks().length > 0) {{
-                    const remoteAudioSource = audioContext.createMediaStreamSource(
-                        new MediaStream([remoteVideo.srcObject.getAudioTracks()[0]])
-                    );
-                    remoteAudioSource.connect(audioDestination);
-                }}
+                // Mix local and remote audio through the persistent session graph
+                const audioGraph = await ensureRecordingAudioGraph();
                 
                 // Combine video and audio streams
                 const recordStream = new MediaStream([
                     ...canvasStream.getVideoTracks(),
-                    ...audioDestination.stream.getAudioTracks()
+                    ...audioGraph.mixed.stream.getAudioTracks()
                 ]);
                 
-                // Setup MediaRecorder with highest quality
+                // Setup MediaRecorder with highest quality video and speech-tuned audio
                 const options = {{
                     mimeType: 'video/webm;codecs=vp9,opus',
                     videoBitsPerSecond: 8000000,  // 8 Mbps for excellent quality
-                    audioBitsPerSecond: 256000     // 256 kbps for audio
+                    audioBitsPerSecond: SPEECH_MIX_BITRATE
                 }};
                 
                 // Fallback for Safari/iOS
@@ -929,12 +2070,13 @@ def main():
                     }}
                 }};
                 
+                const recordingRoom = roomCode;
                 mediaRecorder.onstop = () => {{
                     const blob = new Blob(recordedChunks, {{ type: 'video/webm' }});
                     const url = URL.createObjectURL(blob);
                     const link = document.createElement('a');
                     link.href = url;
-                    link.download = `KYC_Recording_${{roomCode}}_${{new Date().toISOString().slice(0,19).replace(/:/g,'-')}}.webm`;
+                    link.download = `KYC_Recording_${{recordingRoom}}_${{new Date().toISOString().slice(0,19).replace(/:/g,'-')}}.webm`;
                     link.click();
                     URL.revokeObjectURL(url);
                     recordedChunks = [];
@@ -943,6 +2085,10 @@ def main():
                 mediaRecorder.start(100); // Collect data every 100ms for smoother recording
                 isRecording = true;
                 
+                if (RECORD_SEPARATE_AUDIO) {{
+                    speakerRecorders = startSpeakerRecorders(audioGraph, new Date().toISOString().slice(0,19).replace(/:/g,'-'));
+                }}
+                
                 const btn = document.getElementById('recordBtn');
                 btn.innerHTML = '<span>⏹️</span><span>Stop Recording</span>';
                 btn.classList.add('recording');
@@ -1051,6 +2197,13 @@ def main():
             if (mediaRecorder && mediaRecorder.state !== 'inactive') {{
                 mediaRecorder.stop();
                 isRecording = false;
+                speakerRecorders.forEach(recorder => recorder.state !== 'inactive' && recorder.stop());
+                speakerRecorders = [];
+                
+                // Keep the graph for the next recording but stop it from using CPU
+                if (recordingAudio) {{
+                    recordingAudio.context.suspend();
+                }}
                 
                 const btn = document.getElementById('recordBtn');
                 btn.innerHTML = '<span>⏺️</span><span>Start Recording</span>';
@@ -1060,25 +2213,92 @@ def main():
             }}
         }}
         
-        async function stopAndRestartRecording() {{
-            // Helper function to restart recording when camera flips
-            if (isRecording) {{
-                const wasRecording = true;
-                await stopRecording();
-                // Wait a bit for the camera to stabilize
-                setTimeout(async () => {{
-                    if (wasRecording) {{
-                        await startRecording();
-                    }}
-                }}, 500);
+        // Built once per session and reused by every recording. Sources are only
+        // rebuilt when the underlying audio track actually changes.
+        async function ensureRecordingAudioGraph() {{
+            if (!recordingAudio) {{
+                const context = new AudioContext({{ sampleRate: 48000, latencyHint: 'playback' }});
+                const graph = {{
+                    context,
+                    mixer: null,
+                    mixed: context.createMediaStreamDestination(),
+                    separate: [context.createMediaStreamDestination(), context.createMediaStreamDestination()],
+                    sources: [null, null],
+                    trackIds: [null, null]
+                }};
+                
+                try {{
+                    const source = document.getElementById('speakerMixerWorklet').textContent;
+                    const moduleUrl = URL.createObjectURL(new Blob([source], {{ type: 'text/javascript' }}));
+                    await context.audioWorklet.addModule(moduleUrl);
+                    graph.mixer = new AudioWorkletNode(context, 'speaker-mixer', {{
+                        numberOfInputs: 2,
+                        numberOfOutputs: 1,
+                        outputChannelCount: [1]
+                    }});
+                    graph.mixer.connect(graph.mixed);
+                }} catch (err) {{
+                    // No AudioWorklet: mix without normalization
+                    console.warn('Audio mixer worklet unavailable:', err);
+                }}
+                recordingAudio = graph;
             }}
+            
+            setRecordingAudioSource(0, localStream && localStream.getAudioTracks()[0]);
+            setRecordingAudioSource(1, remoteVideo.srcObject && remoteVideo.srcObject.getAudioTracks()[0]);
+            await recordingAudio.context.resume();
+            return recordingAudio;
+        }}
+
+        function setRecordingAudioSource(speaker, track) {{
+            const graph = recordingAudio;
+            if (!track || graph.trackIds[speaker] === track.id) return;
+            
+            if (graph.sources[speaker]) {{
+                graph.sources[speaker].disconnect();
+            }}
+            const source = graph.context.createMediaStreamSource(new MediaStream([track]));
+            if (graph.mixer) {{
+                source.connect(graph.mixer, 0, speaker);
+            }} else {{
+                source.connect(graph.mixed);
+            }}
+            source.connect(graph.separate[speaker]);
+            graph.sources[speaker] = source;
+            graph.trackIds[speaker] = track.id;
+        }}
+
+        // Audio-only recorders per party, for downstream transcription
+        function startSpeakerRecorders(graph, stamp) {{
+            const recordingRoom = roomCode;
+            const parties = isAgent ? ['agent', 'customer'] : ['customer', 'agent'];
+            return graph.separate.map((destination, speaker) => {{
+                const chunks = [];
+                const recorder = new MediaRecorder(destination.stream, {{
+                    mimeType: 'audio/webm;codecs=opus',
+                    audioBitsPerSecond: SPEECH_TRACK_BITRATE
+                }});
+                recorder.ondataavailable = event => {{
+                    if (event.data && event.data.size > 0) chunks.push(event.data);
+                }};
+                recorder.onstop = () => {{
+                    const url = URL.createObjectURL(new Blob(chunks, {{ type: 'audio/webm' }}));
+                    const link = document.createElement('a');
+                    link.href = url;
+                    link.download = `KYC_Audio_${{recordingRoom}}_${{parties[speaker]}}_${{stamp}}.webm`;
+                    link.click();
+                    URL.revokeObjectURL(url);
+                }};
+                recorder.start(1000);
+                return recorder;
+            }});
         }}
 
         // Monitor and adjust video quality based on network conditions
         function monitorVideoQuality() {{
-            if (!peerConnection) return;
+            if (!peerConnection || qualityMonitorTimer) return;
             
-            setInterval(async () => {{
+            qualityMonitorTimer = setInterval(async () => {{
                 if (!peerConnection) return;
                 
                 try {{
@@ -1116,6 +2336,131 @@ def main():
             }}, 3000); // Check every 3 seconds
         }}
 
+        // Sample the customer's video at a low rate and score frames in a small worker pool
+        function startFrameQualitySampling() {{
+            if (typeof Worker === 'undefined' || typeof OffscreenCanvas === 'undefined' || qualityWorkers.length > 0) {{
+                return;
+            }}
+            
+            const source = document.getElementById('frameQualityWorker').textContent;
+            const workerUrl = URL.createObjectURL(new Blob([source], {{ type: 'text/javascript' }}));
+            for (let i = 0; i < QUALITY_WORKERS; i++) {{
+                const worker = new Worker(workerUrl);
+                worker.busy = false;
+                worker.onmessage = function(event) {{
+                    worker.busy = false;
+                    handleFrameQuality(event.data);
+                    dispatchQualityFrames();
+                }};
+                qualityWorkers.push(worker);
+            }}
+            
+            const onFrame = async function(now) {{
+                if (now - lastQualitySample >= QUALITY_SAMPLE_INTERVAL_MS && remoteVideo.videoWidth > 0) {{
+                    lastQualitySample = now;
+                    await enqueueQualityFrame(now);
+                }}
+                scheduleNextFrame();
+            }};
+            const scheduleNextFrame = function() {{
+                if ('requestVideoFrameCallback' in remoteVideo) {{
+                    remoteVideo.requestVideoFrameCallback(onFrame);
+                }} else {{
+                    setTimeout(() => onFrame(performance.now()), QUALITY_SAMPLE_INTERVAL_MS);
+                }}
+            }};
+            scheduleNextFrame();
+        }}
+
+        async function enqueueQualityFrame(timestamp) {{
+            let frame, bitmap;
+            try {{
+                // Grab the frame once at full resolution for the buffer, then score a small copy
+                frame = await createImageBitmap(remoteVideo);
+                bitmap = await createImageBitmap(frame, {{
+                    resizeWidth: QUALITY_FRAME_WIDTH,
+                    resizeHeight: Math.round(frame.height * QUALITY_FRAME_WIDTH / frame.width),
+                    resizeQuality: 'low'
+                }});
+            }} catch (err) {{
+                if (frame) frame.close();
+                return;
+            }}
+            
+            const id = ++qualityFrameId;
+            frameBuffer.push({{ id, timestamp, bitmap: frame, quality: null }});
+            while (frameBuffer.length > FRAME_BUFFER_SIZE) {{
+                frameBuffer.shift().bitmap.close();
+            }}
+            
+            // Bounded queue: when workers fall behind, drop the stalest frame
+            qualityQueue.push({{ id, timestamp, bitmap }});
+            while (qualityQueue.length > QUALITY_QUEUE_LIMIT) {{
+                qualityQueue.shift().bitmap.close();
+            }}
+            dispatchQualityFrames();
+        }}
+
+        function dispatchQualityFrames() {{
+            for (const worker of qualityWorkers) {{
+                if (qualityQueue.length === 0) return;
+                if (!worker.busy) {{
+                    const frame = qualityQueue.pop();  // Newest first
+                    worker.busy = true;
+                    worker.postMessage(frame, [frame.bitmap]);
+                }}
+            }}
+        }}
+
+        function handleFrameQuality(result) {{
+            if (result.error) return;
+            const buffered = frameBuffer.find(frame => frame.id === result.id);
+            if (buffered) {{
+                buffered.quality = result;
+            }}
+            
+            // Results can arrive out of order from different workers
+            if (result.timestamp < lastQualityTimestamp) return;
+            lastQualityTimestamp = result.timestamp;
+            latestQuality = result;
+            
+            const badge = document.getElementById('qualityBadge');
+            const parts = [];
+            if (result.face !== null) {{
+                parts.push(result.face > 0 ? '👤 Face ✓' : '👤 No face');
+            }}
+            parts.push(`Sharp ${{Math.round(result.sharpness * 100)}}%`);
+            parts.push(`Light ${{Math.round(result.exposure * 100)}}%`);
+            badge.textContent = parts.join(' · ');
+            
+            badge.style.color = isFrameUsable(result) ? '#4ade80' : '#f59e0b';
+            badge.classList.add('show');
+        }}
+
+        function frameScore(quality) {{
+            const faceFactor = quality.face === 0 ? 0.25 : 1;
+            return (quality.sharpness * 0.5 + quality.exposure * 0.2 + quality.contrast * 0.3) * faceFactor;
+        }}
+
+        function isFrameUsable(quality) {{
+            return isSceneUsable(quality) && quality.sharpness >= 0.5;
+        }}
+
+        function isSceneUsable(quality) {{
+            return quality && quality.face !== 0 && quality.exposure >= 0.5;
+        }}
+
+        // Pick the sharpest, best-lit buffered frame; unscored frames only if nothing was scored
+        function pickBestFrame() {{
+            let best = null;
+            for (const frame of frameBuffer) {{
+                if (frame.quality && (!best || frameScore(frame.quality) > frameScore(best.quality))) {{
+                    best = frame;
+                }}
+            }}
+            return best || frameBuffer[frameBuffer.length - 1] || null;
+        }}
+
         // Optimize sender parameters based on network
         async function optimizeBitrate(targetBitrate) {{
             if (!peerConnection) return;
@@ -1137,6 +2482,195 @@ def main():
             }}
         }}
 
+        // Benchmark harness: compare encoder CPU and bitrate per quality level for the
+        // negotiated codec. Run runCodecBenchmark() from the console during a call.
+        async function sampleOutboundVideo() {{
+            const stats = await peerConnection.getStats();
+            let outbound = null;
+            let codec = null;
+            stats.forEach(report => {{
+                if (report.type === 'outbound-rtp' && report.kind === 'video') {{
+                    outbound = report;
+                }}
+            }});
+            if (outbound && outbound.codecId) {{
+                codec = stats.get(outbound.codecId);
+            }}
+            return {{ outbound, codec }};
+        }}
+
+        async function runCodecBenchmark(secondsPerLevel = 10) {{
+            const videoSender = peerConnection && peerConnection.getSenders().find(s => s.track && s.track.kind === 'video');
+            if (!videoSender) {{
+                console.warn('Start a call before running the codec benchmark');
+                return [];
+            }}
+            
+            const levels = [
+                {{ label: 'full', scaleResolutionDownBy: 1.0 }},
+                {{ label: 'half', scaleResolutionDownBy: 2.0 }},
+                {{ label: 'quarter', scaleResolutionDownBy: 4.0 }}
+            ];
+            const original = videoSender.getParameters();
+            const originalScale = original.encodings[0].scaleResolutionDownBy;
+            const results = [];
+            
+            for (const level of levels) {{
+                const parameters = videoSender.getParameters();
+                parameters.encodings[0].scaleResolutionDownBy = level.scaleResolutionDownBy;
+                await videoSender.setParameters(parameters);
+                
+                const before = await sampleOutboundVideo();
+                await new Promise(resolve => setTimeout(resolve, secondsPerLevel * 1000));
+                const after = await sampleOutboundVideo();
+                if (!before.outbound || !after.outbound) continue;
+                
+                const seconds = (after.outbound.timestamp - before.outbound.timestamp) / 1000;
+                const frames = after.outbound.framesEncoded - before.outbound.framesEncoded;
+                const encodeTime = (after.outbound.totalEncodeTime || 0) - (before.outbound.totalEncodeTime || 0);
+                results.push({{
+                    level: level.label,
+                    codec: after.codec ? after.codec.mimeType : 'unknown',
+                    encoder: after.outbound.encoderImplementation || 'unknown',
+                    resolution: `${{after.outbound.frameWidth}}x${{after.outbound.frameHeight}}`,
+                    fps: +(frames / seconds).toFixed(1),
+                    kbps: Math.round((after.outbound.bytesSent - before.outbound.bytesSent) * 8 / seconds / 1000),
+                    encodeMsPerFrame: frames > 0 ? +(encodeTime * 1000 / frames).toFixed(2) : null,
+                    limitation: after.outbound.qualityLimitationReason
+                }});
+            }}
+            
+            const restored = videoSender.getParameters();
+            restored.encodings[0].scaleResolutionDownBy = originalScale;
+            await videoSender.setParameters(restored);
+            
+            console.table(results);
+            return results;
+        }}
+        window.runCodecBenchmark = runCodecBenchmark;
+
+        // Agent console: move to another customer's room without releasing the camera,
+        // microphone, signaling socket, audio graph or frame-scoring workers
+        async function switchRoom(newRoomCode, newToken) {{
+            if (!isAgent || !newRoomCode || newRoomCode === roomCode) return;
+            const started = performance.now();
+            
+            if (isRecording) {{
+                await stopRecording();
+            }}
+            closePreview();
+            
+            // Tear down only what belongs to the previous customer
+            clearTimeout(iceRestartTimer);
+            clearTimeout(photoRequestTimer);
+            pendingPhotoId = null;
+            iceRestartTimer = null;
+            iceRestartAttempts = 0;
+            restartIceOnReconnect = false;
+            pendingSignaling = [];
+            if (controlChannel) controlChannel.close();
+            if (fileChannel) fileChannel.close();
+            controlChannel = null;
+            fileChannel = null;
+            incomingFile = null;
+            fileSendQueue = Promise.resolve();
+            if (peerConnection) {{
+                peerConnection.close();
+                peerConnection = null;
+            }}
+            remoteVideo.srcObject = null;
+            receivedDocumentUrls.forEach(url => URL.revokeObjectURL(url));
+            receivedDocumentUrls = [];
+            document.getElementById('receivedDocuments').replaceChildren();
+            frameBuffer.forEach(frame => frame.bitmap.close());
+            frameBuffer = [];
+            qualityQueue.forEach(frame => frame.bitmap.close());
+            qualityQueue = [];
+            latestQuality = null;
+            lastQualityTimestamp = 0;
+            document.getElementById('qualityBadge').classList.remove('show');
+            updateRemoteMediaState(false, false);
+            if (remoteVideoMode !== 'face') {{
+                updateDocumentModeButton('face');
+            }}
+            if (agentReviewing) {{
+                toggleReviewPause();
+            }}
+            
+            // Tell the previous customer first, or their page keeps restarting ICE into the old room
+            sendSignaling({{ type: 'session-ended', room: roomCode }});
+            sendSignaling({{ type: 'leave', room: roomCode }});
+            roomCode = newRoomCode;
+            reconnectToken = newToken;
+            sessionStorage.setItem('roomCode', roomCode);
+            sessionStorage.setItem('reconnectToken', reconnectToken);
+            sendSignaling({{
+                type: 'join',
+                room: roomCode,
+                role: 'agent',
+                token: reconnectToken,
+                resume: false,
+                encodings: ['json']
+            }});
+            document.getElementById('connectionState').textContent = 'Waiting...';
+            document.getElementById('connectionState').style.color = '#4ade80';
+            document.getElementById('connectionStatus').innerHTML = `✅ Room ${{roomCode}} - waiting for customer`;
+            
+            // Camera already running: go straight to a fresh peer connection
+            if (localStream) {{
+                await initWebRTC();
+            }}
+            console.log(`Switched to room ${{roomCode}} in ${{(performance.now() - started).toFixed(1)}} ms`);
+        }}
+
+        if (isAgent && typeof BroadcastChannel !== 'undefined') {{
+            new BroadcastChannel(`kyc-console-${{consoleToken}}`).onmessage = function(event) {{
+                if (event.data && event.data.type === 'switch-room') {{
+                    switchRoom(event.data.room, event.data.token);
+                }}
+            }};
+        }}
+
+        // Replace the signaling socket now instead of waiting out the reconnect backoff
+        function reopenSignaling() {{
+            if (ws) {{
+                ws.onopen = ws.onclose = ws.onerror = ws.onmessage = null;
+                ws.close();
+            }}
+            signalingRetries = 0;
+            connectSignaling();
+        }}
+
+        // Restart ICE as soon as the device switches networks (e.g. Wi-Fi to LTE) instead of
+        // waiting for consent checks to time out. navigator.connection fires 'change' for every
+        // downlink/RTT estimate update too, so only a new connection type counts as a switch.
+        let lastConnectionType = navigator.connection ? navigator.connection.type : undefined;
+        function handleNetworkChange(event) {{
+            if (navigator.onLine === false) return;
+            const type = navigator.connection ? navigator.connection.type : undefined;
+            const switched = event.type === 'online' || type !== lastConnectionType;
+            lastConnectionType = type;
+            if (!switched) {{
+                const state = peerConnection ? peerConnection.connectionState : null;
+                if (state === 'disconnected' || state === 'failed') {{
+                    scheduleIceRestart(0);
+                }}
+                return;
+            }}
+            if (!ws || !hasJoined) return;
+            // The old socket usually still reports OPEN until its TCP connection times out, so
+            // the restart would go nowhere: reopen first and restart ICE from ws.onopen
+            if (peerConnection && peerConnection.connectionState !== 'new') {{
+                iceRestartAttempts = 0;
+                restartIceOnReconnect = true;
+            }}
+            reopenSignaling();
+        }}
+        window.addEventListener('online', handleNetworkChange);
+        if (navigator.connection && navigator.connection.addEventListener) {{
+            navigator.connection.addEventListener('change', handleNetworkChange);
+        }}
+
         // Auto-reconnect on page refresh
         window.addEventListener('beforeunload', function() {{
             if (isRecording) {{
@@ -1145,6 +2679,9 @@ def main():
             if (peerConnection) {{
                 peerConnection.close();
             }}
+            if (recordingAudio) {{
+                recordingAudio.context.close();
+            }}
             if (ws) {{
                 ws.close();
             }}
@@ -1154,7 +2691,134 @@ def main():
     </script>
 </body>
 </html>
-        """, height=900)
+    """
+
+
+def main():
+    st.title("🎥 Video KYC Application")
+    
+    # Instructions
+    with st.expander("ℹ️ How to Use"):
+        st.markdown("""
+        **For Agents:**
+        1. Click "Start KYC Session" to create a room
+        2. Share the room code with customer
+        3. Click "Start Camera" when customer joins
+        4. Use "Capture KYC Photo" to take customer snapshots
+        5. Use "Start Recording" to record the entire call
+        
+        **For Customers:**
+        1. Enter the room code provided by agent
+        2. Click "Join Session"
+        3. Click "Start Camera" to begin KYC
+        
+        **Features:**
+        - Click on video to switch between large/small view
+        - Flip camera button cycles through all available cameras
+        - Agent can capture and save customer snapshots
+        - Agent can record the entire call with both video and audio
+        """)
+    
+    st.markdown("---")
+    
+    if not st.session_state.in_call:
+        # Main menu
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("👨‍💼 Agent Portal")
+            if st.button("🚀 Start KYC Session", type="primary", use_container_width=True):
+                room_code = generate_room_code()
+                st.session_state.room_code = room_code
+                st.session_state.reconnect_token = generate_reconnect_token(room_code)
+                st.session_state.console_room_code = room_code
+                st.session_state.console_token = st.session_state.reconnect_token
+                st.session_state.in_call = True
+                st.session_state.is_agent = True
+                open_room_lease()
+                st.rerun()
+        
+        with col2:
+            st.subheader("👤 Customer Portal")
+            with st.form("join_form"):
+                room_input = st.text_input("Enter Room Code", max_chars=4, placeholder="e.g., A1B2")
+                if st.form_submit_button("📞 Join Session", type="secondary", use_container_width=True):
+                    if room_input:
+                        st.session_state.room_code = room_input.upper()
+                        st.session_state.reconnect_token = generate_reconnect_token(room_input.upper())
+                        st.session_state.in_call = True
+                        st.session_state.is_agent = False
+                        st.rerun()
+    else:
+        # Video call interface
+        role = "Agent" if st.session_state.is_agent else "Customer"
+        st.success(f"✅ **Room: {st.session_state.room_code}** | You are: {role}")
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            if st.session_state.is_agent:
+                st.info(f"💡 Share this room code with customer: **{st.session_state.room_code}**")
+            else:
+                st.info(f"📱 Connected to KYC session: **{st.session_state.room_code}**")
+        with col2:
+            if st.session_state.is_agent and st.button("⏭️ Next Customer", use_container_width=True):
+                # New room for the next customer; the call page below stays mounted
+                room_code = generate_room_code()
+                st.session_state.room_code = room_code
+                st.session_state.reconnect_token = generate_reconnect_token(room_code)
+                reset_customer_state()
+                open_room_lease()
+                st.rerun()
+            if st.button("❌ End Session", type="primary", use_container_width=True):
+                close_room_lease()
+                st.session_state.in_call = False
+                st.session_state.room_code = ''
+                st.session_state.reconnect_token = ''
+                st.session_state.console_room_code = ''
+                st.session_state.console_token = ''
+                st.session_state.console_switched_room = ''
+                st.session_state.is_agent = False
+                reset_customer_state()
+                st.rerun()
+        
+        st.markdown("---")
+        
+        # Real-time video call interface. The agent console page only embeds the room it
+        # was opened with, so its HTML (and with it the camera, signaling socket and audio
+        # graph) survives reruns; later rooms are handed over by the switcher below.
+        page_room_code = st.session_state.console_room_code or st.session_state.room_code
+        page_token = st.session_state.console_token or st.session_state.reconnect_token
+        st.components.v1.html(call_page_html(page_room_code, page_token, st.session_state.is_agent), height=900)
+
+        # Tell the mounted agent console when the room changes. The channel is named after
+        # the console's token so other consoles open in the same browser ignore it.
+        if (st.session_state.is_agent and st.session_state.console_token
+                and st.session_state.room_code not in (page_room_code, st.session_state.console_switched_room)):
+            st.session_state.console_switched_room = st.session_state.room_code
+            st.components.v1.html(f"""
+<script>
+    new BroadcastChannel('kyc-console-{st.session_state.console_token}').postMessage({{
+        type: 'switch-room',
+        room: '{st.session_state.room_code}',
+        token: '{st.session_state.reconnect_token}'
+    }});
+</script>
+            """, height=0)
+
+        # Hand saved full-resolution photos to the backend (Agent only)
+        if st.session_state.is_agent:
+            uploaded_photos = st.file_uploader(
+                "📎 Attach saved KYC photos",
+                type=["jpg", "jpeg", "png"],
+                accept_multiple_files=True,
+                # Keyed by room so the previous customer's files are not re-attached
+                key=f"kyc_photos_{st.session_state.room_code}"
+            )
+            for photo in uploaded_photos or []:
+                if photo.file_id not in st.session_state.snapshot_file_ids:
+                    st.session_state.snapshot_file_ids.add(photo.file_id)
+                    st.session_state.snapshots.append(photo.getvalue())
+                    app_metrics().ingested_bytes.labels('snapshot').inc(photo.size)
 
         # Show captured snapshots (Agent only)
         if st.session_state.is_agent and st.session_state.snapshots:
@@ -1166,4 +2830,5 @@ def main():
                     st.image(snapshot, caption=f"Snapshot {idx + 1}", use_container_width=True)
 
 if __name__ == "__main__":
-    main()
+    with app_metrics().rerun_seconds.time():
+        main()